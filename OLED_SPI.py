@@ -2,12 +2,10 @@ from machine import Pin, SPI
 import framebuf
 import time
 from keyboardConfiguration import *
-import arial6
-import arial8
-import arial10
-import font10
-import font6
+import fonttable
 import writer
+import widgets
+from profiler import PROFILER, PROF_DISPLAY, PROF_SHOW, PROF_NAMES
 from random import randrange
 
 DC = 8
@@ -16,6 +14,33 @@ MOSI = 11
 SCK = 10
 CS = 9
 
+# init sequence, sent in a single command transaction
+INIT_CMDS = bytes([
+    0xae,        # turn off OLED display
+    0x00,        # set lower column address
+    0x10,        # set higher column address
+    0xb0,        # set page address
+    0xdc, 0x00,  # set display start line
+    0x81, 0x6f,  # contract control
+    0x21,        # Set Memory addressing mode (0x20/0x21)
+    0xa0,        # set segment remap
+    0xc0,        # Com scan direction
+    0xa4,        # Disable Entire Display On (0xA4/0xA5)
+    0xa6,        # normal / reverse
+    0xa8, 0x3f,  # multiplex ratio, duty = 1/64
+    0xd3, 0x60,  # set display offset
+    0xd5, 0x41,  # set osc division
+    0xd9, 0x22,  # set pre-charge period
+    0xdb, 0x35,  # set vcomh
+    0xad, 0x8a,  # set charge pump enable, Set DC-DC enable
+    0xaf,        # turn on OLED display
+])
+
+
+# stats page, x and title of the columns
+STATS_COLUMNS = ((0, "us"), (36, "count"), (72, "avg"), (100, "max"))
+STATS_LINE_HEIGHT = 6
+
 
 def pict_to_fbuff(path, x, y):
     with open(path, 'rb') as f:
@@ -31,7 +56,10 @@ class OLED_1inch3(framebuf.FrameBuffer):
         self.width = 128
         self.height = 64
 
+        # a redraw asked by the driver itself (screensaver left...)
         self.need_refresh_flag = False
+        # generation of the keyboard UiState last drawn, see uistate.py
+        self.drawn_generation = -1
 
         self.screensaver_active = False
         self.screesaver_pixels = [[0]*2]*20
@@ -47,6 +75,21 @@ class OLED_1inch3(framebuf.FrameBuffer):
         self.dc = Pin(DC, Pin.OUT)
         self.dc(1)
         self.buffer = bytearray(self.height * self.width // 8)
+        buffer_mv = memoryview(self.buffer)
+        # views built once, slicing a memoryview allocates: one per display
+        # column of 16 pages, and the first n bytes of span_buf in
+        # span_mvs[n] for the part of a column that changed
+        self.column_mvs = [buffer_mv[start:start+16]
+                           for start in range(0, len(self.buffer), 16)]
+        self.span_buf = bytearray(16)
+        span_mv = memoryview(self.span_buf)
+        self.span_mvs = [span_mv[:n] for n in range(0, 17)]
+        # copy of what the display currently shows, used to only flush changes
+        self.sent_buffer = bytearray(self.height * self.width // 8)
+        # preallocated buffers for single byte writes and page/column address
+        self.byte_buf = bytearray(1)
+        self.address_cmds = bytearray(3)
+        self.full_refresh_flag = True
         super().__init__(self.buffer, self.width, self.height, framebuf.MONO_HMSB)
         self.init_display()
 
@@ -55,11 +98,21 @@ class OLED_1inch3(framebuf.FrameBuffer):
 
         self.keyboard_config = keyboard_config
 
-        self.font_writer_arial6 = writer.Writer(self, arial6)
-        self.font_writer_arial8 = writer.Writer(self, arial8)
-        self.font_writer_arial10 = writer.Writer(self, arial10)
-        self.font_writer_font10 = writer.Writer(self, font10)
-        self.font_writer_font6 = writer.Writer(self, font6)
+        self.layouts = widgets.create_layouts()
+        # layout currently on screen, None when something else was drawn
+        self.current_layout = None
+
+        # fonts are built from the font_to_py modules by host/build_fonts.py
+        self.font_writer_arial6 = writer.Writer(
+            self, fonttable.load('fonts/arial6.fnt'))
+        self.font_writer_arial8 = writer.Writer(
+            self, fonttable.load('fonts/arial8.fnt'))
+        self.font_writer_arial10 = writer.Writer(
+            self, fonttable.load('fonts/arial10.fnt'))
+        self.font_writer_font10 = writer.Writer(
+            self, fonttable.load('fonts/font10.fnt'))
+        self.font_writer_font6 = writer.Writer(
+            self, fonttable.load('fonts/font6.fnt'))
 
         self.fbuf_play = pict_to_fbuff('play.pbm', 9, 9)
         self.fbuf_pause = pict_to_fbuff('pause.pbm', 9, 9)
@@ -96,22 +149,34 @@ class OLED_1inch3(framebuf.FrameBuffer):
                                     self.fbuf_inv_arp_rand, self.fbuf_inv_arp_order, self.fbuf_inv_arp_upx2, self.fbuf_inv_arp_dwnx2]
 
     def write_cmd(self, cmd):
+        self.byte_buf[0] = cmd
+        self.write_cmds(self.byte_buf)
+
+    def write_cmds(self, cmds):
         self.cs(1)
         self.dc(0)
         self.cs(0)
-        self.spi.write(bytearray([cmd]))
+        self.spi.write(cmds)
         self.cs(1)
 
     def write_data(self, buf):
+        self.byte_buf[0] = buf
+        self.write_data_buf(self.byte_buf)
+
+    def write_data_buf(self, buf):
         self.cs(1)
         self.dc(1)
         self.cs(0)
-        self.spi.write(bytearray([buf]))
+        self.spi.write(buf)
         self.cs(1)
 
     def need_screen_refresh(self):
         self.need_refresh_flag = True
 
+    def is_refresh_needed(self):
+        return self.need_refresh_flag or \
+            self.drawn_generation != self.keyboard_config.ui_states.generation
+
     def init_display(self):
         """Initialize dispaly"""
         self.rst(1)
@@ -120,57 +185,59 @@ class OLED_1inch3(framebuf.FrameBuffer):
         time.sleep(0.001)
         self.rst(1)
 
-        self.write_cmd(0xAE)  # turn off OLED display
-
-        self.write_cmd(0x00)  # set lower column address
-        self.write_cmd(0x10)  # set higher column address
-
-        self.write_cmd(0xB0)  # set page address
-
-        self.write_cmd(0xdc)  # et display start line
-        self.write_cmd(0x00)
-        self.write_cmd(0x81)  # contract control
-        self.write_cmd(0x6f)  # 128
-        self.write_cmd(0x21)    # Set Memory addressing mode (0x20/0x21) #
-
-        self.write_cmd(0xa0)  # set segment remap
-        self.write_cmd(0xc0)  # Com scan direction
-        self.write_cmd(0xa4)  # Disable Entire Display On (0xA4/0xA5)
-
-        self.write_cmd(0xa6)  # normal / reverse
-        self.write_cmd(0xa8)  # multiplex ratio
-        self.write_cmd(0x3f)  # duty = 1/64
-
-        self.write_cmd(0xd3)  # set display offset
-        self.write_cmd(0x60)
-
-        self.write_cmd(0xd5)  # set osc division
-        self.write_cmd(0x41)
-
-        self.write_cmd(0xd9)  # set pre-charge period
-        self.write_cmd(0x22)
+        self.write_cmds(INIT_CMDS)
 
-        self.write_cmd(0xdb)  # set vcomh
-        self.write_cmd(0x35)
-
-        self.write_cmd(0xad)  # set charge pump enable
-        self.write_cmd(0x8a)  # Set DC-DC enable (a=0:disable; a=1:enable)
-        self.write_cmd(0XAF)
+        # display RAM content is unknown after a reset
+        self.full_refresh_flag = True
 
     def show(self):
-        self.write_cmd(0xb0)
+        # each framebuffer row of 16 bytes is one display column of 16 pages,
+        # only the pages that changed since the last flush are sent
+        buf = self.buffer
+        sent = self.sent_buffer
+        full = self.full_refresh_flag
+        if not full and buf == sent:
+            return
+        profiling = PROFILER.enabled
+        if profiling:
+            start_us = time.ticks_us()
+        address_cmds = self.address_cmds
         for page in range(0, 64):
-            self.column = 63 - page
-            self.write_cmd(0x00 + (self.column & 0x0f))
-            self.write_cmd(0x10 + (self.column >> 4))
-            for num in range(0, 16):
-                self.write_data(self.buffer[page*16+num])
+            start = page*16
+            end = start+16
+            if not full:
+                # compared in place, a slice would allocate
+                while start < end and buf[start] == sent[start]:
+                    start += 1
+                if start == end:
+                    continue
+                while buf[end-1] == sent[end-1]:
+                    end -= 1
+            column = 63 - page
+            address_cmds[0] = 0xb0 + (start - page*16)
+            address_cmds[1] = 0x00 + (column & 0x0f)
+            address_cmds[2] = 0x10 + (column >> 4)
+            self.write_cmds(address_cmds)
+            if end - start == 16:
+                self.write_data_buf(self.column_mvs[page])
+                for i in range(start, end):
+                    sent[i] = buf[i]
+            else:
+                span = self.span_buf
+                for i in range(start, end):
+                    span[i - start] = buf[i]
+                    sent[i] = buf[i]
+                self.write_data_buf(self.span_mvs[end - start])
+        self.full_refresh_flag = False
+        if profiling:
+            PROFILER.record(PROF_SHOW, start_us)
 
     def is_screensaver(self):
         return self.screensaver_active
 
     def set_screensaver_mode(self):
         self.screensaver_active = True
+        self.current_layout = None
         for i in range(0, len(self.screesaver_pixels)):
             self.screesaver_pixels[i] = [randrange(0, 128), randrange(0, 64)]
 
@@ -198,17 +265,20 @@ class OLED_1inch3(framebuf.FrameBuffer):
             f.readline()  # Dimensions
             data = bytearray(f.read())
         lxb_fbuf = framebuf.FrameBuffer(data, 64, 64, framebuf.MONO_HLSB)
+        self.current_layout = None
 
         self.blit(lxb_fbuf, 32, 0)
         self.show()
 
     def display_programming_mode(self):
+        self.current_layout = None
         self.fill(self.black)  # smallest
         self.font_writer_arial10.text("Programming mode", 0, 0)
         self.show()
         time.sleep(1)
 
     def display_demo(self):
+        self.current_layout = None
         self.fill(self.black)  # smallest
         self.font_writer_arial10.text("Hey", 0, 0)
         self.text("hey", 0, 64-8)
@@ -227,232 +297,48 @@ class OLED_1inch3(framebuf.FrameBuffer):
         self.show()
         time.sleep(1)
 
+    def display_stats(self):
+        """Profiler stats, count, average and max in us"""
+        self.current_layout = None
+        self.fill(self.black)
+        font_writer = self.font_writer_arial6
+        for x, title in STATS_COLUMNS:
+            font_writer.text(title, x, 0)
+        for section in range(0, len(PROF_NAMES)):
+            y = STATS_LINE_HEIGHT*(section + 1)
+            font_writer.text(PROF_NAMES[section], 0, y)
+            font_writer.text(str(PROFILER.counts[section]), STATS_COLUMNS[1][0], y, cache=False)
+            font_writer.text(str(PROFILER.average_us(section)), STATS_COLUMNS[2][0], y, cache=False)
+            font_writer.text(str(PROFILER.maxs[section]), STATS_COLUMNS[3][0], y, cache=False)
+
     def display(self):
+        profiling = PROFILER.enabled
+        if profiling:
+            start_us = time.ticks_us()
+        # cleared before drawing, so a request coming meanwhile is kept
+        self.need_refresh_flag = False
+        ui_states = self.keyboard_config.ui_states
+        generation = ui_states.acquire()
+        ui_state = ui_states.state(generation)
         if self.screensaver_active == False:
             # self.display_demo()
 
-            self.fill(self.black)
-
-            if self.keyboard_config.mode == Mode.MULTISEQUENCER:
-                self.font_writer_arial10.text("Multi-seq", 17, 4)
+            if ui_state.show_stats:
+                self.display_stats()
             else:
-                self.font_writer_font10.text(
-                    modeToStr(self.keyboard_config.mode), 17, 1)
-            bpm_txt = str(self.keyboard_config.rate)+"bpm"
-            self.font_writer_arial10.text(bpm_txt, (128-(7*len(bpm_txt))), 3)
-
-            self.rect(0, 0, 15, 15, self.white)
-            correct_play_mode_buff = self.fbufs_play_mode[self.keyboard_config.play_mode]
-            self.blit(correct_play_mode_buff, 3, 3)
-
-            self.line(0, 15, 128, 15, self.white)
-
-            if self.keyboard_config.mode == Mode.SEQUENCER:
-                # todo
-                self.line(84, 15, 84, 50, self.white)
-                self.line(84, 40, 127, 40, self.white)
-                if self.keyboard_config.transpose_keyboardplay_mode == True:
-                    self.fill_rect(86, 17, 40, 10, self.white)
-                    self.font_writer_arial10.text("transpo.", 87, 17, True)
-                    self.font_writer_arial10.text("kb play", 87, 29)
-
-                else:
-                    self.fill_rect(86, 29, 40, 10, self.white)
-                    self.font_writer_arial10.text("transpo.", 87, 17)
-                    self.font_writer_arial10.text("kb play", 87, 29, True)
-                self.font_writer_arial10.text(
-                    "key:"+midi_to_key(self.keyboard_config.transpose_key), 87, 41)
-                # true = transpose, false = keyboardplay
-                # self.transpose_key = 60 # 60 = C4
-
-            if self.keyboard_config.mode == Mode.SEQUENCER or self.keyboard_config.mode == Mode.ARPEGIATOR or self.keyboard_config.mode == Mode.MULTISEQUENCER:
-                # gate lenght picto
-                start_line = 62
-                gate_up = 3
-                gate_low = 13
-                gate_lenght = self.keyboard_config.player_note_timer_gate_pertenth
-                gate_off = 10 - gate_lenght
-
-                if self.keyboard_config.changing_gate_length:
-                    self.fill_rect(start_line-1, 0, 23, 15, self.white)
-                    self.line(start_line, gate_low, start_line +
-                              2, gate_low, self.black)
-                    self.line(start_line+2, gate_low,
-                              start_line+2, gate_up, self.black)
-                    self.line(start_line+2, gate_up, start_line +
-                              2*gate_lenght, gate_up, self.black)
-                    self.line(start_line+2*gate_lenght, gate_up,
-                              start_line+2*gate_lenght, gate_low, self.black)
-                    self.line(start_line+2*gate_lenght, 13, start_line +
-                              2*gate_lenght+2*(gate_off), 13, self.black)
-
-                else:
-                    self.line(start_line, gate_low, start_line +
-                              2, gate_low, self.white)
-                    self.line(start_line+2, gate_low,
-                              start_line+2, gate_up, self.white)
-                    self.line(start_line+2, gate_up, start_line +
-                              2*gate_lenght, gate_up, self.white)
-                    self.line(start_line+2*gate_lenght, gate_up,
-                              start_line+2*gate_lenght, gate_low, self.white)
-                    self.line(start_line+2*gate_lenght, 13, start_line +
-                              2*gate_lenght+2*(gate_off), 13, self.white)
-
-                # bottom block key and Tdiv
-                self.fill_rect(0, 50, 128, 64, self.white)
-                key_str = "Key:C"+str(self.keyboard_config.octave_offset+4)
-                self.font_writer_arial10.text(key_str, 2, 53, True)
-                # TODO
-                time_div_x = 39
-                time_div_y = 51
-
-                if self.keyboard_config.mode == Mode.MULTISEQUENCER:
-                    time_div = self.keyboard_config.multi_sequence_time_div[
-                        self.keyboard_config.multi_sequence_highlighted]
-                else:
-                    time_div = self.keyboard_config.time_div
-
-                if self.keyboard_config.change_time_div == True:
-                    self.fill_rect(time_div_x, time_div_y, 76, 12, self.black)
-                    time_div_str = "TimeDiv : " + \
-                        timeDivToStr(self.keyboard_config.load_time_div)
-                    self.font_writer_arial10.text(
-                        time_div_str, time_div_x+2, time_div_y+2)
-                else:
-                    time_div_str = "TimeDiv : "+timeDivToStr(time_div)
-                    self.font_writer_arial10.text(
-                        time_div_str, time_div_x+2, time_div_y+2, True)
-
-        if self.keyboard_config.mode == Mode.BASIC:
-            key_str = "Key : C"+str(self.keyboard_config.octave_offset+4)
-            self.font_writer_font6.text(key_str, 5, 22)
-
-            time_div_x = 3
-            time_div_y = 42
-            if self.keyboard_config.change_time_div == True:
-                self.fill_rect(time_div_x, time_div_y, 101, 16, self.white)
-                time_div_str = "TimeDiv : " + \
-                    timeDivToStr(self.keyboard_config.load_time_div)
-                self.font_writer_font6.text(
-                    time_div_str, time_div_x+2, time_div_y+2, True)
-            else:
-                time_div_str = "TimeDiv : " + \
-                    timeDivToStr(self.keyboard_config.time_div)
-                self.font_writer_font6.text(
-                    time_div_str, time_div_x+2, time_div_y+2, False)
-
-            midi_ch_x = 96
-            midi_ch_y = 16
-            if self.keyboard_config.midi_change_channel == True:
-                self.rect(midi_ch_x, midi_ch_y, 31, 12, self.white)
-                midi_channel_txt = 'Ch {:02d}'.format(
-                    self.keyboard_config.midi_change_channel_channel).replace("0", "_")
-                self.font_writer_arial10.text(
-                    midi_channel_txt, midi_ch_x+2, midi_ch_y+2)
-                self.rect(midi_ch_x, midi_ch_y, 31, 12, self.white)
-            else:
-                self.fill_rect(midi_ch_x, midi_ch_y, 31, 12, self.white)
-                midi_channel_txt = 'Ch {:02d}'.format(
-                    self.keyboard_config.midi_channel)
-                self.font_writer_arial10.text(
-                    midi_channel_txt, midi_ch_x+2, midi_ch_y+2, True)
-
-        elif self.keyboard_config.mode == Mode.SEQUENCER:
-            seq_n_x = 3
-            seq_n_y = 17
-            if self.keyboard_config.loading_seq:
-                seq_number_str = 'Seq n  {:02d}'.format(
-                    self.keyboard_config.loading_seq_number).replace("0", "_")
-                self.fill_rect(seq_n_x, seq_n_y, 66, 16, self.white)
-                self.font_writer_font6.text(
-                    seq_number_str, seq_n_x+2, seq_n_y+2, True)
-                self.font_writer_arial10.text("o", seq_n_x+38, seq_n_y, True)
-            else:
-                seq_number_str = 'Seq n  {:02d}'.format(
-                    self.keyboard_config.seq_number)
-                self.font_writer_font6.text(
-                    seq_number_str, seq_n_x+2, seq_n_y+2)
-                self.font_writer_arial10.text("o", seq_n_x+38, seq_n_y)
-
-            self.font_writer_font6.text("{:03d} steps".format(
-                self.keyboard_config.seq_len), seq_n_x+2, seq_n_y+18)
-
-        elif self.keyboard_config.mode == Mode.ARPEGIATOR:
-
-            for i in range(0, 8):
-                if self.keyboard_config.arp_mode == i:
-                    self.fill_rect(0+i*16, 34, 16, 16, self.white)
-                    self.blit(self.fbufs_inv_arp_modes[i], 0+i*16, 34)
-                else:
-                    self.blit(self.fbufs_arp_modes[i], 0+i*16, 34)
-                    self.rect(0+i*16, 34, 16, 16, self.white)
-
-            if self.keyboard_config.hold:
-                time_div_str = "H"
-                self.rect(114, 51, 12, 12, self.black)
-                self.text(time_div_str, 116, 53, self.black)
-            else:
-                time_div_str = "H"
-                self.fill_rect(114, 51, 12, 12, self.black)
-                self.text(time_div_str, 116, 53, self.white)
-
-        elif self.keyboard_config.mode == Mode.MULTISEQUENCER:
-
-            # self.multi_sequence_index
-            # self.multi_sequence_highlighted
-            # self.loading_multi_seq
-            # self.loading_multi_seq_number
-
-            for y in range(0, 2):
-                for x in range(0, 8):
-                    index = 8*y + x
-
-                    if index == self.keyboard_config.multi_sequence_highlighted:
-                        self.fill_rect(0+x*16, 17+16*y, 16, 16, self.white)
-                        self.rect(0+x*16, 17+16*y, 16, 16, self.black)
-                        if self.keyboard_config.loading_multi_seq == True:
-                            if self.keyboard_config.loading_multi_seq_number == -1:
-                                index_str = "__"
-                            elif self.keyboard_config.loading_multi_seq_number == 0:
-                                index_str = "_0"
-                            else:
-                                index_str = '{:02d}'.format(
-                                    self.keyboard_config.loading_multi_seq_number).replace("0", "_")
-                            self.font_writer_arial8.text(
-                                index_str, 4+x*16, 23+16*y, True)
-                        else:
-                            if self.keyboard_config.multi_sequence_index[index] == -1:
-                                index_str = '{:02d}'.format(index+1)
-                                self.font_writer_arial8.text(
-                                    index_str, 2+x*16, 19+16*y, True)
-                            else:
-                                index_str = '{:02d}'.format(
-                                    self.keyboard_config.multi_sequence_index[index])
-                                self.font_writer_arial10.text(
-                                    index_str, 2+x*16, 21+16*y, True)
-                    else:
-                        self.rect(0+x*16, 17+16*y, 16, 16, self.white)
-
-                        if self.keyboard_config.multi_sequence_index[index] == -1:
-                            index_str = '{:02d}'.format(index+1)
-                            self.font_writer_arial8.text(
-                                index_str, 2+x*16, 19+16*y)
-                        else:
-                            index_str = '{:02d}'.format(
-                                self.keyboard_config.multi_sequence_index[index])
-                            self.font_writer_arial10.text(
-                                index_str, 2+x*16, 21+16*y)
-
-                    if index == self.keyboard_config.keyboard_play_index:
-                        if index == self.keyboard_config.multi_sequence_highlighted:
-                            self.font_writer_arial6.text(
-                                "K", 11+x*16, 27+16*y, True)
-                        else:
-                            self.font_writer_arial6.text(
-                                "K", 11+x*16, 27+16*y, False)
+                # a mode change draws the whole layout, otherwise only the
+                # widgets whose configuration changed are redrawn
+                layout = self.layouts[ui_state.mode]
+                full = layout is not self.current_layout
+                self.current_layout = layout
+                layout.render(self, ui_state, full)
+
         self.show()
 
-        self.need_refresh_flag = False
+        # a generation published meanwhile is drawn on the next pass
+        self.drawn_generation = generation
+        if profiling:
+            PROFILER.record(PROF_DISPLAY, start_us)
 
         """
         print("*-"*20)
@@ -461,7 +347,7 @@ class OLED_1inch3(framebuf.FrameBuffer):
         print("Rate :",self.keyboard_config.rate,"bpm")#ok
         print("First Key : C"+str(self.keyboard_config.octave_offset+4))#ok
         print("Play/pause :"+playModeToStr(self.keyboard_config.play_mode))#ok
-        print("Sequencer len :", self.keyboard_config.seq_len)
+        print("Sequencer len :", self.keyboard_config.seq_notes.length)
         print("Sequencer number :", self.keyboard_config.seq_number)
         print("Loading sequencer number :", self.keyboard_config.loading_seq_number)
         print("Hold : ", self.keyboard_config.hold)#ok
@@ -0,0 +1,109 @@
+# Playback engine on core 1.
+# By default the ticks (sequencer, arpeggiator, multi sequencer, midi clock)
+# are run by a soft timer on core 0, which has to share the core with the
+# key scan, the pots and the display. With ENGINE_ON_CORE1 they run on core
+# 1 instead, in a loop waiting for the deadline of the next tick event, and
+# the display is drawn by the main loop on core 0 between two key scans.
+#
+# The cores only talk through single producer single consumer rings:
+# - the midi rings of midi.py, the context of a message being the core
+#   sending it (CONTEXT_MAIN is core 0, CONTEXT_TIMER core 1)
+# - the commands of the main loop to the engine: wake it (tempo changed,
+#   midi messages queued), restart the ticks, stop it
+# The tick state (next_tick_us, tick_frac, the tick counter) is only
+# written by the engine once it runs, the main loop asks with a command.
+# The configuration read by the ticks and rebuilt by the main loop (arp
+# notes, active multi sequencer channels and their timing cache, loaded
+# sequences) is built aside and replaced with a single assignment, never
+# changed in place, and the ticks read such a reference once.
+# Core 1 never writes the flash: an error of the engine stops it and is
+# raised again in the main loop by check(). A flash write of core 0 (a
+# sequence saved) still pauses core 1 while it lasts.
+import time
+import _thread
+from midi import MessageRing
+from profiler import PROFILER, PROF_TIMER
+
+ENGINE_ON_CORE1 = False
+
+# longest sleep of the engine before looking at its commands
+ENGINE_POLL_US = 100
+
+COMMAND_WAKE = 1
+COMMAND_RESTART = 2
+COMMAND_STOP = 3
+
+
+class Engine:
+    def __init__(self, keyboard_config, commands_log2=4):
+        self.keyboard_config = keyboard_config
+        self.commands = MessageRing(commands_log2, 1)
+        self.running = False
+        self.error = None
+        keyboard_config.set_engine(self)
+
+    # called from core 0
+    def start(self):
+        # running before the thread starts, for a stop() coming first
+        self.running = True
+        _thread.start_new_thread(self.run, ())
+
+    def command(self, command):
+        offset = self.commands.reserve()
+        if offset < 0:
+            return False
+        self.commands.data[offset] = command
+        self.commands.commit()
+        return True
+
+    def wake(self):
+        self.command(COMMAND_WAKE)
+
+    def restart(self):
+        self.command(COMMAND_RESTART)
+
+    def stop(self):
+        """Wait for the engine to leave its loop, after the ticks running"""
+        while self.running and not self.command(COMMAND_STOP):
+            time.sleep_ms(1)
+        while self.running:
+            time.sleep_ms(1)
+
+    def check(self):
+        """Raise the error that stopped the engine, from the main loop"""
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    # core 1
+    def run(self):
+        keyboard_config = self.keyboard_config
+        commands = self.commands
+        deadline_us = time.ticks_us()
+        woken = True
+        while True:
+            while commands.any():
+                command = commands.status()
+                commands.pop_view()
+                if command == COMMAND_STOP:
+                    self.running = False
+                    return
+                if command == COMMAND_RESTART:
+                    keyboard_config._reset_ticks()
+                woken = True
+            now = time.ticks_us()
+            delay = time.ticks_diff(deadline_us, now)
+            if delay > 0 and not woken:
+                if delay > ENGINE_POLL_US:
+                    delay = ENGINE_POLL_US
+                time.sleep_us(delay)
+                continue
+            woken = False
+            delay = keyboard_config.play_ticks(now)
+            if delay < 0:
+                break
+            deadline_us = time.ticks_add(now, delay)
+            if PROFILER.enabled:
+                PROFILER.record(PROF_TIMER, now)
+        self.running = False
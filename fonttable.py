@@ -0,0 +1,71 @@
+from array import array
+
+# Flat glyph table loaded from a font blob built by host/build_fonts.py.
+#
+# Blob layout, little endian:
+#   0  b'MTF' + version
+#   4  height, max width, flags (bit 0 hmap, bit 1 reverse), min char, max char
+#   9  width of each glyph, 1 byte each, the default glyph comes last
+#   .. offset of each glyph in the glyph data, 2 bytes each, plus the end
+#   .. glyph data
+MAGIC = b'MTF'
+VERSION = 1
+HEADER_SIZE = 9
+
+FLAG_HMAP = 0x01
+FLAG_REVERSE = 0x02
+
+
+class FontTable:
+    """Font with the same interface as the font_to_py modules"""
+
+    def __init__(self, blob):
+        mv = memoryview(blob)
+        if bytes(mv[0:3]) != MAGIC or blob[3] != VERSION:
+            raise ValueError('Not a font table blob.')
+        self._height = blob[4]
+        self._max_width = blob[5]
+        self._flags = blob[6]
+        self._min_ch = blob[7]
+        self._max_ch = blob[8]
+        # the default glyph is stored after the last char
+        self.default_index = self._max_ch - self._min_ch + 1
+        count = self.default_index + 1
+
+        self.widths = mv[HEADER_SIZE:HEADER_SIZE+count]
+        offsets_start = HEADER_SIZE + count
+        self.offsets = array('H', [0]*(count+1))
+        for i in range(0, count+1):
+            self.offsets[i] = blob[offsets_start+2*i] | (
+                blob[offsets_start+2*i+1] << 8)
+        self.glyphs = mv[offsets_start + 2*(count+1):]
+
+    def height(self):
+        return self._height
+
+    def max_width(self):
+        return self._max_width
+
+    def hmap(self):
+        return self._flags & FLAG_HMAP != 0
+
+    def reverse(self):
+        return self._flags & FLAG_REVERSE != 0
+
+    def min_ch(self):
+        return self._min_ch
+
+    def max_ch(self):
+        return self._max_ch
+
+    def get_ch(self, ch):
+        index = ord(ch) - self._min_ch
+        if index < 0 or index >= self.default_index:
+            index = self.default_index
+        offsets = self.offsets
+        return self.glyphs[offsets[index]:offsets[index+1]], self._height, self.widths[index]
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return FontTable(f.read())
@@ -0,0 +1,36 @@
+# Compare the per char lookup cost of the font_to_py modules and of the
+# font tables loaded by fonttable.py.
+# Run from anywhere with: python host/bench_fonts.py
+import os
+import timeit
+
+import hostenv
+hostenv.install()
+
+import fonttable  # noqa: E402
+from build_fonts import FONTS  # noqa: E402
+
+TEXT = "TimeDiv : 1/16 transpo. kb play Key:C4 Ch 01 120bpm"
+REPEAT = 2000
+
+
+def per_char_ns(get_ch):
+    def run():
+        for char in TEXT:
+            get_ch(char)
+    seconds = min(timeit.repeat(run, number=REPEAT, repeat=5))
+    return seconds / (REPEAT * len(TEXT)) * 1e9
+
+
+def main():
+    print('{:<8} {:>10} {:>10} {:>8}'.format('font', 'module ns', 'table ns', 'speedup'))
+    for name in FONTS:
+        module = __import__(name)
+        table = fonttable.load(os.path.join('fonts', name + '.fnt'))
+        before = per_char_ns(module.get_ch)
+        after = per_char_ns(table.get_ch)
+        print('{:<8} {:>10.0f} {:>10.0f} {:>7.2f}x'.format(name, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
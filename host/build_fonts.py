@@ -0,0 +1,87 @@
+# Build the font table blobs loaded by fonttable.py from the font_to_py
+# modules of the repository.
+# Run from anywhere with: python host/build_fonts.py [--py]
+#   --py  also write <font>_table.py modules holding the blob as a bytes
+#         literal, to be frozen in the firmware with FontTable(<font>_table.TABLE)
+import os
+import struct
+import sys
+
+import hostenv
+hostenv.install()
+
+import fonttable  # noqa: E402
+
+FONTS = ('arial6', 'arial8', 'arial10', 'font6', 'font10')
+OUTPUT_DIR = os.path.join(hostenv.REPO_DIR, 'fonts')
+
+
+def char_range(font):
+    # older font_to_py modules do not export their range, they cover 32-126
+    if hasattr(font, 'min_ch'):
+        return font.min_ch(), font.max_ch()
+    return 32, 126
+
+
+def build_blob(font):
+    min_ch, max_ch = char_range(font)
+    chars = [chr(c) for c in range(min_ch, max_ch + 1)]
+    # a char out of range gives the default glyph of the font
+    chars.append(chr(min_ch - 1))
+
+    widths = bytearray()
+    offsets = [0]
+    data = bytearray()
+    for char in chars:
+        glyph, height, width = font.get_ch(char)
+        widths.append(width)
+        data.extend(glyph)
+        offsets.append(len(data))
+
+    flags = 0
+    if font.hmap():
+        flags |= fonttable.FLAG_HMAP
+    if font.reverse():
+        flags |= fonttable.FLAG_REVERSE
+    header = fonttable.MAGIC + bytes([fonttable.VERSION, font.height(), font.max_width(),
+                                      flags, min_ch, max_ch])
+    return header + bytes(widths) + struct.pack('<{}H'.format(len(offsets)), *offsets) + bytes(data)
+
+
+def check_blob(font, blob):
+    table = fonttable.FontTable(blob)
+    for c in range(0, 256):
+        expected = font.get_ch(chr(c))
+        glyph, height, width = table.get_ch(chr(c))
+        if (bytes(expected[0]), expected[1], expected[2]) != (bytes(glyph), height, width):
+            raise ValueError('glyph mismatch for {} in {}'.format(c, font.__name__))
+
+
+def write_py(name, blob):
+    path = os.path.join(OUTPUT_DIR, name + '_table.py')
+    with open(path, 'w') as f:
+        f.write('# Code generated by host/build_fonts.py from {}.py\n'.format(name))
+        f.write('TABLE =\\\n')
+        for i in range(0, len(blob), 16):
+            line = ''.join('\\x{:02x}'.format(b) for b in blob[i:i + 16])
+            f.write("    b'{}'{}\n".format(line, '\\' if i + 16 < len(blob) else ''))
+    return path
+
+
+def main():
+    write_modules = '--py' in sys.argv[1:]
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    for name in FONTS:
+        font = __import__(name)
+        blob = build_blob(font)
+        check_blob(font, blob)
+        path = os.path.join(OUTPUT_DIR, name + '.fnt')
+        with open(path, 'wb') as f:
+            f.write(blob)
+        print('{:<8} {:>5} bytes -> {}'.format(name, len(blob), os.path.relpath(path, hostenv.REPO_DIR)))
+        if write_modules:
+            print('{:<8} {:>11} -> {}'.format(name, '', os.path.relpath(write_py(name, blob), hostenv.REPO_DIR)))
+
+
+if __name__ == '__main__':
+    main()
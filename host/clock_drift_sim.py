@@ -0,0 +1,133 @@
+# Measure the drift and jitter of the MIDI clock generated by the tick timer
+# of KeyboardConfiguration over a long run.
+# The timer runs on a virtual time line and fires late by a random latency
+# (plus now and then a long stall, like a garbage collection or a flash
+# write). The time of every clock sent is compared with the ideal clock of
+# the tempo: the drift is the deviation at the end of the run, the jitter the
+# spread of the deviations. A run also changes the tempo in the middle to
+# check the clock keeps its phase. The drift a whole microseconds tick
+# period would have accumulated is printed for comparison.
+# Run from anywhere with: python host/clock_drift_sim.py [beats]
+import random
+import sys
+import time
+
+import hostenv
+hostenv.install()
+
+from midi import CLOCK  # noqa: E402
+from keyboardConfiguration import KeyboardConfiguration, TICK_NUMERATOR  # noqa: E402
+
+BPMS = (30, 60, 97, 120, 173, 240)
+LATENCY_US = 200       # random latency of each timer callback
+STALL_US = 3000        # a stall now and then
+STALL_PROBABILITY = 0.001
+
+
+class VirtualTime:
+    def __init__(self):
+        self.now_us = 0
+
+    def ticks_us(self):
+        return self.now_us & (hostenv.TICKS_PERIOD - 1)
+
+
+def run(bpm, beats, new_bpm=None, seed=1):
+    """Times of the clocks sent and of the tempo change, if any"""
+    rng = random.Random(seed)
+    clock = VirtualTime()
+    time.ticks_us = clock.ticks_us
+    keyboard_config = KeyboardConfiguration()
+    keyboard_config.deinit_timer()
+    keyboard_config.rate = bpm
+    keyboard_config.update_timer_frequency()
+
+    clocks = []
+    midi = keyboard_config.midi
+    send_realtime = midi.send_realtime
+
+    def recorded_send_realtime(status):
+        if status == CLOCK:
+            clocks.append(clock.now_us)
+        send_realtime(status)
+    midi.send_realtime = recorded_send_realtime
+
+    timer = keyboard_config.play_note_timer
+    change_us = None
+    fire_us = timer.period_us
+    while len(clocks) < beats*24:
+        latency = rng.randrange(LATENCY_US)
+        if rng.random() < STALL_PROBABILITY:
+            latency += STALL_US
+        clock.now_us = fire_us + latency
+        timer.callback(timer)
+        fire_us = clock.now_us + timer.period_us
+        if new_bpm is not None and change_us is None and len(clocks) >= beats*12:
+            # the main loop changes the rate between two callbacks
+            change_us = clock.now_us
+            keyboard_config.set_rate(new_bpm)
+            fire_us = clock.now_us + timer.period_us
+    return clocks, change_us
+
+
+def ideal_clock_us(index, bpm):
+    # clock k is sent on tick 10*k, the first tick comes one tick after
+    # the start
+    return (10*index + 1)*TICK_NUMERATOR/(bpm*10)
+
+
+def measure(bpm, beats):
+    clocks, _ = run(bpm, beats)
+    deviations = [clocks[i] - ideal_clock_us(i, bpm) for i in range(len(clocks))]
+    drift = sum(deviations[-24:])/24
+    mean = sum(deviations)/len(deviations)
+    rms = (sum((d - mean)**2 for d in deviations)/len(deviations))**0.5
+    worst = max(abs(d - mean) for d in deviations)
+    # a tick period rounded down to whole microseconds, as before
+    tick_error_us = TICK_NUMERATOR/(bpm*10) - TICK_NUMERATOR//(bpm*10)
+    integer_drift = tick_error_us*beats*240
+    print('{:3d} BPM: drift {:7.1f} us, jitter rms {:6.1f} us, worst {:6.1f} us'
+          ' | whole us tick period: drift {:8.1f} ms'.format(
+              bpm, drift, rms, worst, integer_drift/1000))
+    # the latency is at most LATENCY_US + STALL_US and the clock must not
+    # drift away from the ideal one
+    return abs(drift) < LATENCY_US and worst < LATENCY_US + STALL_US
+
+
+def measure_tempo_change(bpm, new_bpm, beats):
+    clocks, change_us = run(bpm, beats, new_bpm)
+    intervals = [clocks[i+1] - clocks[i] for i in range(len(clocks) - 1)]
+    old_clock_us = TICK_NUMERATOR/bpm
+    new_clock_us = TICK_NUMERATOR/new_bpm
+    # every interval is the old or the new clock period, the one around the
+    # change a mix of both, up to the latency of the callbacks
+    lowest = min(old_clock_us, new_clock_us) - LATENCY_US - STALL_US
+    highest = max(old_clock_us, new_clock_us) + LATENCY_US + STALL_US
+    ok = all(lowest <= interval <= highest for interval in intervals)
+    # the first clock after the change still comes one tick of the old tempo
+    # after the change, the new grid starts from the second one
+    after = [i for i in range(len(clocks)) if clocks[i] > change_us][1:]
+    deviations = [clocks[i] - clocks[after[0]] - (i - after[0])*new_clock_us
+                  for i in after]
+    drift = sum(deviations[-24:])/24 - sum(deviations[:24])/24
+    ok = ok and abs(drift) < LATENCY_US
+    print('{:3d} -> {:3d} BPM: clock intervals {:.0f}..{:.0f} us, drift after the change {:6.1f} us {}'.format(
+        bpm, new_bpm, min(intervals), max(intervals), drift, 'ok' if ok else 'FAIL'))
+    return ok
+
+
+def main():
+    beats = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    print('{} beats, callbacks late by 0-{} us, {} us stalls with probability {}'.format(
+        beats, LATENCY_US, STALL_US, STALL_PROBABILITY))
+    ok = True
+    for bpm in BPMS:
+        ok = measure(bpm, beats) and ok
+    ok = measure_tempo_change(120, 121, beats) and ok
+    ok = measure_tempo_change(173, 90, beats) and ok
+    print('ok' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+# Run the firmware on a PC: main.py, KeyboardConfiguration and the OLED
+# driver run unmodified on the stand-ins of host/, on a virtual time line.
+#
+# The VirtualClock replaces the time functions. The main thread moves the
+# time forward by step_us at each ticks_us()/ticks_ms() call, as the main
+# loop takes time on the pico, and by the time asked for by the sleeps.
+# When the time moves, the machine.Timer callbacks, the scripted events
+# (key presses, pot moves) and the threads due meanwhile are run in time
+# order. Timer callbacks and threads run in zero virtual time, and a single
+# Python thread runs at a time: a thread started with _thread runs until it
+# sleeps, then gives the hand back, so a run is deterministic.
+#
+# The keys are pressed on the key matrix (the scanner drives the rows and
+# reads the columns), the pots follow curves of the time, the MIDI sent is
+# in the UART of the keyboard. The run ends at end_s, by an exception
+# deriving from BaseException so the except Exception of main.py lets it
+# through.
+#
+#   emulator = Emulator(end_s=10)
+#   emulator.tap("suite", at_s=2)   # play
+#   emulator.pot(28, lambda t: 30000 + 1000*t)
+#   namespace = emulator.run_main()
+#   namespace["keyboard_config"].uart.tx_data
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import _thread
+
+import hostenv
+hostenv.install()
+
+import machine  # noqa: E402
+from keylayout import DEFAULT_KEY_MAP  # noqa: E402
+
+# pins of the key matrix, as in main.py
+ROW_PINS = [14, 13, 18, 19, 4, 3, 2, 1]
+COL_PINS = [15, 20, 21, 22, 7, 6, 5, 0]
+# ADC pins of the pots, as in main.py
+RATE_POT = 28
+PITCH_POT = 27
+MOD_POT = 26
+
+# files of the flash besides the modules
+FLASH_FILES = ('.pbm',)
+FLASH_FOLDERS = ('fonts', 'arp_mode')
+
+
+class SimulationEnd(BaseException):
+    pass
+
+
+class VirtualThread:
+    def __init__(self, function, args, errors):
+        self.function = function
+        self.args = args
+        self.errors = errors
+        self.wake_us = 0
+        self.finished = False
+        self.run_event = threading.Event()
+        self.yield_event = threading.Event()
+        self.thread = threading.Thread(target=self.main, daemon=True)
+
+    def main(self):
+        self.run_event.wait()
+        self.run_event.clear()
+        try:
+            self.function(*self.args)
+        except SimulationEnd:
+            pass
+        except Exception as e:
+            # a thread dies alone on the pico too
+            print("thread stopped:", repr(e))
+            self.errors.append(e)
+        self.finished = True
+        self.yield_event.set()
+
+    def resume(self):
+        """Run the thread until it sleeps again, from the main thread"""
+        self.run_event.set()
+        self.yield_event.wait()
+        self.yield_event.clear()
+
+    def sleep(self, clock, us):
+        """Give the hand back to the main thread for us"""
+        self.wake_us = clock.now_us + max(int(us), 1)
+        self.yield_event.set()
+        self.run_event.wait()
+        self.run_event.clear()
+
+
+class VirtualClock:
+    def __init__(self, step_us=200, end_us=None):
+        self.now_us = 0
+        self.step_us = step_us
+        self.end_us = end_us
+        self.timers = []
+        self.events = []  # heap of (time, order, function)
+        self.event_order = 0
+        self.threads = []
+        self.dispatching = False
+        self.main_thread = threading.get_ident()
+        self.timer_calls = 0
+        self.thread_errors = []
+
+    # machine.Timer
+    def arm(self, timer):
+        timer.deadline_us = self.now_us + max(timer.period_us, 1)
+        if timer not in self.timers:
+            self.timers.append(timer)
+
+    def disarm(self, timer):
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+    def at(self, time_us, function):
+        """Call function() at time_us"""
+        heapq.heappush(self.events, (int(time_us), self.event_order, function))
+        self.event_order += 1
+
+    def start_thread(self, function, args):
+        thread = VirtualThread(function, args, self.thread_errors)
+        thread.wake_us = self.now_us
+        self.threads.append(thread)
+        thread.thread.start()
+
+    def advance(self, us):
+        if self.dispatching or threading.get_ident() != self.main_thread:
+            # timer callbacks and threads run in zero time
+            return
+        self.run_until(self.now_us + us)
+
+    def run_until(self, target_us):
+        self.dispatching = True
+        try:
+            while True:
+                next_us = target_us + 1
+                next_kind = None
+                for timer in self.timers:
+                    if timer.deadline_us < next_us:
+                        next_us = timer.deadline_us
+                        next_kind = timer
+                if self.events and self.events[0][0] < next_us:
+                    next_us = self.events[0][0]
+                    next_kind = 'event'
+                for thread in self.threads:
+                    if not thread.finished and thread.wake_us < next_us:
+                        next_us = thread.wake_us
+                        next_kind = thread
+                if next_kind is None:
+                    break
+                if next_us > self.now_us:
+                    self.now_us = next_us
+                if next_kind == 'event':
+                    heapq.heappop(self.events)[2]()
+                elif isinstance(next_kind, VirtualThread):
+                    next_kind.resume()
+                else:
+                    self.fire(next_kind)
+            self.now_us = max(self.now_us, target_us)
+        finally:
+            self.dispatching = False
+        if self.end_us is not None and self.now_us >= self.end_us:
+            raise SimulationEnd()
+
+    def fire(self, timer):
+        if timer.mode == machine.Timer.PERIODIC:
+            timer.deadline_us += max(timer.period_us, 1)
+        else:
+            self.timers.remove(timer)
+        self.timer_calls += 1
+        callback = timer.callback
+        if callback is not None:
+            callback(timer)
+
+    def core_id(self):
+        """The threads started with _thread run on core 1"""
+        return 0 if threading.get_ident() == self.main_thread else 1
+
+    # time functions
+    def ticks_us(self):
+        self.advance(self.step_us)
+        return self.now_us & (hostenv.TICKS_PERIOD - 1)
+
+    def ticks_ms(self):
+        self.advance(self.step_us)
+        return (self.now_us // 1000) & (hostenv.TICKS_PERIOD - 1)
+
+    def time(self):
+        return self.now_us // 1_000_000
+
+    def sleep_us(self, us):
+        if threading.get_ident() == self.main_thread:
+            if not self.dispatching:
+                self.run_until(self.now_us + int(us))
+            return
+        for thread in self.threads:
+            if thread.thread.ident == threading.get_ident():
+                thread.sleep(self, us)
+                return
+
+    def sleep_ms(self, ms):
+        self.sleep_us(ms*1000)
+
+    def sleep(self, s):
+        self.sleep_us(s*1_000_000)
+
+
+class Emulator:
+    def __init__(self, end_s=10.0, step_us=200):
+        self.clock = VirtualClock(step_us, int(end_s*1_000_000))
+        self.pressed = set()  # key indexes, row*8 + col
+        self.key_names = {}
+        for row, names in enumerate(DEFAULT_KEY_MAP):
+            for col, name in enumerate(names):
+                self.key_names[name] = row*8 + col
+        self.pot_curves = {}
+        self.flash_dir = None
+        # global namespace of main.py, filled as it runs
+        self.namespace = {'__name__': '__main__'}
+
+    def key_index(self, key):
+        if isinstance(key, str):
+            return self.key_names[key]
+        return key
+
+    def press(self, key, at_s):
+        index = self.key_index(key)
+        self.clock.at(at_s*1_000_000, lambda: self.pressed.add(index))
+
+    def release(self, key, at_s):
+        index = self.key_index(key)
+        self.clock.at(at_s*1_000_000, lambda: self.pressed.discard(index))
+
+    def tap(self, key, at_s, duration_s=0.08):
+        """Press a key by name (see keylayout.py) or index, then release it"""
+        self.press(key, at_s)
+        self.release(key, at_s + duration_s)
+
+    def at(self, at_s, function):
+        """Call function() at at_s, from the main thread"""
+        self.clock.at(at_s*1_000_000, function)
+
+    def pot(self, pin, curve):
+        """curve(time in s) gives the ADC reading of a pot, 0 to 65535"""
+        self.pot_curves[pin] = curve
+
+    def pin_input(self, pin):
+        if pin.id in COL_PINS:
+            col = COL_PINS.index(pin.id)
+            for row, row_pin in enumerate(ROW_PINS):
+                driver = machine.pins.get(row_pin)
+                if driver is not None and driver.mode == machine.Pin.OUT and \
+                        driver._value == 0 and row*8 + col in self.pressed:
+                    return 0
+            return 1
+        if pin.pull == machine.Pin.PULL_UP:
+            # the boot button and the unused inputs are up
+            return 1
+        return None
+
+    def install(self):
+        clock = self.clock
+        time.ticks_us = clock.ticks_us
+        time.ticks_ms = clock.ticks_ms
+        time.ticks_cpu = clock.ticks_us
+        time.time = clock.time
+        time.sleep = clock.sleep
+        time.sleep_ms = clock.sleep_ms
+        time.sleep_us = clock.sleep_us
+        sys.modules['utime'] = time
+        _thread.start_new_thread = clock.start_thread
+        machine.clock = clock
+        machine.pin_input = self.pin_input
+        machine.core_id = clock.core_id
+        adc_init = machine.ADC.__init__
+        curves = self.pot_curves
+
+        def init_adc(adc, pin):
+            adc_init(adc, pin)
+            adc.curve = curves.get(pin)
+        machine.ADC.__init__ = init_adc
+
+    def make_flash(self):
+        """Working directory holding the files of the flash but the modules,
+        so the files written by the firmware do not land in the repository"""
+        self.flash_dir = tempfile.mkdtemp(prefix='miditel-flash-')
+        for name in os.listdir(hostenv.REPO_DIR):
+            path = os.path.join(hostenv.REPO_DIR, name)
+            if name.endswith(FLASH_FILES) or name in FLASH_FOLDERS:
+                os.symlink(path, os.path.join(self.flash_dir, name))
+        return self.flash_dir
+
+    def run_main(self, keep_flash=False):
+        """Run main.py until end_s, return its global namespace"""
+        self.install()
+        self.make_flash()
+        os.chdir(self.flash_dir)
+        path = os.path.join(hostenv.REPO_DIR, 'main.py')
+        with open(path) as main_file:
+            code = compile(main_file.read(), path, 'exec')
+        try:
+            exec(code, self.namespace)
+        except SimulationEnd:
+            pass
+        finally:
+            os.chdir(hostenv.REPO_DIR)
+            if not keep_flash:
+                shutil.rmtree(self.flash_dir)
+        return self.namespace
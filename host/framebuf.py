@@ -0,0 +1,130 @@
+# Host stand-in for the MicroPython framebuf module.
+# Pure Python, only the monochrome formats used by the Miditel are supported.
+
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        if format not in (MONO_VLSB, MONO_HLSB, MONO_HMSB):
+            raise ValueError('invalid format')
+        self._buf = buffer
+        self._width = width
+        self._height = height
+        self._format = format
+        self._stride = width if stride is None else stride
+        if format != MONO_VLSB:
+            self._stride = (self._stride + 7) & ~7
+
+    def _index_bit(self, x, y):
+        if self._format == MONO_VLSB:
+            return (y >> 3) * self._stride + x, 1 << (y & 7)
+        index = (x + y * self._stride) >> 3
+        if self._format == MONO_HLSB:
+            return index, 0x80 >> (x & 7)
+        return index, 1 << (x & 7)
+
+    def _get(self, x, y):
+        index, bit = self._index_bit(x, y)
+        return 1 if self._buf[index] & bit else 0
+
+    def _set(self, x, y, c):
+        index, bit = self._index_bit(x, y)
+        if c:
+            self._buf[index] |= bit
+        else:
+            self._buf[index] &= ~bit & 0xff
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            return None
+        if c is None:
+            return self._get(x, y)
+        self._set(x, y, c)
+
+    def fill(self, c):
+        value = 0xff if c else 0x00
+        for i in range(len(self._buf)):
+            self._buf[i] = value
+
+    def fill_rect(self, x, y, w, h, c):
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + w, self._width)
+        y1 = min(y + h, self._height)
+        for yy in range(y0, y1):
+            for xx in range(x0, x1):
+                self._set(xx, yy, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+            return
+        self.fill_rect(x, y, w, 1, c)
+        self.fill_rect(x, y + h - 1, w, 1, c)
+        self.fill_rect(x, y, 1, h, c)
+        self.fill_rect(x + w - 1, y, 1, h, c)
+
+    def line(self, x1, y1, x2, y2, c):
+        dx = abs(x2 - x1)
+        dy = -abs(y2 - y1)
+        sx = 1 if x1 < x2 else -1
+        sy = 1 if y1 < y2 else -1
+        err = dx + dy
+        while True:
+            self.pixel(x1, y1, c)
+            if x1 == x2 and y1 == y2:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x1 += sx
+            if e2 <= dx:
+                err += dx
+                y1 += sy
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        for sy in range(fbuf._height):
+            yy = y + sy
+            if not 0 <= yy < self._height:
+                continue
+            for sx in range(fbuf._width):
+                xx = x + sx
+                if not 0 <= xx < self._width:
+                    continue
+                c = fbuf._get(sx, sy)
+                if palette is not None:
+                    c = palette.pixel(c, 0)
+                if c != key:
+                    self._set(xx, yy, c)
+
+    def scroll(self, xstep, ystep):
+        pixels = [[self._get(x, y) for x in range(self._width)]
+                  for y in range(self._height)]
+        for y in range(self._height):
+            for x in range(self._width):
+                sx = x - xstep
+                sy = y - ystep
+                if 0 <= sx < self._width and 0 <= sy < self._height:
+                    self._set(x, y, pixels[sy][sx])
+
+    def text(self, s, x, y, c=1):
+        # the built-in 8x8 font is not available on the host, the glyphs of
+        # arial8 are drawn in 8x8 cells instead
+        import arial8
+        for char in s:
+            glyph, height, width = arial8.get_ch(char)
+            bytes_per_row = (width + 7) // 8
+            for gy in range(height):
+                for gx in range(min(width, 8)):
+                    if glyph[gy * bytes_per_row + (gx >> 3)] & (0x80 >> (gx & 7)):
+                        self.pixel(x + gx, y + gy, c)
+            x += 8
@@ -0,0 +1,52 @@
+# Set up CPython to run the firmware modules: put the host stand-ins first on
+# the path, work from the repository root (pictures and fonts are opened with
+# relative paths) and add the MicroPython ticks functions to the time module.
+import os
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+
+TICKS_PERIOD = 1 << 30
+
+
+def ticks_us():
+    return (time.perf_counter_ns() // 1000) & (TICKS_PERIOD - 1)
+
+
+def ticks_ms():
+    return (time.perf_counter_ns() // 1000000) & (TICKS_PERIOD - 1)
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & (TICKS_PERIOD - 1)
+
+
+def ticks_diff(ticks1, ticks2):
+    half = TICKS_PERIOD // 2
+    return ((ticks1 - ticks2 + half) & (TICKS_PERIOD - 1)) - half
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+def install():
+    for path in (REPO_DIR, HOST_DIR):
+        if path in sys.path:
+            sys.path.remove(path)
+    sys.path.insert(0, HOST_DIR)
+    sys.path.insert(1, REPO_DIR)
+    os.chdir(REPO_DIR)
+    time.ticks_us = ticks_us
+    time.ticks_ms = ticks_ms
+    time.ticks_cpu = ticks_us
+    time.ticks_add = ticks_add
+    time.ticks_diff = ticks_diff
+    time.sleep_ms = sleep_ms
+    time.sleep_us = sleep_us
@@ -0,0 +1,179 @@
+# Host stand-in for the MicroPython machine module.
+# Only what the Miditel firmware uses is implemented, the peripherals record
+# what is written to them so it can be inspected from a PC.
+# Without emulator the timers only keep their callback and period, for the
+# scripts calling them by hand. host/emulator.py sets clock to run them on
+# a virtual time line, and pin_input to give the inputs their level.
+
+# virtual clock of host/emulator.py, None when the emulator is not used
+clock = None
+# function(pin) returning the level of an input pin, or None to keep its
+# own value
+pin_input = None
+# last pin created for each id
+pins = {}
+# function() returning the core running, 0 or 1, read at SIO_CPUID
+core_id = None
+
+SIO_CPUID = 0xd0000000
+
+_freq = 125_000_000
+
+
+def freq(hz=None, *args):
+    global _freq
+    if hz is None:
+        return _freq
+    _freq = hz
+
+
+class Mem32:
+    """Only the SIO CPUID register is readable"""
+
+    def __getitem__(self, address):
+        if address == SIO_CPUID:
+            return 0 if core_id is None else core_id()
+        raise ValueError("address not emulated")
+
+
+mem32 = Mem32()
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = 0 if value is None else value
+        self.toggle_count = 0
+        pins[id] = self
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if mode != -1:
+            self.mode = mode
+        if pull != -1:
+            self.pull = pull
+        if value is not None:
+            self.value(value)
+
+    def value(self, x=None):
+        if x is None:
+            if pin_input is not None and self.mode != Pin.OUT:
+                level = pin_input(self)
+                if level is not None:
+                    return level
+            return self._value
+        x = 1 if x else 0
+        if x != self._value:
+            self.toggle_count += 1
+        self._value = x
+
+    def __call__(self, x=None):
+        return self.value(x)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+
+class ADC:
+    def __init__(self, pin):
+        self.pin = pin
+        self.value = 32768
+        # function(time in s) giving the reading on the virtual clock
+        self.curve = None
+
+    def read_u16(self):
+        if self.curve is not None and clock is not None:
+            value = int(self.curve(clock.now_us / 1_000_000))
+            return min(max(value, 0), 65535)
+        return self.value
+
+
+class SPI:
+    def __init__(self, id, baudrate=1_000_000, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        self.transactions = 0
+        self.bytes_written = 0
+        self.capture = None
+
+    def init(self, baudrate=1_000_000, **kwargs):
+        self.baudrate = baudrate
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.bytes_written = 0
+
+    def write(self, buf):
+        self.transactions += 1
+        self.bytes_written += len(buf)
+        if self.capture is not None:
+            self.capture.append(bytes(buf))
+
+
+class UART:
+    def __init__(self, id, baudrate=9600, tx=None, rx=None, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        self.tx_data = bytearray()
+        self.rx_data = bytearray()
+
+    def write(self, buf):
+        self.tx_data.extend(buf)
+        return len(buf)
+
+    def any(self):
+        return len(self.rx_data)
+
+    def read(self, nbytes=-1):
+        if len(self.rx_data) == 0:
+            return None
+        if nbytes < 0:
+            nbytes = len(self.rx_data)
+        data = bytes(self.rx_data[:nbytes])
+        del self.rx_data[:nbytes]
+        return data
+
+    def readinto(self, buf, nbytes=-1):
+        data = self.read(len(buf) if nbytes < 0 else nbytes)
+        if data is None:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.id = id
+        self.callback = None
+        self.mode = Timer.PERIODIC
+        self.period_us = 0
+        self.deadline_us = 0
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, freq=-1, period=-1, tick_hz=1000, callback=None):
+        self.mode = mode
+        if freq > 0:
+            self.period_us = int(1_000_000 / freq)
+        elif period >= 0:
+            self.period_us = period * 1_000_000 // tick_hz
+        self.callback = callback
+        if clock is not None:
+            clock.arm(self)
+
+    def deinit(self):
+        self.callback = None
+        if clock is not None:
+            clock.disarm(self)
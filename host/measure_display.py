@@ -0,0 +1,37 @@
+# Count the SPI transactions and bytes the OLED driver sends per frame.
+# Run from anywhere with: python host/measure_display.py
+import hostenv
+hostenv.install()
+
+from keyboardConfiguration import KeyboardConfiguration, Mode  # noqa: E402
+from OLED_SPI import OLED_1inch3  # noqa: E402
+
+
+def measure(oled, label):
+    # publish the configuration as the main loop does
+    oled.keyboard_config.display()
+    oled.keyboard_config.publish_display()
+    oled.spi.reset_stats()
+    oled.display()
+    print('{:<24} {:>5} transactions {:>6} bytes'.format(
+        label, oled.spi.transactions, oled.spi.bytes_written))
+    return oled.spi.transactions, oled.spi.bytes_written
+
+
+def main():
+    keyboard_config = KeyboardConfiguration()
+    oled = OLED_1inch3(keyboard_config)
+    keyboard_config.set_display(oled)
+
+    measure(oled, 'first frame')
+    measure(oled, 'unchanged frame')
+    keyboard_config.rate = 121
+    measure(oled, 'bpm change')
+    keyboard_config.mode = Mode.MULTISEQUENCER
+    measure(oled, 'mode change')
+    keyboard_config.multi_sequence_highlighted = 1
+    measure(oled, 'multi-seq tile move')
+
+
+if __name__ == '__main__':
+    main()
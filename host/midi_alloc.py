@@ -0,0 +1,138 @@
+# Check that the MIDI output path of midi.MidiWriter does not allocate.
+# A fake UART records the bytes sent in a buffer allocated once, the bytes are
+# compared with the messages the keyboard used to build with ustruct.pack and
+# the allocations of each send + pump are counted: with the heap locked under
+# MicroPython (unix port or mpremote run), with tracemalloc under CPython.
+# The priority of the realtime bytes over queued channel messages is checked
+# too.
+# Run from anywhere with: python host/midi_alloc.py
+import sys
+
+import hostenv
+hostenv.install()
+
+from midi import MidiWriter, CONTEXT_MAIN, CONTEXT_TIMER  # noqa: E402
+from profiler import PROFILER  # noqa: E402
+
+LOOPS = 1000
+
+
+class RecordingUart:
+    def __init__(self, size=64):
+        self.data = bytearray(size)
+        self.length = 0
+
+    def write(self, buf):
+        n = len(buf)
+        if self.length + n > len(self.data):
+            self.length = 0
+        # a while loop, range() allocates under CPython
+        i = 0
+        while i < n:
+            self.data[self.length + i] = buf[i]
+            i += 1
+        self.length += n
+        return n
+
+    def take(self):
+        data = bytes(self.data[:self.length])
+        self.length = 0
+        return data
+
+
+def sends(writer):
+    return [
+        ('note_on', lambda: writer.note_on(3, 60), bytes([0x93, 60, 127])),
+        ('note_off', lambda: writer.note_off(3, 60), bytes([0x83, 60, 0])),
+        ('all_notes_off', lambda: writer.all_notes_off(0), bytes([0xb0, 123, 0])),
+        ('mod_wheel', lambda: writer.control_change(0, 1, 100), bytes([0xb0, 1, 100])),
+        ('pitch_bend', lambda: writer.pitch_bend(0, 0x2345), bytes([0xe0, 0x45, 0x46])),
+        ('clock', writer.clock, bytes([0xf8])),
+        ('start', writer.start, bytes([0xfa])),
+        ('stop', writer.stop, bytes([0xfc])),
+        ('send', lambda: writer.send(0x91, 64, 127), bytes([0x91, 64, 127])),
+    ]
+
+
+def count_allocations(function):
+    """Number of allocations made by LOOPS calls of function"""
+    if sys.implementation.name == 'micropython':
+        import micropython
+        micropython.heap_lock()
+        try:
+            for _ in range(LOOPS):
+                function()
+        except MemoryError:
+            micropython.heap_unlock()
+            return -1
+        return micropython.heap_unlock()
+
+    # tracemalloc has a small overhead of its own, measured with a no-op
+    baseline = max(peak_increases(lambda: None))
+    return sum(1 for increase in peak_increases(function) if increase > baseline)
+
+
+def peak_increases(function):
+    import tracemalloc
+    increases = [0]*LOOPS
+    tracemalloc.start()
+    for i in range(LOOPS):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        function()
+        increases[i] = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return increases
+
+
+def check_realtime_priority():
+    uart = RecordingUart()
+    writer = MidiWriter(uart)
+    writer.set_tick_rate(480)  # 120 BPM, two messages per tick
+    # a chord played from the main loop, then a tick sends a clock
+    for note in (60, 64, 67):
+        writer.note_on(0, note)
+    writer.context = CONTEXT_TIMER
+    writer.clock()
+    writer.pump()
+    writer.context = CONTEXT_MAIN
+    first_tick = uart.take()
+    writer.flush()
+    rest = uart.take()
+    ok = first_tick == bytes([0xf8, 0x90, 60, 127, 0x90, 64, 127]) and \
+        rest == bytes([0x90, 67, 127])
+    print('{:14s} {} | {} {}'.format('priority', first_tick.hex(), rest.hex(),
+                                     'ok' if ok else 'FAIL'))
+    return ok
+
+
+def main():
+    if sys.implementation.name != 'micropython':
+        # pump() is profiled with the ticks_us values, int objects under
+        # CPython but small ints on the pico
+        PROFILER.enabled = False
+    uart = RecordingUart()
+    writer = MidiWriter(uart)
+    failures = 0
+    for name, send, expected in sends(writer):
+        def function():
+            send()
+            writer.pump()
+        function()
+        sent = uart.take()
+        # the lambdas are only there to bind the arguments, call the writer
+        # once more to warm up before counting
+        function()
+        allocations = count_allocations(function)
+        uart.take()
+        ok = sent == expected and allocations == 0
+        failures += not ok
+        print('{:14s} {:10s} allocations {:4d} {}'.format(
+            name, sent.hex(), allocations, 'ok' if ok else 'FAIL'))
+    failures += not check_realtime_priority()
+    print('{} failure(s)'.format(failures))
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
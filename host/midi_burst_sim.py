@@ -0,0 +1,93 @@
+# Stop the multi sequencer with notes held on all 16 channels and check no
+# message of the burst is lost. The main loop queues a note off per held
+# note and an all notes off per channel, many more messages than its midi
+# ring holds: it must wait for the pump instead of dropping them, with the
+# tick timer running, with the ticks on the core 1 engine and with the
+# timer stopped. Runs on the virtual clock of host/emulator.py.
+# Run from anywhere with: python host/midi_burst_sim.py
+import sys
+
+import emulator
+from keyboardConfiguration import KeyboardConfiguration, Mode, PlayMode  # noqa: E402
+from midi import NOTE_OFF, NOTE_ON, CONTROL_CHANGE, CC_ALL_NOTES_OFF  # noqa: E402
+from engine import Engine  # noqa: E402
+
+# notes held per channel, the last case fills every PlayedNotes
+HELD_NOTES = (2, 16)
+DRAIN_MS = 2000
+
+
+def channel_messages(data):
+    """(status, data1, data2) of a MIDI stream, running status expanded"""
+    messages = []
+    status = 0
+    message = []
+    for byte in data:
+        if byte >= 0xf8:
+            continue
+        if byte & 0x80:
+            status = byte
+            message = []
+            continue
+        message.append(byte)
+        if len(message) == 2:
+            messages.append((status, message[0], message[1]))
+            message = []
+    return messages
+
+
+def run(held, timer):
+    emu = emulator.Emulator(end_s=1000)
+    emu.install()
+    keyboard_config = KeyboardConfiguration()
+    engine = None
+    if timer == 'engine':
+        engine = Engine(keyboard_config)
+        engine.start()
+    elif timer == 'stopped':
+        keyboard_config.deinit_timer()
+    keyboard_config.mode = Mode.MULTISEQUENCER
+    keyboard_config.play_mode = PlayMode.PLAYING
+    for channel in range(0, 16):
+        for i in range(0, held):
+            keyboard_config.multi_seq_played_notes[channel].add(40 + i, 4)
+    start = len(keyboard_config.uart.tx_data)
+
+    keyboard_config.stop_pressed()
+    # the passes of the main loop after the stop
+    for _ in range(0, DRAIN_MS):
+        keyboard_config.wake_timer()
+        emu.clock.sleep_ms(1)
+    if engine is not None:
+        keyboard_config.deinit_timer()
+
+    note_offs = 0
+    all_notes_off = 0
+    for status, data1, data2 in channel_messages(keyboard_config.uart.tx_data[start:]):
+        kind = status & 0xf0
+        if kind == NOTE_OFF or (kind == NOTE_ON and data2 == 0):
+            note_offs += 1
+        elif kind == CONTROL_CHANGE and data1 == CC_ALL_NOTES_OFF:
+            all_notes_off += 1
+    dropped = keyboard_config.midi.dropped()
+    ok = note_offs == 16*held and all_notes_off == 16 and dropped == 0 and \
+        not emu.clock.thread_errors
+    print('{:2d} notes held per channel, timer {:8s}: {:3d} note offs (expected {:3d}), '
+          '{:2d} all notes off (expected 16), {} dropped {}'.format(
+              held, timer, note_offs, 16*held, all_notes_off, dropped,
+              'ok' if ok else 'FAIL'))
+    return ok
+
+
+def main():
+    failures = 0
+    for held in HELD_NOTES:
+        for timer in ('running', 'engine', 'stopped'):
+            if not run(held, timer):
+                failures += 1
+    print('{} failure(s)'.format(failures))
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
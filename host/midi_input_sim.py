@@ -0,0 +1,143 @@
+# Feed MIDI byte streams to the input of the keyboard on a PC.
+# First the parser alone (running status, Real-Time bytes in the middle of
+# messages, system exclusive), then KeyboardConfiguration slaved to an
+# external clock: the timer and the received clock are simulated on a
+# virtual time line and the ticks must follow the clock, the tempo and the
+# transport, with the received notes sent through.
+# Run from anywhere with: python host/midi_input_sim.py [bpm]
+import heapq
+import sys
+import time
+
+import hostenv
+hostenv.install()
+
+from midi import MidiParser, CLOCK, START, STOP  # noqa: E402
+from keyboardConfiguration import KeyboardConfiguration, PlayMode  # noqa: E402
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def midi_realtime(self, status):
+        self.events.append((status,))
+
+    def midi_message(self, status, data1, data2):
+        self.events.append((status, data1, data2))
+
+
+def check_parser():
+    stream = bytes([
+        0x90, 60, 0xf8, 100,         # clock in the middle of a note on
+        64, 100,                     # running status
+        0xf0, 0x7e, 0x01, 0xf7,      # system exclusive cancels running status
+        62, 1,                       # data without status, ignored
+        0xc2, 5, 6,                  # program changes with running status
+        0xb0, 1, 0xfa, 0xfc, 64,     # realtime bytes in a control change
+    ])
+    expected = [
+        (0xf8,), (0x90, 60, 100), (0x90, 64, 100),
+        (0xc2, 5, 0), (0xc2, 6, 0),
+        (0xfa,), (0xfc,), (0xb0, 1, 64),
+    ]
+    recorder = Recorder()
+    parser = MidiParser(recorder)
+    parser.feed_buffer(stream, len(stream))
+    ok = recorder.events == expected
+    print('parser: {}'.format('ok' if ok else 'FAIL {}'.format(recorder.events)))
+    return ok
+
+
+class VirtualTime:
+    def __init__(self):
+        self.now_us = 0
+
+    def ticks_us(self):
+        return self.now_us & (hostenv.TICKS_PERIOD - 1)
+
+
+def check_external_sync(bpm):
+    clock = VirtualTime()
+    time.ticks_us = clock.ticks_us
+
+    keyboard_config = KeyboardConfiguration()
+    keyboard_config.external_sync = True
+    keyboard_config.midi_thru = True
+    keyboard_config.midi_parser = MidiParser(keyboard_config)
+    keyboard_config.update_timer_frequency()
+    uart = keyboard_config.uart
+    timer = keyboard_config.play_note_timer
+
+    clock_us = 60_000_000 // (bpm*24)
+    beats = 8
+    # (time, order, event), a start, the clocks of 8 beats, a note in the
+    # middle and a stop
+    events = [(0, 0, 'start')]
+    for i in range(beats*24):
+        events.append((1000 + i*clock_us, 1, 'clock'))
+    events.append((1000 + beats*12*clock_us + 10, 2, 'note'))
+    events.append((1000 + beats*24*clock_us, 3, 'stop'))
+    heapq.heapify(events)
+    next_timer_us = timer.period_us
+    next_main_us = 0
+
+    ticks = [0]
+    tick = keyboard_config._tick
+
+    def counted_tick():
+        ticks[0] += 1
+        tick()
+    keyboard_config._tick = counted_tick
+
+    end_us = 1000 + (beats*24 + 2)*clock_us
+    while clock.now_us < end_us:
+        step = min(next_timer_us, next_main_us,
+                   events[0][0] if events else end_us)
+        clock.now_us = step
+        while events and events[0][0] <= clock.now_us:
+            _, _, event = heapq.heappop(events)
+            if event == 'start':
+                uart.rx_data.extend(bytes([START]))
+            elif event == 'clock':
+                uart.rx_data.extend(bytes([CLOCK]))
+            elif event == 'note':
+                uart.rx_data.extend(bytes([0x95, 48, 90]))
+            elif event == 'stop':
+                uart.rx_data.extend(bytes([STOP]))
+        if clock.now_us >= next_main_us:
+            keyboard_config.update_external_sync()
+            next_main_us += 1000
+        if clock.now_us >= next_timer_us:
+            timer.callback(timer)
+            # one shot timer, armed again by the callback
+            next_timer_us = clock.now_us + timer.period_us
+
+    sent = bytes(uart.tx_data)
+    clocks_sent = sent.count(bytes([CLOCK]))
+    ok = True
+    results = [
+        ('ticks', ticks[0], beats*240),
+        ('clocks sent', clocks_sent, beats*24),
+        ('rate', keyboard_config.rate, bpm),
+        ('note through', bytes([0x95, 48, 90]) in sent, True),
+        ('start sent', START in sent, True),
+        ('stopped', keyboard_config.play_mode, PlayMode.PAUSING),
+    ]
+    for name, value, expected in results:
+        ok = ok and value == expected
+        print('  {:13s} {} (expected {})'.format(name, value, expected))
+    print('external sync at {} BPM: {}'.format(bpm, 'ok' if ok else 'FAIL'))
+    return ok
+
+
+def main():
+    bpms = [int(arg) for arg in sys.argv[1:]] or [60, 120, 200]
+    ok = check_parser()
+    for bpm in bpms:
+        ok = check_external_sync(bpm) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# Byte level check of the running status encoding of midi.MidiWriter.
+# Random streams of notes, controls, pitch bends and realtime bytes from both
+# contexts are sent through a writer with and without running status, the
+# bytes on the wire are decoded by a reference MIDI parser and both decodes
+# must give the same messages. The saved bytes are printed.
+# Run from anywhere with: python host/midi_running_status.py
+import random
+import sys
+
+import hostenv
+hostenv.install()
+
+from machine import UART  # noqa: E402
+from midi import MidiWriter, CONTEXT_MAIN, CONTEXT_TIMER  # noqa: E402
+
+STREAMS = 200
+
+
+def decode(data):
+    """Messages of a MIDI byte stream: (status, data1, data2) tuples, realtime
+    bytes as (status,) and note offs as note ons of velocity 0"""
+    messages = []
+    status = 0
+    pending = []
+    for byte in data:
+        if byte >= 0xf8:
+            # realtime, may appear anywhere and leaves running status alone
+            messages.append((byte,))
+        elif byte >= 0xf0:
+            # system common cancels running status
+            status = 0
+            pending = []
+        elif byte & 0x80:
+            status = byte
+            pending = []
+        else:
+            if status == 0:
+                raise ValueError('data byte {:02x} without status'.format(byte))
+            pending.append(byte)
+            if len(pending) == 2:
+                if status & 0xf0 == 0x80:
+                    messages.append((0x90 | (status & 0x0f), pending[0], 0))
+                else:
+                    messages.append((status, pending[0], pending[1]))
+                pending = []
+    if pending:
+        raise ValueError('truncated message')
+    return messages
+
+
+def random_stream(rng):
+    events = []
+    for _ in range(rng.randrange(1, 60)):
+        context = rng.choice((CONTEXT_MAIN, CONTEXT_TIMER))
+        kind = rng.randrange(10)
+        channel = rng.choice((0, 0, 0, 1, 9))
+        if kind < 4:
+            events.append((context, 'note_on', channel, rng.randrange(128)))
+        elif kind < 7:
+            events.append((context, 'note_off', channel, rng.randrange(128)))
+        elif kind == 7:
+            events.append((context, 'control_change', channel, 1, rng.randrange(128)))
+        elif kind == 8:
+            events.append((context, 'pitch_bend', channel, rng.randrange(0x4000)))
+        else:
+            events.append((context, rng.choice(('clock', 'start', 'resume', 'stop'))))
+        if rng.randrange(4) == 0:
+            events.append(('pump',))
+    events.append(('flush',))
+    return events
+
+
+def play(events, running_status):
+    uart = UART(0)
+    writer = MidiWriter(uart, running_status=running_status)
+    # no per tick limit, it would spread the messages differently over the
+    # pumps with and without running status, changing their interleaving
+    writer.tx_budget = 1 << 16
+    for event in events:
+        if event[0] == 'pump':
+            writer.pump()
+        elif event[0] == 'flush':
+            writer.flush()
+        else:
+            writer.context = event[0]
+            getattr(writer, event[1])(*event[2:])
+            writer.context = CONTEXT_MAIN
+    return bytes(uart.tx_data)
+
+
+def main():
+    rng = random.Random(1)
+    failures = 0
+    plain_bytes = 0
+    running_bytes = 0
+    for _ in range(STREAMS):
+        events = random_stream(rng)
+        plain = play(events, False)
+        running = play(events, True)
+        plain_bytes += len(plain)
+        running_bytes += len(running)
+        if decode(plain) != decode(running):
+            failures += 1
+    # a chord on one channel, the best case
+    chord = [(CONTEXT_MAIN, 'note_on', 0, note) for note in (60, 64, 67, 71)] + \
+        [(CONTEXT_MAIN, 'note_off', 0, note) for note in (60, 64, 67, 71)] + [('flush',)]
+    chord_plain = play(chord, False)
+    chord_running = play(chord, True)
+    if decode(chord_plain) != decode(chord_running):
+        failures += 1
+    print('random streams: {} bytes without running status, {} with ({:.0f}% saved)'.format(
+        plain_bytes, running_bytes, 100*(plain_bytes-running_bytes)/plain_bytes))
+    print('chord on and off: {} bytes -> {} bytes: {}'.format(
+        len(chord_plain), len(chord_running), chord_running.hex()))
+    print('{} failure(s)'.format(failures))
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,86 @@
+# Behavioural model of the PIO key matrix program of keymatrix_pio.py and of
+# its two DMA rings, to run the PioKeyMatrixScanner decoding on a PC.
+# Run from anywhere with: python host/pio_matrix_sim.py
+from array import array
+
+import hostenv
+hostenv.install()
+
+from keymatrix import KEY_PRESSED, event_row, event_col  # noqa: E402
+from keymatrix_pio import PioKeyMatrixScanner, GPIO_MASK, RING_WORDS  # noqa: E402
+
+
+class MatrixScanPioSim:
+    def __init__(self, row_pins, col_pins, row_masks, snapshots):
+        self.row_pins = row_pins
+        self.col_pins = col_pins
+        self.row_masks = row_masks
+        self.snapshots = snapshots
+        self.tx_index = 0
+        self.rx_index = 0
+        self.pressed = set()
+
+    def press(self, r, c):
+        self.pressed.add((r, c))
+
+    def release(self, r, c):
+        self.pressed.discard((r, c))
+
+    def read_pins(self, pindirs):
+        # inputs are pulled up, a driven row pulls its closed columns low
+        level = GPIO_MASK & ~pindirs
+        for r, c in self.pressed:
+            if pindirs & (1 << self.row_pins[r]):
+                level &= ~(1 << self.col_pins[c])
+        return level
+
+    def step(self):
+        """Run one loop of the program, i.e. scan one row"""
+        # pull(block) from the TX ring
+        osr = self.row_masks[self.tx_index]
+        self.tx_index = (self.tx_index + 1) % RING_WORDS
+        # out(pindirs, 30)
+        pindirs = osr & GPIO_MASK
+        # nop()[31], in_(null, 2), in_(pins, 30)
+        isr = self.read_pins(pindirs) & GPIO_MASK
+        # push(block) to the RX ring
+        self.snapshots[self.rx_index] = isr
+        self.rx_index = (self.rx_index + 1) % RING_WORDS
+
+    def run(self, rows=RING_WORDS):
+        for _ in range(rows):
+            self.step()
+
+
+def print_events(scanner):
+    while scanner.any():
+        event = scanner.get()
+        print('  row {} col {} {}'.format(event_row(event), event_col(event),
+                                          'pressed' if event & KEY_PRESSED else 'released'))
+
+
+def main():
+    # pins of main.py
+    col_pins = [15, 20, 21, 22, 7, 6, 5, 0]
+    row_pins = [14, 13, 18, 19, 4, 3, 2, 1]
+    snapshots = array('I', [GPIO_MASK]*RING_WORDS)
+    scanner = PioKeyMatrixScanner(row_pins, col_pins, debounce_us=0, snapshots=snapshots)
+    sim = MatrixScanPioSim(row_pins, col_pins, scanner.row_masks, snapshots)
+
+    print('press (0, 1) and (7, 3)')
+    sim.press(0, 1)
+    sim.press(7, 3)
+    sim.run()
+    scanner.scan()
+    print_events(scanner)
+
+    print('release (0, 1), press (4, 7)')
+    sim.release(0, 1)
+    sim.press(4, 7)
+    sim.run()
+    scanner.scan()
+    print_events(scanner)
+
+
+if __name__ == '__main__':
+    main()
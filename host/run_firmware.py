@@ -0,0 +1,148 @@
+# Run main.py unmodified on the emulator of host/emulator.py for a scripted
+# performance: the rate pot is set to 120 BPM then turned to 180 BPM, notes
+# are played on the keys and the sequencer is started. The MIDI clocks sent
+# must follow the tempo of the pot, the notes must be sent, the screen must
+# be refreshed by its thread, and no error may stop the main loop or the
+# thread. The profiler, off at boot, is enabled by opening and closing the
+# stats page with Fnct + Ctrl. At the end the page is opened again, the main
+# parts of the firmware must have been profiled.
+# With --core1 the ticks run on the engine of core 1 (ENGINE_ON_CORE1 in
+# engine.py) and the display in the main loop.
+# Run from anywhere with: python host/run_firmware.py [--core1] [seconds]
+import os
+import shutil
+import sys
+
+import emulator
+import engine  # noqa: E402
+from keyboardConfiguration import MIN_BPM, MAX_BPM  # noqa: E402
+from midi import CLOCK, NOTE_ON  # noqa: E402
+from profiler import PROFILER, PROF_TIMER, PROF_KEYS, PROF_DISPLAY, PROF_SHOW, PROF_MIDI, PROF_LATENCY  # noqa: E402
+
+CLOCKS_PER_BEAT = 24
+FIRST_BPM = 120
+SECOND_BPM = 180
+# clock rate tolerance, the pot filter and the deadband round the tempo
+TOLERANCE = 0.02
+
+
+def pot_reading(bpm):
+    # the rate pot is wired reversed, PotFilter inverts it, the middle of
+    # the readings of a tempo
+    return 65536 - (2*(bpm - MIN_BPM) + 1)*65536//(2*(MAX_BPM - MIN_BPM))
+
+
+def count_clocks(data):
+    return data.count(CLOCK)
+
+
+def count_note_ons(data):
+    """Note ons of a MIDI stream, sent with running status or not"""
+    count = 0
+    status = 0
+    message = []
+    for byte in data:
+        if byte >= 0xf8:
+            continue  # real time, between the bytes of any message
+        if byte & 0x80:
+            status = byte
+            message = []
+            continue
+        message.append(byte)
+        size = 1 if 0xc0 <= status < 0xe0 else 2
+        if len(message) == size:
+            if status & 0xf0 == NOTE_ON and message[1] != 0:
+                count += 1
+            message = []
+    return count
+
+
+def clock_rate(samples, start_s, end_s):
+    """Clocks per second between two samples"""
+    return (samples[end_s][0] - samples[start_s][0])/(end_s - start_s)
+
+
+def run(seconds):
+    change_s = seconds/2
+    emu = emulator.Emulator(end_s=seconds)
+    first = pot_reading(FIRST_BPM)
+    second = pot_reading(SECOND_BPM)
+    emu.pot(emulator.RATE_POT, lambda t: first if t < change_s else second)
+    emu.press("Fnct", 0.6)
+    emu.tap("Ctrl", 0.7)  # profiler on
+    emu.tap("Ctrl", 0.9)
+    emu.release("Fnct", 1.0)
+    emu.tap("t", 1.5)
+    emu.press("g", 2.0)
+    emu.release("g", 2.5)
+    emu.tap("suite", 3.0)  # play
+    emu.tap("up", change_s + 1)  # next mode
+    emu.press("Fnct", seconds - 0.4)
+    emu.tap("Ctrl", seconds - 0.3)  # stats page
+    emu.release("Fnct", seconds - 0.2)
+
+    # clocks and screen transactions sent at every half second
+    samples = {}
+
+    def sample(t):
+        keyboard_config = emu.namespace.get('keyboard_config')
+        if keyboard_config is None:
+            return
+        samples[t] = (count_clocks(keyboard_config.uart.tx_data),
+                      keyboard_config.oled_display.spi.transactions)
+    half_seconds = int(seconds*2)
+    for i in range(1, half_seconds):
+        t = i/2
+        emu.at(t, lambda t=t: sample(t))
+
+    namespace = emu.run_main(keep_flash=True)
+    errors = []
+    error_file_name = os.path.join(emu.flash_dir, "error.txt")
+    if os.path.exists(error_file_name):
+        with open(error_file_name) as error_file:
+            errors.append(error_file.read().strip())
+    shutil.rmtree(emu.flash_dir)
+    errors.extend(repr(e) for e in emu.clock.thread_errors)
+
+    keyboard_config = namespace['keyboard_config']
+    tx_data = keyboard_config.uart.tx_data
+    # leave the filter a second to settle after a change
+    first_rate = clock_rate(samples, 1.0, change_s - 0.5)
+    second_rate = clock_rate(samples, change_s + 1.0, seconds - 0.5)
+    first_expected = FIRST_BPM*CLOCKS_PER_BEAT/60
+    second_expected = SECOND_BPM*CLOCKS_PER_BEAT/60
+    frames = samples[seconds - 0.5][1] - samples[1.0][1]
+
+    print('{:.1f} s of firmware, {} timer calls, {} bytes of MIDI'.format(
+        seconds, emu.clock.timer_calls, len(tx_data)))
+    print('  clocks {:.2f}/s at {} BPM (expected {:.2f}), {:.2f}/s at {} BPM (expected {:.2f})'.format(
+        first_rate, FIRST_BPM, first_expected, second_rate, SECOND_BPM, second_expected))
+    print('  {} note ons, {} screen transactions, rate {} BPM, mode {}'.format(
+        count_note_ons(tx_data), frames, keyboard_config.rate, keyboard_config.mode))
+    profiled = True
+    for section in (PROF_TIMER, PROF_KEYS, PROF_DISPLAY, PROF_SHOW, PROF_MIDI, PROF_LATENCY):
+        profiled = profiled and PROFILER.counts[section] > 0
+    print('  stats page shown: {}, profiled: {}'.format(keyboard_config.show_stats, profiled))
+    for error in errors:
+        print('  error:', error)
+
+    ok = abs(first_rate/first_expected - 1) < TOLERANCE and \
+        abs(second_rate/second_expected - 1) < TOLERANCE and \
+        count_note_ons(tx_data) >= 2 and frames > 0 and \
+        keyboard_config.mode == 1 and keyboard_config.show_stats and profiled and \
+        not errors
+    print('ok' if ok else 'FAIL')
+    return ok
+
+
+def main():
+    args = sys.argv[1:]
+    if '--core1' in args:
+        args.remove('--core1')
+        engine.ENGINE_ON_CORE1 = True
+    seconds = float(args[0]) if args else 10
+    return 0 if run(seconds) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
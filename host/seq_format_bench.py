@@ -0,0 +1,133 @@
+# Benchmark of the sequence files on 99 sequences: the text of the dict of
+# the previous versions (seq_N.csv, read with json.loads on the pico, which
+# accepts the int keys, ast.literal_eval stands in for it under CPython)
+# against the binary format of seqstore.py (seq_N.seq), loaded into a
+# Sequence and read in place into the preallocated records. The text files are
+# converted with migrate_text_sequences() and every sequence must load back
+# the same. Prints the file sizes, the time and the memory of a load (under
+# CPython the file object alone buffers 4 kB).
+# Run from anywhere with: python host/seq_format_bench.py [rounds]
+import os
+import random
+import sys
+import tempfile
+import time
+
+import hostenv
+hostenv.install()
+
+import seqstore  # noqa: E402
+from seqstore import LEN_INDEX  # noqa: E402
+from sequence import Sequence  # noqa: E402
+
+SEQUENCES = 99
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+if sys.implementation.name == 'micropython':
+    import json
+    parse_text = json.loads
+else:
+    import ast
+    parse_text = ast.literal_eval
+
+
+def random_sequence(rng):
+    length = rng.randrange(1, seqstore.MAX_PREALLOCATED_STEPS + 1)
+    notes = {LEN_INDEX: length}
+    for step in range(length):
+        if rng.randrange(3):
+            notes[step] = [rng.randrange(128), rng.randrange(1, 5)]
+    return notes
+
+
+def load_text(sequence_number):
+    sequence_file = open("seq_"+str(sequence_number)+".csv", "r")
+    output = sequence_file.readline()
+    sequence_file.close()
+    return parse_text(output)
+
+
+def read_in_place(store, sequence_number):
+    sequence_file = open(seqstore.sequence_file_name(sequence_number), "rb")
+    store.header.read(sequence_file)
+    seqstore.read_records(sequence_file, store.header.length, store.records)
+    sequence_file.close()
+
+
+def measure(name, function, rounds):
+    """Time and memory of one call of function(sequence_number), on average"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sequence_number in range(SEQUENCES):
+            function(sequence_number)
+    elapsed_us = (time.perf_counter() - start)*1e6/(rounds*SEQUENCES)
+    memory = ''
+    if tracemalloc is not None:
+        peak = 0
+        for sequence_number in range(SEQUENCES):
+            tracemalloc.start()
+            function(sequence_number)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        memory = ', peak memory {:6d} bytes'.format(peak)
+    print('  {:24s} {:7.1f} us per load{}'.format(name, elapsed_us, memory))
+    return elapsed_us
+
+
+def files_size(extension):
+    return sum(os.stat(name).st_size for name in os.listdir()
+               if name.endswith(extension))
+
+
+def bench(rounds):
+    rng = random.Random(1)
+    sequences = [random_sequence(rng) for _ in range(SEQUENCES)]
+    for sequence_number, notes in enumerate(sequences):
+        with open("seq_"+str(sequence_number)+".csv", "w") as sequence_file:
+            sequence_file.write(str(notes))
+    text_size = files_size('.csv')
+
+    print('{} sequences of 1 to {} steps'.format(SEQUENCES, seqstore.MAX_PREALLOCATED_STEPS))
+    text_us = measure('text', load_text, rounds)
+
+    start = time.perf_counter()
+    migrated = seqstore.migrate_text_sequences()
+    migrate_ms = (time.perf_counter() - start)*1000
+    binary_size = files_size('.seq')
+
+    store = seqstore.SequenceStore()
+    sequence = Sequence()
+    sequence_us = measure('binary, into a Sequence', lambda n: store.load(n, sequence), rounds)
+    in_place_us = measure('binary, records in place', lambda n: read_in_place(store, n), rounds)
+
+    same = True
+    for n in range(SEQUENCES):
+        store.load(n, sequence)
+        same = same and sequence == seqstore.notes_to_sequence(sequences[n])
+    print('  migrated {} files in {:.0f} ms, {} text files left'.format(
+        migrated, migrate_ms, len([n for n in os.listdir() if n.endswith('.csv')])))
+    print('  files: {} bytes as text, {} bytes as binary'.format(text_size, binary_size))
+    print('  in place load {:.1f}x faster than text, into a Sequence {:.1f}x'.format(
+        text_us/in_place_us, text_us/sequence_us))
+    ok = same and migrated == SEQUENCES
+    print('same sequences after migration: {}'.format('ok' if ok else 'FAIL'))
+    return ok
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            ok = bench(rounds)
+        finally:
+            os.chdir(hostenv.REPO_DIR)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
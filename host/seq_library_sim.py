@@ -0,0 +1,124 @@
+# Swap sequences on the slots of the multi sequencer during a performance
+# and count the files read thanks to the sequence library of seqstore.py.
+# 30 sequences are saved, then 500 loads pick mostly among a few of them,
+# as when a player switches between the parts of a song, through the
+# sharp_pressed() confirmation of KeyboardConfiguration. Every load must
+# give the sequence of the file and set the time division of the slot to
+# the one of the file, the library must stay within its budget,
+# the timer is never stopped, and a saved sequence must be read again.
+# Run from anywhere with: python host/seq_library_sim.py
+import os
+import random
+import sys
+import tempfile
+import time
+
+import hostenv
+hostenv.install()
+
+import seqstore  # noqa: E402
+from sequence import Sequence  # noqa: E402
+from keyboardConfiguration import KeyboardConfiguration, Mode  # noqa: E402
+
+SEQUENCES = 30
+LOADS = 500
+WORKING_SET = 6  # sequences of the song played most of the time
+
+
+def random_sequence(rng):
+    sequence = Sequence()
+    sequence.set_length(rng.randrange(16, 129))
+    for step in range(sequence.length):
+        if rng.randrange(3):
+            sequence.set_note(step, rng.randrange(128), rng.randrange(1, 5))
+    return sequence
+
+
+def file_sequence(sequence_number):
+    # a store of its own, read from the file
+    sequence = Sequence()
+    seqstore.SequenceStore(library_budget=0).load(sequence_number, sequence)
+    return sequence
+
+
+def perform():
+    rng = random.Random(1)
+    time_divs = [rng.randrange(8) for _ in range(SEQUENCES)]
+    for sequence_number in range(SEQUENCES):
+        seqstore.write_sequence(seqstore.sequence_file_name(sequence_number),
+                                random_sequence(rng), time_divs[sequence_number], 5)
+    files = [file_sequence(n) for n in range(SEQUENCES)]
+
+    keyboard_config = KeyboardConfiguration()
+    restarts = [0]
+    deinit = keyboard_config.play_note_timer.deinit
+
+    def counted_deinit():
+        restarts[0] += 1
+        deinit()
+    keyboard_config.play_note_timer.deinit = counted_deinit
+    keyboard_config.mode = Mode.MULTISEQUENCER
+    store = keyboard_config.sequence_store
+
+    same = True
+    hit_us = miss_us = 0
+    for _ in range(LOADS):
+        if rng.randrange(10) < 8:
+            sequence_number = rng.randrange(WORKING_SET)
+        else:
+            sequence_number = rng.randrange(SEQUENCES)
+        slot = rng.randrange(16)
+        keyboard_config.multi_sequence_highlighted = slot
+        keyboard_config.loading_multi_seq = True
+        keyboard_config.loading_multi_seq_number = sequence_number
+        reads = store.reads
+        start = time.perf_counter()
+        keyboard_config.sharp_pressed()
+        elapsed_us = (time.perf_counter() - start)*1e6
+        if store.reads == reads:
+            hit_us += elapsed_us
+        else:
+            miss_us += elapsed_us
+        same = same and keyboard_config.multi_sequence_notes[slot] == files[sequence_number] and \
+            keyboard_config.multi_sequence_time_div[slot] == time_divs[sequence_number]
+
+    library = store.library
+    print('{} loads of {} sequences: {} files read, {} from the library ({:.0f}%)'.format(
+        LOADS, SEQUENCES, store.reads, library.hits, 100*library.hits/LOADS))
+    # the file system of a PC is far faster than the flash of the pico
+    print('  sharp_pressed() {:.0f} us from the library, {:.0f} us from a file'.format(
+        hit_us/max(1, library.hits), miss_us/max(1, library.misses)))
+    print('  library {} bytes of {}, {} sequences'.format(
+        library.used, library.budget, len(library.entries)))
+
+    # an edit saved on a sequence of the library
+    keyboard_config.seq_notes.copy_from(files[0])
+    keyboard_config.seq_notes.set_note(0, 1, 1)
+    keyboard_config.save_sequence_file(0)
+    keyboard_config.multi_sequence_highlighted = 0
+    keyboard_config.loading_multi_seq = True
+    keyboard_config.loading_multi_seq_number = 0
+    keyboard_config.sharp_pressed()
+    saved = keyboard_config.multi_sequence_notes[0] == keyboard_config.seq_notes and \
+        file_sequence(0) == keyboard_config.seq_notes
+
+    ok = same and saved and library.used <= library.budget and restarts[0] == 0 and \
+        store.reads < LOADS//2
+    print('  same sequences as the files: {}, saved sequence read again: {}, timer restarts: {}'.format(
+        same, saved, restarts[0]))
+    print('ok' if ok else 'FAIL')
+    return ok
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            ok = perform()
+        finally:
+            os.chdir(hostenv.REPO_DIR)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# Record a 64 step sequence with KeyboardConfiguration on a virtual time line
+# and count the sequence file writes of the write behind storage
+# (seqstore.py) and the timer restarts, each step used to rewrite the whole
+# file between a timer deinit and init. The file left must hold the recorded
+# sequence, and a reset in the middle of a write must leave the previous
+# version of the file.
+# Run from anywhere with: python host/seq_store_sim.py
+import os
+import sys
+import tempfile
+import time
+
+import hostenv
+hostenv.install()
+
+import seqstore  # noqa: E402
+from sequence import Sequence  # noqa: E402
+from keyboardConfiguration import KeyboardConfiguration, Mode, PlayMode  # noqa: E402
+
+STEPS = 64
+STEP_MS = 250          # a step entered every quarter of a second
+PAUSE_AT_STEP = 32     # the player stops for a while in the middle
+PAUSE_MS = 5000
+MAIN_LOOP_MS = 10
+
+
+class VirtualTime:
+    def __init__(self):
+        self.now_ms = 0
+
+    def ticks_ms(self):
+        return self.now_ms & (hostenv.TICKS_PERIOD - 1)
+
+
+class Reset(Exception):
+    pass
+
+
+def read_sequence(sequence_number):
+    # a store of its own, the one of the keyboard would write first
+    sequence = Sequence()
+    seqstore.SequenceStore().load(sequence_number, sequence)
+    return sequence
+
+
+def record():
+    clock = VirtualTime()
+    time.ticks_ms = clock.ticks_ms
+    keyboard_config = KeyboardConfiguration()
+    timer = keyboard_config.play_note_timer
+    restarts = [0]
+    deinit = timer.deinit
+
+    def counted_deinit():
+        restarts[0] += 1
+        deinit()
+    timer.deinit = counted_deinit
+
+    keyboard_config.mode = Mode.SEQUENCER
+    keyboard_config.seq_number = 3
+    keyboard_config.play_mode = PlayMode.RECORDING
+    store = keyboard_config.sequence_store
+
+    def main_loop(duration_ms):
+        end_ms = clock.now_ms + duration_ms
+        while clock.now_ms < end_ms:
+            clock.now_ms += MAIN_LOOP_MS
+            store.poll()
+            # the timer does not run here, the notes are sent as it would
+            keyboard_config.midi.flush()
+
+    for step in range(STEPS):
+        if step % 4 == 3:
+            keyboard_config.blank_tile_pressed()
+        else:
+            note = 60 + step % 12
+            keyboard_config.note_on(note)
+            keyboard_config.note_off(note)
+        main_loop(PAUSE_MS if step == PAUSE_AT_STEP - 1 else STEP_MS)
+    main_loop(seqstore.WRITE_DELAY_MS + MAIN_LOOP_MS)
+
+    saved = read_sequence(3)
+    ok = True
+    # name, value, expected, value when each step rewrote the file
+    results = [
+        ('file writes', store.writes, 'at most 4', STEPS, store.writes <= 4),
+        ('timer restarts', restarts[0], 0, STEPS, restarts[0] == 0),
+        ('steps saved', saved.length, STEPS, STEPS, saved.length == STEPS),
+        ('same notes', saved == keyboard_config.seq_notes, True, True,
+         saved == keyboard_config.seq_notes),
+    ]
+    for name, value, expected, before, result in results:
+        ok = ok and result
+        print('  {:15s} {} (expected {}, {} before)'.format(name, value, expected, before))
+    print('recording {} steps: {}'.format(STEPS, 'ok' if ok else 'FAIL'))
+
+    # a reset between the write of the temporary file and the rename
+    before = read_sequence(3)
+    keyboard_config.blank_tile_pressed()
+    rename = os.rename
+
+    def reset_rename(src, dst):
+        raise Reset()
+    os.rename = reset_rename
+    try:
+        store.flush()
+    except Reset:
+        pass
+    finally:
+        os.rename = rename
+    kept = read_sequence(3) == before
+    print('reset during a write keeps the previous file: {}'.format('ok' if kept else 'FAIL'))
+    return ok and kept
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            ok = record()
+        finally:
+            os.chdir(hostenv.REPO_DIR)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# Compare the event scheduled tick engine of KeyboardConfiguration with the
+# former periodic timer running every one of the 240 ticks of a beat.
+# Both run the sequencer, the arpeggiator and the multi sequencer on a
+# virtual time line, the MIDI messages must be generated with the same
+# content at the same times, and the timer wakeups per beat are counted.
+# Run from anywhere with: python host/tick_engine_sim.py [bpm]
+import sys
+import time
+
+import hostenv
+hostenv.install()
+
+from midi import CONTEXT_MAIN, CONTEXT_TIMER  # noqa: E402
+from keyboardConfiguration import KeyboardConfiguration, Mode, PlayMode, TimeDiv, ArpMode, TICK_NUMERATOR  # noqa: E402
+from seqstore import notes_to_sequence, LEN_INDEX  # noqa: E402
+from sequence import Sequence  # noqa: E402
+
+BEATS = 16
+
+
+class VirtualTime:
+    def __init__(self):
+        self.now_us = 0
+
+    def ticks_us(self):
+        return self.now_us & (hostenv.TICKS_PERIOD - 1)
+
+
+def tick_time_us(index, bpm):
+    """Time of a tick, the first one is one tick after the timer started"""
+    return (index + 1)*TICK_NUMERATOR // (bpm*10)
+
+
+def setup(keyboard_config, scenario, gate):
+    keyboard_config.player_note_timer_gate_pertenth = gate
+    if scenario == 'sequencer':
+        keyboard_config.mode = Mode.SEQUENCER
+        keyboard_config.time_div = TimeDiv.ONE_SIXTEENTH
+        keyboard_config.seq_notes = notes_to_sequence({0: [60, 1], 1: [62, 2], 3: [67, 1], LEN_INDEX: 6})
+    elif scenario == 'arpeggiator':
+        keyboard_config.mode = Mode.ARPEGIATOR
+        keyboard_config.time_div = TimeDiv.ONE_EIGHTH_T
+        keyboard_config.arp_mode = ArpMode.INC
+        keyboard_config.arp_notes = [60, 64, 67]
+    else:
+        keyboard_config.mode = Mode.MULTISEQUENCER
+        keyboard_config.multi_sequence_notes = [Sequence() for _ in range(16)]
+        keyboard_config.multi_sequence_notes[0] = notes_to_sequence({0: [36, 1], 2: [38, 1], LEN_INDEX: 4})
+        keyboard_config.multi_sequence_notes[3] = notes_to_sequence({0: [60, 3], 1: [63, 1], LEN_INDEX: 5})
+        keyboard_config.multi_sequence_time_div[0] = TimeDiv.ONE_EIGHTH
+        keyboard_config.multi_sequence_time_div[3] = TimeDiv.ONE_SIXTEENTH_T
+        keyboard_config.multi_sequence_index_boundary = 5
+        keyboard_config._invalidate_multi_cache()
+        keyboard_config._update_active_channels()
+        keyboard_config._update_channel_timing_cache()
+    keyboard_config.play_mode = PlayMode.PLAYING
+    keyboard_config.play_note_timer_tenth_counter = 0
+
+
+def record_sends(keyboard_config, clock):
+    sent = []
+    midi = keyboard_config.midi
+    send = midi.send
+    send_realtime = midi.send_realtime
+
+    def recorded_send(status, data1, data2):
+        sent.append((clock.now_us, status, data1, data2))
+        send(status, data1, data2)
+
+    def recorded_send_realtime(status):
+        sent.append((clock.now_us, status))
+        send_realtime(status)
+    midi.send = recorded_send
+    midi.send_realtime = recorded_send_realtime
+    return sent
+
+
+def run_periodic(scenario, gate, bpm):
+    clock = VirtualTime()
+    time.ticks_us = clock.ticks_us
+    keyboard_config = KeyboardConfiguration()
+    # start again at the tempo, a running timer would keep its next tick
+    keyboard_config.deinit_timer()
+    keyboard_config.rate = bpm
+    keyboard_config.update_timer_frequency()
+    setup(keyboard_config, scenario, gate)
+    sent = record_sends(keyboard_config, clock)
+    for i in range(BEATS*240):
+        clock.now_us = tick_time_us(i, bpm)
+        keyboard_config.midi.context = CONTEXT_TIMER
+        keyboard_config._tick()
+        keyboard_config.midi.context = CONTEXT_MAIN
+    return sent, BEATS*240
+
+
+def run_events(scenario, gate, bpm):
+    clock = VirtualTime()
+    time.ticks_us = clock.ticks_us
+    keyboard_config = KeyboardConfiguration()
+    # start again at the tempo, a running timer would keep its next tick
+    keyboard_config.deinit_timer()
+    keyboard_config.rate = bpm
+    keyboard_config.update_timer_frequency()
+    setup(keyboard_config, scenario, gate)
+    sent = record_sends(keyboard_config, clock)
+    timer = keyboard_config.play_note_timer
+    end_us = tick_time_us(BEATS*240 - 1, bpm)
+    wakeups = 0
+    clock.now_us = timer.period_us
+    while clock.now_us <= end_us:
+        timer.callback(timer)
+        wakeups += 1
+        clock.now_us += timer.period_us
+    return sent, wakeups
+
+
+def main():
+    bpms = [int(arg) for arg in sys.argv[1:]] or [60, 120, 240]
+    failures = 0
+    for bpm in bpms:
+        for scenario in ('sequencer', 'arpeggiator', 'multi sequencer'):
+            for gate in (1, 5, 9):
+                periodic, periodic_wakeups = run_periodic(scenario, gate, bpm)
+                events, event_wakeups = run_events(scenario, gate, bpm)
+                ok = periodic == events
+                failures += not ok
+                print('{:3d} BPM {:16s} gate {}: {:4d} messages, {:5.1f} wakeups per beat instead of {} {}'.format(
+                    bpm, scenario, gate, len(events), event_wakeups/BEATS,
+                    periodic_wakeups//BEATS, 'ok' if ok else 'FAIL'))
+    print('{} failure(s)'.format(failures))
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,274 @@
+# Benchmark of KeyboardConfiguration.timer_callback in the four modes.
+# Each workload sets the keyboard up (long sequence, 10 note arpeggio in every
+# ArpMode, 16 multi sequencer channels with mixed time divisions...) and
+# calls the callback at the times it arms its timer for, on a virtual time
+# line given to keyboardConfiguration.py, so every run makes the same calls.
+# Only the duration of the calls is real, measured with time.perf_counter_ns
+# under CPython and time.ticks_us on the pico. On the pico the memory
+# allocated by each call is counted with gc.mem_alloc. Under CPython the
+# ints above 256 are objects, every call allocates, so the allocations are
+# null there.
+# The timer is a stand-in and the MIDI bytes go to a sink instead of the
+# UART, so nothing is sent and the real timer never fires.
+# Prints one JSON object per workload, to keep the results of each commit:
+# the latencies of the calls in us (p50, p99, max) against the length of a
+# tick, and the calls that allocated.
+# Run from anywhere with: python host/timer_bench.py [--table] [bpm]
+# or on the pico with: mpremote run host/timer_bench.py
+import gc
+import json
+import random
+import sys
+import time
+
+if sys.implementation.name != 'micropython':
+    import hostenv
+    hostenv.install()
+
+import keyboardConfiguration  # noqa: E402
+from keyboardConfiguration import KeyboardConfiguration, Mode, PlayMode, TimeDiv, ArpMode, TICK_NUMERATOR  # noqa: E402
+from keyboardConfiguration import ARP_MODE_TO_STR  # noqa: E402
+from sequence import Sequence  # noqa: E402
+
+BEATS = 16
+DEFAULT_BPM = 240
+LONG_SEQUENCE_STEPS = 256
+MULTI_SEQUENCE_STEPS = 64
+ARP_NOTES = 10
+
+
+class VirtualTime:
+    """time module of keyboardConfiguration.py during the benchmark"""
+
+    def __init__(self):
+        self.now_us = 0
+
+    def ticks_us(self):
+        return self.now_us & 0x3fffffff
+
+    def ticks_ms(self):
+        return (self.now_us // 1000) & 0x3fffffff
+
+    def ticks_add(self, ticks, delta):
+        return time.ticks_add(ticks, delta)
+
+    def ticks_diff(self, ticks1, ticks2):
+        return time.ticks_diff(ticks1, ticks2)
+
+
+class BenchTimer:
+    def __init__(self):
+        self.callback = None
+        self.period_us = 0
+
+    def init(self, mode=0, period=0, tick_hz=1_000_000, callback=None):
+        self.period_us = period*1_000_000//tick_hz
+        self.callback = callback
+
+    def deinit(self):
+        self.callback = None
+
+
+class SinkUart:
+    def __init__(self):
+        self.bytes_written = 0
+
+    def write(self, buf):
+        self.bytes_written += len(buf)
+        return len(buf)
+
+
+if sys.implementation.name == 'micropython':
+    def now_ns():
+        return time.ticks_us()*1000
+
+    def elapsed_ns(start, end):
+        return time.ticks_diff(end//1000, start//1000)*1000
+else:
+    now_ns = time.perf_counter_ns
+
+    def elapsed_ns(start, end):
+        return end - start
+
+
+def random_sequence(length, density):
+    sequence = Sequence()
+    sequence.set_length(length)
+    for step in range(0, length):
+        if random.randrange(100) < density:
+            sequence.set_note(step, 36 + random.randrange(48),
+                              1 + random.randrange(4), 64 + random.randrange(64))
+    return sequence
+
+
+def setup_basic(keyboard_config):
+    keyboard_config.mode = Mode.BASIC
+
+
+def setup_sequencer(keyboard_config):
+    keyboard_config.mode = Mode.SEQUENCER
+    keyboard_config.time_div = TimeDiv.ONE_THIRTYSECOND
+    keyboard_config.seq_notes = random_sequence(LONG_SEQUENCE_STEPS, 90)
+
+
+def setup_arpeggiator(arp_mode):
+    def setup(keyboard_config):
+        keyboard_config.mode = Mode.ARPEGIATOR
+        keyboard_config.time_div = TimeDiv.ONE_THIRTYSECOND
+        keyboard_config.arp_mode = arp_mode
+        keyboard_config.arp_notes = [48 + 3*i for i in range(ARP_NOTES)]
+    return setup
+
+
+def setup_multi_sequencer(keyboard_config):
+    keyboard_config.mode = Mode.MULTISEQUENCER
+    for channel in range(0, 16):
+        keyboard_config.multi_sequence_notes[channel] = random_sequence(
+            MULTI_SEQUENCE_STEPS, 60)
+        # every time division, the fastest twice
+        keyboard_config.multi_sequence_time_div[channel] = (
+            TimeDiv.ONE_THIRTYSECOND_T - channel % 8)
+    keyboard_config.multi_sequence_index_boundary = 1
+    keyboard_config._invalidate_multi_cache()
+    keyboard_config._update_active_channels()
+    keyboard_config._update_channel_timing_cache()
+
+
+def workloads():
+    yield 'basic', Mode.BASIC, setup_basic
+    yield 'sequencer', Mode.SEQUENCER, setup_sequencer
+    for arp_mode in range(0, len(ARP_MODE_TO_STR)):
+        yield 'arpeggiator ' + ARP_MODE_TO_STR[arp_mode], Mode.ARPEGIATOR, setup_arpeggiator(arp_mode)
+    yield 'multi sequencer', Mode.MULTISEQUENCER, setup_multi_sequencer
+
+
+def new_keyboard(bpm, setup, clock):
+    keyboard_config = KeyboardConfiguration()
+    # the real timer is stopped before the stand-in replaces it
+    keyboard_config.deinit_timer()
+    keyboard_config.play_note_timer = BenchTimer()
+    keyboard_config.midi.uart = SinkUart()
+    keyboard_config.rate = bpm
+    keyboard_config.player_note_timer_gate_pertenth = 5
+    random.seed(1)
+    setup(keyboard_config)
+    keyboard_config.play_mode = PlayMode.PLAYING
+    clock.now_us = 0
+    keyboard_config.update_timer_frequency()
+    return keyboard_config
+
+
+def run(bpm, setup, measure):
+    """Call the callback for BEATS beats, measure(function) calls it once and
+    returns what it measured"""
+    clock = VirtualTime()
+    keyboardConfiguration.time = clock
+    try:
+        keyboard_config = new_keyboard(bpm, setup, clock)
+        timer = keyboard_config.play_note_timer
+        end_us = BEATS*60_000_000//bpm
+        results = []
+        clock.now_us = timer.period_us
+        while clock.now_us <= end_us:
+            results.append(measure(timer))
+            clock.now_us += timer.period_us
+    finally:
+        keyboardConfiguration.time = time
+    return results
+
+
+def measure_time(timer):
+    callback = timer.callback
+    start = now_ns()
+    callback(timer)
+    return elapsed_ns(start, now_ns())
+
+
+def measure_allocation(timer):
+    callback = timer.callback
+    before = gc.mem_alloc()
+    callback(timer)
+    allocated = gc.mem_alloc() - before
+    # a collection during the call, not counted
+    return allocated if allocated > 0 else 0
+
+
+def allocations(bpm, setup):
+    """Bytes allocated by each call, None when not on the pico"""
+    if sys.implementation.name != 'micropython':
+        return None
+    gc.collect()
+    return run(bpm, setup, measure_allocation)
+
+
+def percentile(values, percent):
+    return values[min(len(values) - 1, len(values)*percent//100)]
+
+
+def commit():
+    if sys.implementation.name == 'micropython':
+        return None
+    import subprocess
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=hostenv.REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def bench(name, mode, setup, bpm, commit_id):
+    # a first run to warm up the caches of the keyboard and of the interpreter
+    run(bpm, setup, measure_time)
+    gc.collect()
+    if sys.implementation.name != 'micropython':
+        # the cycle collector of CPython has nothing to do with the pico
+        gc.disable()
+    try:
+        latencies = run(bpm, setup, measure_time)
+    finally:
+        gc.enable()
+    latencies.sort()
+    allocated = allocations(bpm, setup)
+    return {
+        'bench': 'timer_callback',
+        'workload': name,
+        'mode': mode,
+        'bpm': bpm,
+        'beats': BEATS,
+        'calls': len(latencies),
+        'tick_us': TICK_NUMERATOR/(bpm*10),
+        'p50_us': percentile(latencies, 50)/1000,
+        'p99_us': percentile(latencies, 99)/1000,
+        'max_us': latencies[-1]/1000,
+        'alloc_calls': None if allocated is None else len([a for a in allocated if a > 0]),
+        'alloc_bytes': None if allocated is None else sum(allocated),
+        'implementation': sys.implementation.name,
+        'commit': commit_id,
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    table = '--table' in args
+    bpms = [int(arg) for arg in args if arg != '--table'] or [DEFAULT_BPM]
+    commit_id = commit()
+    if table:
+        print('{:24s} {:>4s} {:>6s} {:>8s} {:>8s} {:>8s} {:>8s} {:>12s}'.format(
+            'workload', 'bpm', 'calls', 'p50 us', 'p99 us', 'max us', 'tick us', 'allocations'))
+    for bpm in bpms:
+        for name, mode, setup in workloads():
+            result = bench(name, mode, setup, bpm, commit_id)
+            if table:
+                if result['alloc_calls'] is None:
+                    allocated = '-'
+                else:
+                    allocated = '{:d} {:d}B'.format(result['alloc_calls'], result['alloc_bytes'])
+                print('{:24s} {:4d} {:6d} {:8.1f} {:8.1f} {:8.1f} {:8.1f} {:>12s}'.format(
+                    name, bpm, result['calls'], result['p50_us'], result['p99_us'],
+                    result['max_us'], result['tick_us'], allocated))
+            else:
+                print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
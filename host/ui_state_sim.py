@@ -0,0 +1,125 @@
+# Check the display drawn from the UiState snapshots of uistate.py.
+# The main loop of core 0 publishes the configuration while the display is
+# drawn on core 1: here the changes are published from inside the drawing,
+# between two widgets picked at random, to play every interleaving. The
+# state being drawn must not change during a drawing, even with two
+# publishes in it. After the passes asked for by is_refresh_needed(), the
+# screen must be the one drawn from scratch for the last configuration, so
+# no change is lost, and a pass without any publish must not draw again.
+# Run from anywhere with: python host/ui_state_sim.py [rounds]
+import random
+import sys
+
+import hostenv
+hostenv.install()
+
+from keyboardConfiguration import KeyboardConfiguration, MIN_BPM, MAX_BPM  # noqa: E402
+from OLED_SPI import OLED_1inch3  # noqa: E402
+from uistate import UiState  # noqa: E402
+
+ROUNDS = 500
+# most publishes come one at a time, some two in a row during a drawing
+PUBLISHES = (0, 0, 1, 1, 1, 2)
+
+
+def change(keyboard_config, rng):
+    """A change of the main loop, as by a key or a pot"""
+    what = rng.randrange(7)
+    if what == 0:
+        keyboard_config.rate = rng.randrange(MIN_BPM, MAX_BPM + 1)
+    elif what == 1:
+        keyboard_config.mode = rng.randrange(4)
+    elif what == 2:
+        keyboard_config.octave_offset = rng.randrange(-5, 6)
+    elif what == 3:
+        keyboard_config.multi_sequence_highlighted = rng.randrange(16)
+    elif what == 4:
+        keyboard_config.multi_sequence_index[rng.randrange(16)] = rng.randrange(-1, 100)
+    elif what == 5:
+        keyboard_config.arp_mode = rng.randrange(8)
+    else:
+        keyboard_config.hold = not keyboard_config.hold
+    keyboard_config.display()
+
+
+def values(state):
+    return [bytes(value) if name.startswith('multi_sequence') else value
+            for name, value in ((name, getattr(state, name)) for name in UiState.__slots__)]
+
+
+class Interleaver:
+    """Publishes changes when a widget of the display is about to draw"""
+
+    def __init__(self, keyboard_config, rng):
+        self.keyboard_config = keyboard_config
+        self.rng = rng
+        self.countdown = -1
+        self.publishes = 0
+        self.torn = 0  # drawings whose state changed under them
+
+    def arm(self):
+        self.countdown = self.rng.randrange(12)
+        self.publishes = self.rng.choice(PUBLISHES)
+
+    def hook(self, draw):
+        def hooked(oled, config):
+            if self.countdown == 0:
+                before = values(config)
+                for _ in range(0, self.publishes):
+                    change(self.keyboard_config, self.rng)
+                    self.keyboard_config.publish_display()
+                if values(config) != before:
+                    self.torn += 1
+            self.countdown -= 1
+            draw(oled, config)
+        return hooked
+
+
+def expected_frame(reference):
+    # a whole layout drawn by a display of its own
+    reference.current_layout = None
+    reference.display()
+    return bytes(reference.buffer)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+    rng = random.Random(1)
+    keyboard_config = KeyboardConfiguration()
+    oled = OLED_1inch3(keyboard_config)
+    keyboard_config.set_display(oled)
+    reference = OLED_1inch3(keyboard_config)
+    interleaver = Interleaver(keyboard_config, rng)
+    for layout in oled.layouts:
+        for widget in layout.widgets:
+            widget.draw = interleaver.hook(widget.draw)
+
+    passes = 0
+    redraws = 0
+    lost = 0
+    for _ in range(0, rounds):
+        change(keyboard_config, rng)
+        keyboard_config.publish_display()
+        while oled.is_refresh_needed():
+            interleaver.arm()
+            oled.display()
+            passes += 1
+        interleaver.countdown = -1
+        if bytes(oled.buffer) != expected_frame(reference):
+            lost += 1
+        # nothing published, nothing to draw
+        keyboard_config.publish_display()
+        if oled.is_refresh_needed():
+            redraws += 1
+
+    print('{} rounds, {} drawing passes, {} publishes'.format(
+        rounds, passes, keyboard_config.ui_states.generation >> 2))
+    print('  states changed while drawn: {}, frames missing a change: {}, redundant redraws: {}'.format(
+        interleaver.torn, lost, redraws))
+    ok = interleaver.torn == 0 and lost == 0 and redraws == 0
+    print('ok' if ok else 'FAIL')
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,28 @@
+# Host stand-in for the MicroPython ustruct module.
+import struct
+from struct import calcsize, unpack, unpack_from
+
+_SIGNED = 'bhilq'
+
+
+def _wrap(fmt, values):
+    # MicroPython does not range check integers, they are truncated to the
+    # size of the field. Repeat counts are not supported here.
+    codes = [c for c in fmt if c.isalpha() and c != 'x']
+    wrapped = []
+    for code, value in zip(codes, values):
+        if code.lower() in _SIGNED + 'n' and isinstance(value, int):
+            bits = 8 * calcsize(code)
+            value &= (1 << bits) - 1
+            if code in _SIGNED and value >= 1 << (bits - 1):
+                value -= 1 << bits
+        wrapped.append(value)
+    return wrapped
+
+
+def pack(fmt, *values):
+    return struct.pack(fmt, *_wrap(fmt, values))
+
+
+def pack_into(fmt, buffer, offset, *values):
+    struct.pack_into(fmt, buffer, offset, *_wrap(fmt, values))
@@ -1,13 +1,47 @@
 import machine
 from machine import Pin, Timer
-import ustruct
 from random import randrange
-import json
+import time
+from midi import MidiWriter, MidiParser, CC_MOD_WHEEL, CONTEXT_MAIN, CONTEXT_TIMER
+from midi import CLOCK, START, CONTINUE, STOP
+from seqstore import SequenceStore
+from sequence import Sequence, PlayedNotes
+from profiler import PROFILER, PROF_TIMER, PROF_LOAD, PROF_SAVE
+from uistate import UiStates
 
 MIN_BPM = 30
 MAX_BPM = 240
 
-LEN_INDEX = -1
+# drop repeated status bytes on the midi output, see midi.py. Off by default:
+# note offs are then sent as note ons of velocity 0, which some receivers
+# handle differently. Set it to True to send up to a third fewer bytes on
+# the wire once the receiver is known to take it.
+MIDI_RUNNING_STATUS = False
+
+# midi input on the uart rx (GP17). GP17 is also the boot exit button and the
+# rate led in main.py, so the input needs a board with GP17 wired to a midi
+# in circuit and those two moved elsewhere.
+# follow the clock, start, stop and continue received
+MIDI_INPUT_SYNC = False
+# send the channel messages received on the output
+MIDI_INPUT_THRU = False
+# the timer runs faster than the received clock and waits for it, speed in
+# tenths of the measured tempo
+EXTERNAL_SYNC_SPEED_TENTHS = 11
+# received clocks kept when the ticks are late, more are dropped
+MAX_EXTERNAL_CLOCK_CREDIT = 4
+
+# length of a tick in us is TICK_NUMERATOR / (rate*10)
+TICK_NUMERATOR = 2_500_000
+# shortest delay the tick timer is armed for
+TIMER_MIN_DELAY_US = 50
+# longest wait of the messages left in the midi rings after a pump
+MIDI_PUMP_INTERVAL_US = 1000
+# a main loop burst waits for room in its midi ring by steps of about a
+# message on the wire, the messages are dropped after the timeout (ticks
+# stopped by an error of the engine)
+MIDI_ROOM_WAIT_US = 1000
+MIDI_ROOM_TIMEOUT_MS = 500
 
 POT_MAX_VALUE = 42000
 POT_MIN_VALUE = 24000
@@ -211,12 +245,15 @@ class KeyboardConfiguration:
 
         # sequencer linked attributes
         # TODO
-        self.seq_len = 0
-        self.seq_notes = {}
+        self.seq_notes = Sequence()
+        # filled by the next load, then swapped with the sequence it replaces
+        self.spare_sequence = Sequence()
         self.current_seq_index = 0
         self.seq_number = 0
         self.seq_current_rec_notes = []
-        self.seq_played_notes = []
+        self.seq_played_notes = PlayedNotes()
+        # edited sequences are written later by the main loop
+        self.sequence_store = SequenceStore()
 
         self.loading_seq = False
         self.loading_seq_number = 0
@@ -238,8 +275,8 @@ class KeyboardConfiguration:
 
         self.multi_sequence_index = [-1]*16
         self.last_multi_seq_key_played = [-1]*16
-        self.multi_seq_played_notes = [[] for i in range(0, 16)]
-        self.multi_sequence_notes = [{LEN_INDEX: 0}]*16
+        self.multi_seq_played_notes = [PlayedNotes() for i in range(0, 16)]
+        self.multi_sequence_notes = [Sequence() for i in range(0, 16)]
         self.multi_sequence_highlighted = 0
         self.multi_sequence_global_index = 0
         self.multi_sequence_global_index_tst = 0
@@ -268,22 +305,45 @@ class KeyboardConfiguration:
         self._channel_timing_cache = {}  # Pre-computed timing values per channel
         self._channel_sequence_indices = [
             0] * 16  # Per-channel sequence indices
-        self._midi_message_queue = []  # MIDI message batching queue
-        self.MAX_BATCH_SIZE = 6  # Maximum MIDI messages to batch
+
+        # midi input, see MIDI_INPUT_SYNC and MIDI_INPUT_THRU
+        self.external_sync = MIDI_INPUT_SYNC
+        self.midi_thru = MIDI_INPUT_THRU
+        self.external_clock_credit = 0  # clocks received and not played yet
+        self.external_clock_count = 0
+        self.external_beat_start_us = 0
+        self.external_rate = 0  # 0 until a beat was measured
+        self.external_transport = 0  # last START, CONTINUE or STOP received
 
         self.uart = machine.UART(0, baudrate=31250, tx=Pin(16), rx=Pin(17))
+        self.midi_parser = None
+        if self.external_sync or self.midi_thru:
+            self.midi_parser = MidiParser(self)
+        self.midi = MidiWriter(
+            self.uart, running_status=MIDI_RUNNING_STATUS)
+        self.midi.make_room = self._make_midi_room
         self.led = Pin(25, machine.Pin.OUT)
 
         self.play_note_timer = Timer(-1)
-        self.update_timer_frequency()
+        # runs the ticks on core 1 instead of the timer, see engine.py
+        self.engine = None
+        # bound once, a bound method is allocated on each access
+        self._timer_callback = self.timer_callback
+        self.timer_woken = False
+        self.timer_running = False
         self.play_note_timer_tenth_counter = 0
+        self.update_timer_frequency()
         self.player_note_timer_gate_pertenth = 5
         self._update_gate_cache()
         self._update_active_channels()  # Initialize active channels
         if self._active_channels_list:
             self._update_channel_timing_cache()  # Initialize timing cache
         self.oled_display = None
-        self.display()
+        # the display shows the profiler stats instead of the mode
+        self.show_stats = False
+        # values shown by the display, published by publish_display()
+        self.ui_states = UiStates(self)
+        self.display_changed = False
 
     def set_led(self, led):
         self.rate_led = led
@@ -292,9 +352,15 @@ class KeyboardConfiguration:
     def set_display(self, oled_display):
         self.oled_display = oled_display
 
+    # the display is drawn from the values published by the main loop, the
+    # changes of a pass are published once at its end
     def display(self):
-        if self.oled_display != None:
-            self.oled_display.need_screen_refresh()
+        self.display_changed = True
+
+    def publish_display(self):
+        if self.display_changed:
+            self.display_changed = False
+            self.ui_states.publish(self)
 
     def _update_gate_cache(self):
         """Pre-calculate all gate timing offsets for performance"""
@@ -325,87 +391,70 @@ class KeyboardConfiguration:
         else:
             self._multi_time_div_cache[channel] = None
 
+    # The list of active channels and the timing cache are read by the ticks,
+    # which may run on core 1 (see engine.py): they are built aside and
+    # replaced with a single assignment, never changed in place. The ticks
+    # skip a channel missing from the timing cache, when they read the list
+    # and the cache of two updates.
     def _update_active_channels(self):
         """Update bitmask and list of channels with sequences"""
-        self._active_channels_mask = 0
-        self._active_channels_list.clear()
+        mask = 0
+        active_channels = []
 
         for i in range(16):
-            if (len(self.multi_sequence_notes[i]) > 1 and
-                    self.multi_sequence_notes[i][LEN_INDEX] > 0):
-                self._active_channels_mask |= (1 << i)
-                self._active_channels_list.append(i)
+            if (self.multi_sequence_notes[i].length > 0 and
+                    self.multi_sequence_notes[i].has_notes()):
+                mask |= (1 << i)
+                active_channels.append(i)
+        self._active_channels_mask = mask
+        self._active_channels_list = active_channels
 
     def _update_channel_timing_cache(self):
         """Pre-compute timing values for all active channels"""
-        self._channel_timing_cache.clear()
+        timing_cache = {}
         per_tenth = self.player_note_timer_gate_pertenth
 
         for channel in self._active_channels_list:
             t_div = self._get_multi_time_split(channel)
             gate_offset = self._get_gate_offset(t_div, per_tenth)
 
-            self._channel_timing_cache[channel] = {
+            timing_cache[channel] = {
                 't_div': t_div,
                 't_div_x10': t_div * 10,
                 'gate_offset': gate_offset,
-                'seq_len': self.multi_sequence_notes[channel][LEN_INDEX]
+                'seq_len': self.multi_sequence_notes[channel].length
             }
+        self._channel_timing_cache = timing_cache
 
-    def _process_channel_note_on(self, channel, _counter=None):
+    def _process_channel_note_on(self, channel, cache):
         """Process note-on for a specific channel"""
-        cache = self._channel_timing_cache[channel]
         if cache['seq_len'] == 0:
             return
 
         seq_index = int((self.multi_sequence_global_index_tst /
                         cache['t_div']) % cache['seq_len'])
 
-        if seq_index in self.multi_sequence_notes[channel]:
-            note_data = self.multi_sequence_notes[channel][seq_index]
-            note_to_play = [note_data[0], min(note_data[1], cache['seq_len'])]
-
-            self._queue_midi_message(0x90 + channel, note_to_play[0], 127)
-            self.multi_seq_played_notes[channel].append(note_to_play)
-
-    def _process_channel_note_off(self, channel):
-        """Process note-off for a specific channel using efficient list iteration"""
-        if not self.multi_seq_played_notes[channel]:
+        # a sequence loaded by the main loop is swapped in before the cache
+        # is updated, its steps may end before seq_len
+        sequence = self.multi_sequence_notes[channel]
+        if seq_index >= sequence.length:
             return
+        if sequence.has_note(seq_index):
+            note = sequence.note(seq_index)
+            if self.multi_seq_played_notes[channel].add(
+                    note, sequence.note_length(seq_index)):
+                self.midi.send(0x90 + channel, note,
+                               sequence.velocity(seq_index))
 
-        # Use reverse iteration to avoid index shifting during removal
-        for i in range(len(self.multi_seq_played_notes[channel]) - 1, -1, -1):
-            note = self.multi_seq_played_notes[channel][i]
-            note[1] -= 1
-            if note[1] <= 0:
-                self._queue_midi_message(0x80 + channel, note[0], 0)
-                self.multi_seq_played_notes[channel].pop(
-                    i)  # More efficient than remove()
-
-    def _queue_midi_message(self, status, data1, data2):
-        """Queue MIDI message for batch sending"""
-        self._midi_message_queue.append((status, data1, data2))
-
-        if len(self._midi_message_queue) >= self.MAX_BATCH_SIZE:
-            self._flush_midi_queue()
-
-    def _flush_midi_queue(self):
-        """Send all queued MIDI messages in one UART write"""
-        if not self._midi_message_queue:
+    def _process_channel_note_off(self, channel):
+        """Process note-off for a specific channel"""
+        played_notes = self.multi_seq_played_notes[channel]
+        if played_notes.count == 0:
             return
 
-        # Create one large buffer for all messages
-        total_size = len(self._midi_message_queue) * 3
-        batch_buffer = bytearray(total_size)
-
-        for i, (status, data1, data2) in enumerate(self._midi_message_queue):
-            offset = i * 3
-            batch_buffer[offset] = status
-            batch_buffer[offset + 1] = data1
-            batch_buffer[offset + 2] = data2
-
-        self.uart.write(batch_buffer)
-        self._midi_message_queue.clear()
+        played_notes.count_down()
+        for i in range(0, played_notes.expired_count):
+            self.midi.send(0x80 + channel, played_notes.expired[i], 0)
 
     def _on_sequence_loaded(self, channel):
         """Called when a sequence is loaded to a channel"""
@@ -413,136 +462,371 @@ class KeyboardConfiguration:
         if self._active_channels_list:
             self._update_channel_timing_cache()
 
+    # The timer is a one shot armed for the next tick with an event (note on,
+    # gate off, midi clock, led), the ticks in between do nothing and are run
+    # in a row when it fires, so the wakeups follow the musical events
+    # rather than the 240 ticks per beat. It is also woken early by the main
+    # loop to send its midi messages, see wake_timer().
     def timer_callback(self, timer):
+        self.midi.context = CONTEXT_TIMER
+        now = time.ticks_us()
+        delay = self.play_ticks(now)
+        self.midi.context = CONTEXT_MAIN
+        if delay < 0:
+            return
+        self._arm_timer(delay)
+        if PROFILER.enabled:
+            PROFILER.record(PROF_TIMER, now)
+
+    # the ticks due at now, returns the delay until the next event, -1 when
+    # an error stopped the ticks
+    def play_ticks(self, now):
+        self.timer_woken = False
         try:
-            if self.mode == Mode.BASIC:
-                pass
-            elif self.mode == Mode.SEQUENCER:
-                if self.play_mode == PlayMode.PLAYING:
-                    # set variable to compute ton and toff to make it more readable
-                    counter = self.play_note_timer_tenth_counter
-                    t_div = TIME_DIV_TO_SPLIT[self.time_div]
-                    per_tenth = self.player_note_timer_gate_pertenth
-                    gate_offset = self._get_gate_offset(t_div, per_tenth)
-
-                    if (counter % (t_div*10)) == 0:
-                        if self.current_seq_index in self.seq_notes:
-                            note_to_play = self.seq_notes[self.current_seq_index].copy(
-                            )
-                            note_to_play[0] = note_to_play[0] + \
-                                (self.transpose_key-60)
-                            # in the case we deleted too many note and a note is longer than the sequence:
-                            if note_to_play[1] > self.seq_len:
-                                note_to_play[1] = self.seq_len
-                            self.__send_note_on(note_to_play[0])
-                            self.seq_played_notes.append(note_to_play.copy())
-                        self.current_seq_index = (
-                            self.current_seq_index+1) % self.seq_len
-                    elif (counter + gate_offset) % (t_div*10) == 0:
-
-                        notes_to_remove = []
-                        for seq_played_note in self.seq_played_notes:
-                            seq_played_note[1] = seq_played_note[1] - 1
-                            if seq_played_note[1] <= 0:
-                                self.__send_note_off(seq_played_note[0])
-                                notes_to_remove.append(seq_played_note)
-
-                        for note_to_remove in notes_to_remove:
-                            self.seq_played_notes.remove(note_to_remove)
-            elif self.mode == Mode.ARPEGIATOR:
+            if self.midi_parser != None:
+                self.midi_parser.read(self.uart)
+            while time.ticks_diff(now, self.next_tick_us) >= 0:
+                if self.external_sync:
+                    self._external_clock_ticks()
+                else:
+                    self._tick()
+                self._advance_tick()
+            if self.external_sync or self.midi_parser != None:
+                # wait for the received clock and read the input every tick
+                skip = 0
+            else:
+                skip = self._ticks_to_next_event()
+            delay = time.ticks_diff(self._tick_deadline(skip), now)
+        except Exception as e:
+            if self.engine is not None:
+                # raised by the main loop, core 1 does not write the flash
+                self.engine.error = e
+            else:
+                self.deinit_timer()
+                append_error(e)
+            return -1
+        # single writer of the uart, for the messages of these ticks and the
+        # ones queued by the main loop, with what the wire sent since the
+        # last pump
+        self.midi.pump_after(time.ticks_diff(now, self.last_pump_us))
+        self.last_pump_us = now
+        if self.midi.pending() and delay > MIDI_PUMP_INTERVAL_US:
+            delay = MIDI_PUMP_INTERVAL_US
+        return delay
+
+    def _arm_timer(self, delay_us):
+        if self.engine is not None:
+            # the engine computes its deadline again
+            self.engine.wake()
+            return
+        if delay_us < TIMER_MIN_DELAY_US:
+            delay_us = TIMER_MIN_DELAY_US
+        self.play_note_timer.init(mode=Timer.ONE_SHOT, period=delay_us,
+                                  tick_hz=1_000_000, callback=self._timer_callback)
+
+    # called from the main loop, wakes the timer to send the midi messages
+    # queued by the main loop without waiting for the next event. Once the
+    # timer was stopped by an error the main loop pumps them itself.
+    def wake_timer(self):
+        if not self.midi.main_pending():
+            return
+        if not self.timer_running:
+            now = time.ticks_us()
+            self.midi.pump_after(time.ticks_diff(now, self.last_pump_us))
+            self.last_pump_us = now
+        elif not self.timer_woken:
+            self.timer_woken = True
+            self._arm_timer(0)
+
+    # called by the midi writer when a burst of the main loop fills its
+    # ring, waits for the timer or the engine to pump it, or pumps it once
+    # the timer is stopped
+    def _make_midi_room(self, ring):
+        start_ms = time.ticks_ms()
+        while True:
+            self.wake_timer()
+            if not ring.full() or \
+                    time.ticks_diff(time.ticks_ms(), start_ms) > MIDI_ROOM_TIMEOUT_MS:
+                return
+            time.sleep_us(MIDI_ROOM_WAIT_US)
+
+    # The ticks are scheduled on absolute ticks_us deadlines. A tick lasts
+    # TICK_NUMERATOR/tick_den us, the whole microseconds go in next_tick_us
+    # and the rest is carried in tick_frac, so the error never accumulates
+    # and the long run rate is exact.
+    # tick_den is set by the main loop, it is read once.
+    def _advance_tick(self):
+        tick_den = self.tick_den
+        frac = self.tick_frac + TICK_NUMERATOR
+        self.next_tick_us = time.ticks_add(
+            self.next_tick_us, frac // tick_den)
+        self.tick_frac = frac % tick_den
+
+    # deadline of the tick coming skip ticks after the next one
+    def _tick_deadline(self, skip):
+        return time.ticks_add(self.next_tick_us,
+                              (self.tick_frac + skip*TICK_NUMERATOR) // self.tick_den)
+
+    # called from the main loop, the first tick is played now
+    def _restart_ticks(self):
+        if self.engine is not None and self.timer_running:
+            # done by the engine between two of its passes
+            self.engine.restart()
+            return
+        self._reset_ticks()
+        if self.timer_running:
+            self._arm_timer(0)
+
+    def _reset_ticks(self):
+        self.play_note_timer_tenth_counter = 0
+        self.next_tick_us = time.ticks_us()
+        self.tick_frac = 0
+
+    # number of ticks without event from the current one, 0 if it has one
+    def _ticks_to_next_event(self):
+        counter = self.play_note_timer_tenth_counter
+        # midi clock, led and transport requests are on multiples of 10
+        skip = (-counter) % 10
+        if self.play_mode != PlayMode.PLAYING:
+            return skip
+        # note ons are on multiples of 10 too, gate offs are anywhere
+        if self.mode == Mode.SEQUENCER or self.mode == Mode.ARPEGIATOR:
+            t_div = TIME_DIV_TO_SPLIT[self.time_div]
+            gate_offset = self._get_gate_offset(
+                t_div, self.player_note_timer_gate_pertenth)
+            gate_skip = (-(counter + gate_offset)) % (t_div*10)
+            if gate_skip < skip:
+                skip = gate_skip
+        elif self.mode == Mode.MULTISEQUENCER:
+            timing_cache = self._channel_timing_cache
+            for channel in self._active_channels_list:
+                cache = timing_cache.get(channel)
+                if cache is None:
+                    continue
+                gate_skip = (-(counter + cache['gate_offset'])
+                             ) % cache['t_div_x10']
+                if gate_skip < skip:
+                    skip = gate_skip
+        return skip
+
+    # one of the 240 ticks of a beat, a midi clock is sent every 10 ticks
+    def _tick(self):
+        if self.mode == Mode.BASIC:
+            pass
+        elif self.mode == Mode.SEQUENCER:
+            if self.play_mode == PlayMode.PLAYING:
                 # set variable to compute ton and toff to make it more readable
                 counter = self.play_note_timer_tenth_counter
                 t_div = TIME_DIV_TO_SPLIT[self.time_div]
                 per_tenth = self.player_note_timer_gate_pertenth
                 gate_offset = self._get_gate_offset(t_div, per_tenth)
 
-                if self.play_mode == PlayMode.PLAYING:
-                    if (counter % (t_div*10)) == 0:
-                        if (len(self.arp_notes) != 0):
-                            # Cache arp note sorting to avoid recalculation
-                            if (self._cached_arp_notes != self.arp_notes or
-                                    self._cached_arp_mode != self.arp_mode):
-                                self._cached_arp_notes = self.arp_notes.copy()
-                                self._cached_arp_mode = self.arp_mode
-                                self._cached_arp_result = sort_notes_for_arp_mode(
-                                    self.arp_mode, self.arp_notes)
-
-                            arp_notes_mode = self._cached_arp_result
-
-                            if (self.current_arp_index > len(arp_notes_mode) - 1):
-                                self.current_arp_index = len(
-                                    arp_notes_mode) - 1
-                            if self.arp_mode == ArpMode.RAND:
-                                self.last_arp_key_played = arp_notes_mode[randrange(
-                                    0, len(arp_notes_mode))]
-                            else:
-                                self.last_arp_key_played = arp_notes_mode[self.current_arp_index]
-                            self.__send_note_on(self.last_arp_key_played)
-                            self.current_arp_index = (
-                                self.current_arp_index+1) % len(arp_notes_mode)
-                    elif (counter + gate_offset) % (t_div*10) == 0:
-                        if self.last_arp_key_played != -1:
-                            self.__send_note_off(self.last_arp_key_played)
-            elif self.mode == Mode.MULTISEQUENCER:
-
-                if self.play_mode == PlayMode.PLAYING:
-                    counter = self.play_note_timer_tenth_counter
-
-                    # Only process active channels with sequences
-                    for channel in self._active_channels_list:
-                        cache = self._channel_timing_cache[channel]
-                        t_div_x10 = cache['t_div_x10']
-                        gate_offset = cache['gate_offset']
-
-                        # Note ON timing - optimized with cached values
-                        if (counter % t_div_x10) == 0:
-                            self._process_channel_note_on(channel)
-
-                        # Note OFF timing - optimized with cached values
-                        if (counter + gate_offset) % t_div_x10 == 0:
-                            self._process_channel_note_off(channel)
-
-                    # Global index increment (only every 10th callback)
-                    if (counter % 10) == 0:
-                        self.multi_sequence_global_index_tst += 1
-
-                    # Flush any remaining MIDI messages at end of callback
-                    self._flush_midi_queue()
-
-            if self.request_midi_resume == True and self.play_note_timer_tenth_counter % 240 == 0:
-                self.request_midi_resume = False
-                self.__send_midi_continue()
-            elif self.request_midi_playing == True and self.play_note_timer_tenth_counter % 240 == 0:
-                self.request_midi_playing = False
-                self.__send_midi_start()
-
-            if self.play_note_timer_tenth_counter % 10 == 0:
-                self.__send_midi_clock()
+                if (counter % (t_div*10)) == 0:
+                    sequence = self.seq_notes
+                    step = self.current_seq_index
+                    if sequence.has_note(step):
+                        note = (sequence.note(step) +
+                                (self.transpose_key-60)) & 0x7f
+                        # note_length() is at most the sequence length in
+                        # the case we deleted too many notes
+                        if self.seq_played_notes.add(note, sequence.note_length(step)):
+                            self.__send_note_on(note, sequence.velocity(step))
+                    self.current_seq_index = (step+1) % sequence.length
+                elif (counter + gate_offset) % (t_div*10) == 0:
+                    played_notes = self.seq_played_notes
+                    played_notes.count_down()
+                    for i in range(0, played_notes.expired_count):
+                        self.__send_note_off(played_notes.expired[i])
+        elif self.mode == Mode.ARPEGIATOR:
+            # set variable to compute ton and toff to make it more readable
+            counter = self.play_note_timer_tenth_counter
+            t_div = TIME_DIV_TO_SPLIT[self.time_div]
+            per_tenth = self.player_note_timer_gate_pertenth
+            gate_offset = self._get_gate_offset(t_div, per_tenth)
 
-            if self.play_note_timer_tenth_counter % 240 == 0:
-                if self.rate_led != None:
-                    self.rate_led.on()
+            if self.play_mode == PlayMode.PLAYING:
+                if (counter % (t_div*10)) == 0:
+                    # replaced by the main loop, never changed in place
+                    arp_notes = self.arp_notes
+                    if (len(arp_notes) != 0):
+                        # Cache arp note sorting to avoid recalculation
+                        if (self._cached_arp_notes is not arp_notes or
+                                self._cached_arp_mode != self.arp_mode):
+                            self._cached_arp_notes = arp_notes
+                            self._cached_arp_mode = self.arp_mode
+                            self._cached_arp_result = sort_notes_for_arp_mode(
+                                self.arp_mode, arp_notes)
+
+                        arp_notes_mode = self._cached_arp_result
+
+                        if (self.current_arp_index > len(arp_notes_mode) - 1):
+                            self.current_arp_index = len(
+                                arp_notes_mode) - 1
+                        if self.arp_mode == ArpMode.RAND:
+                            self.last_arp_key_played = arp_notes_mode[randrange(
+                                0, len(arp_notes_mode))]
+                        else:
+                            self.last_arp_key_played = arp_notes_mode[self.current_arp_index]
+                        self.__send_note_on(self.last_arp_key_played)
+                        self.current_arp_index = (
+                            self.current_arp_index+1) % len(arp_notes_mode)
+                elif (counter + gate_offset) % (t_div*10) == 0:
+                    if self.last_arp_key_played != -1:
+                        self.__send_note_off(self.last_arp_key_played)
+        elif self.mode == Mode.MULTISEQUENCER:
 
-            if (self.play_note_timer_tenth_counter+20) % 120 == 0:
-                if self.rate_led != None:
-                    self.rate_led.off()
+            if self.play_mode == PlayMode.PLAYING:
+                counter = self.play_note_timer_tenth_counter
 
-            self.play_note_timer_tenth_counter = (
-                self.play_note_timer_tenth_counter+1) % 480
-        except Exception as e:
-            self.deinit_timer()
-            append_error(e)
+                # Only process active channels with sequences
+                timing_cache = self._channel_timing_cache
+                for channel in self._active_channels_list:
+                    cache = timing_cache.get(channel)
+                    if cache is None:
+                        continue
+                    t_div_x10 = cache['t_div_x10']
+                    gate_offset = cache['gate_offset']
+
+                    # Note ON timing - optimized with cached values
+                    if (counter % t_div_x10) == 0:
+                        self._process_channel_note_on(channel, cache)
+
+                    # Note OFF timing - optimized with cached values
+                    if (counter + gate_offset) % t_div_x10 == 0:
+                        self._process_channel_note_off(channel)
+
+                # Global index increment (only every 10th callback)
+                if (counter % 10) == 0:
+                    self.multi_sequence_global_index_tst += 1
+
+        if self.request_midi_resume == True and self.play_note_timer_tenth_counter % 240 == 0:
+            self.request_midi_resume = False
+            self.__send_midi_continue()
+        elif self.request_midi_playing == True and self.play_note_timer_tenth_counter % 240 == 0:
+            self.request_midi_playing = False
+            self.__send_midi_start()
+
+        if self.play_note_timer_tenth_counter % 10 == 0:
+            self.__send_midi_clock()
+
+        if self.play_note_timer_tenth_counter % 240 == 0:
+            if self.rate_led != None:
+                self.rate_led.on()
+
+        if (self.play_note_timer_tenth_counter+20) % 120 == 0:
+            if self.rate_led != None:
+                self.rate_led.off()
+
+        self.play_note_timer_tenth_counter = (
+            self.play_note_timer_tenth_counter+1) % 480
+
+    # with an external clock the ticks are still run by the timer, slightly
+    # faster than the external tempo, but a tick sending a midi clock waits
+    # for a received clock. If a clock is received before the ticks of the
+    # previous one are done, the late ticks are run at once.
+    def _external_clock_ticks(self):
+        # wait for the main loop to apply a received start, stop or continue
+        if self.external_transport != 0:
+            return
+        while True:
+            if self.play_note_timer_tenth_counter % 10 == 0:
+                if self.external_clock_credit == 0:
+                    return
+                self.external_clock_credit -= 1
+            self._tick()
+            if self.external_clock_credit == 0:
+                return
+
+    # handler of the midi parser, called from timer_callback
+    def midi_realtime(self, status):
+        if not self.external_sync:
+            return
+        if status == CLOCK:
+            now = time.ticks_us()
+            if self.external_clock_credit < MAX_EXTERNAL_CLOCK_CREDIT:
+                self.external_clock_credit += 1
+            # tempo measured over a beat of 24 clocks
+            self.external_clock_count += 1
+            if self.external_clock_count == 24:
+                beat_us = time.ticks_diff(now, self.external_beat_start_us)
+                if beat_us > 0:
+                    self.external_rate = (60_000_000 + beat_us//2) // beat_us
+                self.external_clock_count = 0
+                self.external_beat_start_us = now
+        elif status == START or status == CONTINUE or status == STOP:
+            if status == START:
+                self.play_note_timer_tenth_counter = 0
+            if status != STOP:
+                # the first clock after start or continue plays the next tick
+                self.external_clock_credit = 0
+            self.external_transport = status
+
+    def midi_message(self, status, data1, data2):
+        if self.midi_thru:
+            self.midi.send(status, data1, data2)
+
+    # called from the main loop, applies what the timer received
+    def update_external_sync(self):
+        if not self.external_sync:
+            return
+        transport = self.external_transport
+        if transport != 0:
+            self.external_transport = 0
+            if transport == START:
+                if self.play_mode != PlayMode.STOPPED:
+                    self.stop_pressed()
+                self.pauseplay_pressed()
+            elif transport == CONTINUE:
+                if self.play_mode != PlayMode.PLAYING:
+                    self.pauseplay_pressed()
+            elif self.play_mode == PlayMode.PLAYING:
+                self.pauseplay_pressed()
+        rate = self.external_rate
+        if rate < MIN_BPM:
+            rate = MIN_BPM
+        elif rate > MAX_BPM:
+            rate = MAX_BPM
+        if self.external_rate != 0 and rate != self.rate:
+            self.set_rate(rate)
 
     def update_timer_frequency(self):
-        period = (((60/self.rate)*1000)/240)
-        freq = 1/period
-        # self.play_note_timer.deinit()
-        # self.play_note_timer.init(period=int(((60/self.rate)*1000)/240), mode=Timer.PERIODIC, callback=self.timer_callback)
-        self.play_note_timer.init(
-            freq=freq*1000, mode=Timer.PERIODIC, callback=self.timer_callback)
+        # 60 s / (rate * 240 ticks) = 2_500_000 / (rate * 10) us per tick
+        if self.external_sync:
+            self.tick_den = self.rate*EXTERNAL_SYNC_SPEED_TENTHS
+        else:
+            self.tick_den = self.rate*10
+        if self.timer_running:
+            # the next tick keeps its deadline, the new tempo applies from
+            # the one after, so the phase of the clock is kept
+            self._arm_timer(time.ticks_diff(
+                self.next_tick_us, time.ticks_us()))
+        else:
+            self.start_timer()
+
+    def start_timer(self):
+        now = time.ticks_us()
+        self.next_tick_us = now
+        self.tick_frac = 0
+        self._advance_tick()
+        self.last_pump_us = now
+        self.timer_running = True
+        self._arm_timer(time.ticks_diff(self.next_tick_us, now))
 
     def deinit_timer(self):
-        self.play_note_timer.deinit()
+        self.timer_running = False
+        if self.engine is not None:
+            self.engine.stop()
+        else:
+            self.play_note_timer.deinit()
+        # nothing pumps the midi rings without the timer
+        self.midi.flush()
+
+    # the ticks are run by engine, on core 1, from now on
+    def set_engine(self, engine):
+        self.deinit_timer()
+        self.engine = engine
+        self.midi.use_core_contexts()
+        self.start_timer()
 
     def incr_octave_offset(self):
         self.octave_offset += 1
@@ -568,7 +852,8 @@ class KeyboardConfiguration:
         if self.mode == Mode.BASIC:
             pass
         elif self.mode == Mode.SEQUENCER:
-            self.seq_notes = self.load_sequence_file(self.seq_number)
+            self.seq_notes = self.load_sequence_file(
+                self.seq_number, self.seq_notes)
         elif self.mode == Mode.ARPEGIATOR:
             self.arp_len = 0  # reset arpegiator
             self.arp_notes = []
@@ -587,7 +872,8 @@ class KeyboardConfiguration:
         if self.mode == Mode.BASIC:
             pass
         elif self.mode == Mode.SEQUENCER:
-            self.seq_notes = self.load_sequence_file(self.seq_number)
+            self.seq_notes = self.load_sequence_file(
+                self.seq_number, self.seq_notes)
         elif self.mode == Mode.ARPEGIATOR:
             self.arp_len = 0  # reset arpegiator
             self.arp_notes = []
@@ -601,14 +887,8 @@ class KeyboardConfiguration:
             pass
         elif self.mode == Mode.SEQUENCER:
             if self.play_mode == PlayMode.RECORDING:
-                if len(self.seq_notes) > 0:
-
-                    self.seq_len -= 1
-                    self.seq_notes[LEN_INDEX] = self.seq_len
-
-                    if self.seq_len in self.seq_notes:
-                        self.seq_notes.pop(self.seq_len)
-
+                if self.seq_notes.length > 0:
+                    self.seq_notes.pop_step()
                     self.save_sequence_file(self.seq_number)
                     self.display()
         elif self.mode == Mode.ARPEGIATOR:
@@ -631,43 +911,32 @@ class KeyboardConfiguration:
                 self.keyboard_play_index = self.multi_sequence_highlighted
             self.display()
 
-    def set_rate_potentiometer(self, pot_value):
-        old_rate = self.rate
-        new_rate = ((pot_value/65536) * (MAX_BPM-MIN_BPM) + MIN_BPM)
-
-        if abs(new_rate - old_rate) > 0.7:
-            self.rate = int(new_rate)
-            if old_rate != self.rate:  # only refresh if rate really changed
-                self.update_timer_frequency()
-                self.display()
+    # the potentiometers are filtered and quantised by potfilter.PotFilter,
+    # these setters are only called when their value changed
+    def set_rate(self, rate):
+        if rate != self.rate:
+            self.rate = rate
+            self.update_timer_frequency()
+            self.display()
 
     # hex --> from 0 to 0x3fff, 0x2000 is the center, divided range by two on my setup
-    def set_pitch_potentiometer(self, pot_value):
-        # dec --> from 0 to 16383,  8192
-
-        old_pitch_bend = self.pitch_bend
-
-        new_pitch_bend = (
-            ((((pot_value-POT_MIN_VALUE)/POT_INTERVAL_VALUE)) * (0x3fff/2))+0x2000/2)
-
-        if abs(new_pitch_bend - old_pitch_bend) > 100:
-            self.pitch_bend = new_pitch_bend
-            self.__send_pitch_wheel(int(self.pitch_bend))
-            self.pitch_bend_counter = 0
-        else:
-            if self.pitch_bend_counter != -1:
-                self.pitch_bend_counter += 1
-                if self.pitch_bend_counter > 500:
-                    self.pitch_bend_counter = -1
-                    self.__send_pitch_wheel(0x2000)
+    def set_pitch_bend(self, pitch_bend):
+        self.pitch_bend = pitch_bend
+        self.__send_pitch_wheel(pitch_bend)
+        self.pitch_bend_counter = 0
 
-    def set_mod_potentiometer(self, pot_value):  # mod from 0 to 127
-        old_mod = self.mod
-        new_mod = (((pot_value-POT_MIN_VALUE)/POT_INTERVAL_VALUE) * 127)
+    # called on every sampling the pitch wheel did not move, the pitch bend
+    # goes back to the center once it has been idle for 500 samplings
+    def pitch_bend_idle(self):
+        if self.pitch_bend_counter != -1:
+            self.pitch_bend_counter += 1
+            if self.pitch_bend_counter > 500:
+                self.pitch_bend_counter = -1
+                self.__send_pitch_wheel(0x2000)
 
-        if abs(new_mod - old_mod) > 3:
-            self.mod = new_mod
-            self.__send_mod_wheel(int(self.mod))
+    def set_mod(self, mod):  # mod from 0 to 127
+        self.mod = mod
+        self.__send_mod_wheel(mod)
 
     def note_on(self, note):
         if self.mode == Mode.BASIC:
@@ -691,12 +960,11 @@ class KeyboardConfiguration:
                 self.__send_note_on(note)
             else:
                 self.arp_number_note_pressed += 1
-                if self.hold == False:
-                    self.arp_notes.append(note)
+                # a new list, the ticks may be reading the current one
+                if self.hold == True and self.arp_number_note_pressed == 1:
+                    self.arp_notes = [note]
                 else:
-                    if self.arp_number_note_pressed == 1:
-                        self.arp_notes = []
-                    self.arp_notes.append(note)
+                    self.arp_notes = self.arp_notes + [note]
         elif self.mode == Mode.MULTISEQUENCER:
 
             if self.keyboard_play_index != -1:
@@ -716,8 +984,7 @@ class KeyboardConfiguration:
                 # incr all note lenght
                 self.__send_note_off(note)
 
-                self.seq_len += 1
-                self.seq_notes[LEN_INDEX] = self.seq_len
+                self.seq_notes.append_step()
                 for seq_current_rec_notes in self.seq_current_rec_notes:
                     seq_current_rec_notes[1] = seq_current_rec_notes[1] + 1
 
@@ -729,8 +996,8 @@ class KeyboardConfiguration:
                         break
 
                 if note_to_remove != []:
-                    self.seq_notes[self.seq_len -
-                                   note_to_remove[1]] = note_to_remove
+                    self.seq_notes.set_note(self.seq_notes.length - note_to_remove[1],
+                                            note_to_remove[0], note_to_remove[1])
                     self.seq_current_rec_notes.remove(note_to_remove)
                 self.save_sequence_file(self.seq_number)
                 self.display()
@@ -742,41 +1009,46 @@ class KeyboardConfiguration:
                 self.arp_number_note_pressed -= 1
                 if self.hold == False:
                     if note in self.arp_notes:
-                        self.arp_notes.remove(note)
+                        arp_notes = list(self.arp_notes)
+                        arp_notes.remove(note)
+                        self.arp_notes = arp_notes
         elif self.mode == Mode.MULTISEQUENCER:
             if self.keyboard_play_index != -1:
                 # +1 since midi channel start to 1
                 self.__send_note_midi_off(note, self.keyboard_play_index+1)
 
-    def __send_note_on(self, note):
-        self.__send_note_midi_on(note, self.midi_channel)
+    def __send_note_on(self, note, velocity=127):
+        self.__send_note_midi_on(note, self.midi_channel, velocity)
 
     def __send_note_off(self, note):
         self.__send_note_midi_off(note, self.midi_channel)
 
-    # note on midi channel when doing uart.write:
+    # note on midi channel when sending:
     # midi channel usually goes from 1 to 16 (in the whole code and display)
     # but when sent it goes from 0 to 15, that's why when using
-    # uart.write(....) there is always midi_channel - 1
-    def __send_note_midi_on(self, note, midi_channel):
+    # self.midi there is always midi_channel - 1
+    def __send_note_midi_on(self, note, midi_channel, velocity=127):
         if note != -1:
             # print("__send_note_midi_on", note, midi_channel)
-            self.uart.write(ustruct.pack(
-                "bbb", 0x90+(midi_channel-1), note, 127))
+            self.midi.note_on(midi_channel-1, note, velocity)
             self.led.value(1)
 
+    def __send_played_notes_off(self, played_notes, midi_channel):
+        for i in range(0, played_notes.count):
+            self.__send_note_midi_off(played_notes.notes[i], midi_channel)
+        played_notes.clear()
+
     def __send_note_midi_off(self, note, midi_channel):
         if note != -1:
             # print("__send_note_midi_off", note, midi_channel)
-            self.uart.write(ustruct.pack(
-                "bbb", 0x80+(midi_channel-1), note, 0))
+            self.midi.note_off(midi_channel-1, note)
             self.led.value(0)
 
     def __send_all_note_off(self):
-        self.__send_all_note_midi_off(self.midi_channel-1)
+        self.__send_all_note_midi_off(self.midi_channel)
 
     def __send_all_note_midi_off(self, midi_channel):
-        self.uart.write(ustruct.pack("bbb", 0xb0+(midi_channel-1), 123, 0))
+        self.midi.all_notes_off(midi_channel-1)
         self.led.value(0)
 
     def __send_mod_wheel(self, mod_wheel_value):
@@ -784,39 +1056,44 @@ class KeyboardConfiguration:
             mod_wheel_value = 127
         elif mod_wheel_value < 0:
             mod_wheel_value = 0
-        self.uart.write(ustruct.pack(
-            "bbb", 0xb0+(self.midi_channel-1), 1, mod_wheel_value))
+        self.midi.control_change(
+            self.midi_channel-1, CC_MOD_WHEEL, mod_wheel_value)
 
     def __send_pitch_wheel(self, pitch_wheel_value):
-        if pitch_wheel_value > 0x3fff:
-            pitch_wheel_value = 0x3fff
-        elif pitch_wheel_value < 0:
-            pitch_wheel_value = 0
-        lsb = pitch_wheel_value & 0x7F
-        msb = (pitch_wheel_value >> 7) & 0x7F
-
-        self.uart.write(ustruct.pack(
-            "bbb", 0xe0+(self.midi_channel-1), lsb, msb))
+        self.midi.pitch_bend(self.midi_channel-1, pitch_wheel_value)
 
     def __send_midi_clock(self):
-        self.uart.write(ustruct.pack("b", 0xf8))
+        self.midi.clock()
 
     def __send_midi_start(self):
-        self.uart.write(ustruct.pack("b", 0xfa))
+        self.midi.start()
 
     def __send_midi_continue(self):
-        self.uart.write(ustruct.pack("b", 0xfb))
+        self.midi.resume()
 
     def __send_midi_stop(self):
-        self.uart.write(ustruct.pack("b", 0xfc))
+        self.midi.stop()
+
+    # hidden keys, see KEY_COMBOS in keylayout.py
+    def stats_pressed(self):
+        if not PROFILER.enabled:
+            PROFILER.reset()
+            PROFILER.enabled = True
+        self.show_stats = not self.show_stats
+        if self.show_stats:
+            PROFILER.dump()
+        self.display()
+
+    def stats_reset_pressed(self):
+        PROFILER.reset()
+        self.display()
 
     def blank_tile_pressed(self):
         if self.mode == Mode.BASIC:
             pass
         elif self.mode == Mode.SEQUENCER:
             if self.play_mode == PlayMode.RECORDING:  # TODO
-                self.seq_len += 1
-                self.seq_notes[LEN_INDEX] = self.seq_len
+                self.seq_notes.append_step()
 
                 # incr all note lenght
                 for seq_current_rec_notes in self.seq_current_rec_notes:
@@ -837,9 +1114,8 @@ class KeyboardConfiguration:
             self.__send_all_note_off()
         elif self.mode == Mode.SEQUENCER:  # TODO
             self.__send_midi_stop()
-            for seq_played_note in self.seq_played_notes:
-                self.__send_note_off(seq_played_note[0])
-            self.seq_played_notes = []
+            self.__send_played_notes_off(
+                self.seq_played_notes, self.midi_channel)
             self.__send_all_note_off()
             self.last_arp_key_played = -1
 
@@ -852,17 +1128,17 @@ class KeyboardConfiguration:
             self.multi_sequence_global_index = 0
             self.multi_sequence_global_index_tst = 0
             for i in range(0, 16):
-                if len(self.multi_seq_played_notes[i]) != 0:
-                    for seq_played_note in self.multi_seq_played_notes[i]:
-                        self.__send_note_midi_off(seq_played_note[0], i+1)
-                    self.multi_seq_played_notes[i] = []
+                self.__send_played_notes_off(
+                    self.multi_seq_played_notes[i], i+1)
             for i in range(0, 16):
                 # i+1 cause midi channel start on 1
                 self.__send_all_note_midi_off(i+1)
         self.display()
 
     def pauseplay_pressed(self):
-        self.play_note_timer_tenth_counter = 0
+        # with an external clock the position follows the received start
+        if not self.external_sync:
+            self._restart_ticks()
         if self.mode == Mode.BASIC:
             if self.play_mode != PlayMode.PLAYING:
                 if self.play_mode == PlayMode.PAUSING:
@@ -877,7 +1153,7 @@ class KeyboardConfiguration:
                     self.__send_note_off(self.last_arp_key_played)
         elif self.mode == Mode.SEQUENCER:  # TODO
             if self.play_mode != PlayMode.PLAYING:
-                if self.seq_len != 0:
+                if self.seq_notes.length != 0:
                     if self.play_mode == PlayMode.PAUSING:
                         self.request_midi_resume = True
                     else:
@@ -886,9 +1162,8 @@ class KeyboardConfiguration:
             else:
                 self.__send_midi_stop()
                 self.play_mode = PlayMode.PAUSING
-                for seq_played_note in self.seq_played_notes:
-                    self.__send_note_off(seq_played_note[0])
-                self.seq_played_notes = []
+                self.__send_played_notes_off(
+                    self.seq_played_notes, self.midi_channel)
                 self.__send_all_note_off()
                 self.last_seq_key_played = -1
         elif self.mode == Mode.ARPEGIATOR:
@@ -916,11 +1191,8 @@ class KeyboardConfiguration:
                     self.__send_midi_stop()
                     self.play_mode = PlayMode.PAUSING
                     for i in range(0, 16):
-                        if len(self.multi_seq_played_notes[i]) != 0:
-                            for seq_played_note in self.multi_seq_played_notes[i]:
-                                self.__send_note_midi_off(
-                                    seq_played_note[0], i+1)
-                            self.multi_seq_played_notes[i] = []
+                        self.__send_played_notes_off(
+                            self.multi_seq_played_notes[i], i+1)
                     for i in range(0, 16):
                         # i+1 cause midi channel start on 1
                         self.__send_all_note_midi_off(i+1)
@@ -932,9 +1204,8 @@ class KeyboardConfiguration:
         elif self.mode == Mode.SEQUENCER:
             # TODO remove the last next note off from the begging of the sequence to put it later in next step
             if self.play_mode != PlayMode.RECORDING:
-                for seq_played_note in self.seq_played_notes:
-                    self.__send_note_off(seq_played_note[0])
-                self.seq_played_notes = []
+                self.__send_played_notes_off(
+                    self.seq_played_notes, self.midi_channel)
                 self.__send_all_note_off()
             self.play_mode = PlayMode.RECORDING
         elif self.mode == Mode.ARPEGIATOR:
@@ -1062,7 +1333,8 @@ class KeyboardConfiguration:
             if self.loading_seq == True:  # confirm loading
                 self.loading_seq = False
                 self.seq_number = self.loading_seq_number
-                self.seq_notes = self.load_sequence_file(self.seq_number)
+                self.seq_notes = self.load_sequence_file(
+                    self.seq_number, self.seq_notes)
                 self.display()
         elif self.mode == Mode.ARPEGIATOR:
             pass
@@ -1070,12 +1342,13 @@ class KeyboardConfiguration:
             if self.loading_multi_seq == True:
                 self.loading_multi_seq = False
                 if self.loading_multi_seq_number == -1:
-                    self.multi_sequence_notes[self.multi_sequence_highlighted] = {
-                        LEN_INDEX: 0}
+                    self.multi_sequence_notes[self.multi_sequence_highlighted].clear()
                     self.multi_sequence_index[self.multi_sequence_highlighted] = -1
                 else:
                     self.multi_sequence_notes[self.multi_sequence_highlighted] = self.load_sequence_file(
-                        self.loading_multi_seq_number, False)
+                        self.loading_multi_seq_number,
+                        self.multi_sequence_notes[self.multi_sequence_highlighted], False,
+                        self.multi_sequence_highlighted)
                     self.multi_sequence_index[self.multi_sequence_highlighted] = self.loading_multi_seq_number
 
                 # Update active channels and timing cache after loading
@@ -1084,9 +1357,9 @@ class KeyboardConfiguration:
                 ppcm_index_list = []
                 index = 0
                 for sequence_notes in self.multi_sequence_notes:
-                    if sequence_notes[LEN_INDEX] > 1:
+                    if sequence_notes.length > 1:
                         ppcm_index_list.append(
-                            sequence_notes[LEN_INDEX]*timeDivToTimeSplit(self.multi_sequence_time_div[index]))
+                            sequence_notes.length*timeDivToTimeSplit(self.multi_sequence_time_div[index]))
                     index = index + 1
 
                 if len(ppcm_index_list) == 0:
@@ -1148,10 +1421,8 @@ class KeyboardConfiguration:
             pass
         elif self.mode == Mode.SEQUENCER:
             self.stop_pressed()
-            self.seq_len = 0
-            self.seq_notes = {}
+            self.seq_notes.clear()
             self.current_seq_index = 0
-            self.seq_notes[LEN_INDEX] = self.seq_len
             self.save_sequence_file(self.seq_number)
             self.display()
         elif self.mode == Mode.ARPEGIATOR:
@@ -1163,32 +1434,51 @@ class KeyboardConfiguration:
                 self.arp_number_note_pressed = 0
             self.display()
 
-    def load_sequence_file(self, sequence_number, stop=True):
-        # stop timer before loading
-        to_return_seq_notes = {LEN_INDEX: 0}
+    # The sequence is loaded in the spare one and returned to replace
+    # sequence, which becomes the spare one: the timer keeps playing sequence
+    # until the caller swaps them. It also keeps running, ticks delayed by
+    # the file access are caught up on their deadlines.
+    # channel is the multi sequencer channel the sequence is loaded on, -1
+    # for the sequencer
+    def load_sequence_file(self, sequence_number, sequence, stop=True, channel=-1):
+        profiling = PROFILER.enabled
+        if profiling:
+            start_us = time.ticks_us()
+        loaded = self.spare_sequence
         try:
-            self.play_note_timer.deinit()
-            sequence_file = open("seq_"+str(sequence_number)+".csv", "r")
-            output = sequence_file.readline()
-            sequence_file.close()
-            self.update_timer_frequency()
-
-            to_return_seq_notes = json.loads(output)
-            self.seq_len = to_return_seq_notes[LEN_INDEX]
-
+            # a sequence still waiting to be written is written first
+            self.sequence_store.load(sequence_number, loaded)
+            self.__apply_sequence_header(self.sequence_store.header, channel)
         except Exception as e:
             print("couldn't load sequence n°", sequence_number)
-            self.seq_len = 0
-            to_return_seq_notes = {LEN_INDEX: 0}
+            loaded.clear()
+        self.spare_sequence = sequence
         self.current_seq_index = 0
-        if self.seq_len == 0 and stop == True:
+        if loaded.length == 0 and stop == True:
             self.stop_pressed()
-        return to_return_seq_notes
+        if profiling:
+            PROFILER.record(PROF_LOAD, start_us)
+        return loaded
+
+    # time division and gate length the sequence was saved with, the gate
+    # is global on the multi sequencer and left as it is. A value out of
+    # range (NOT_SAVED of seqstore.py) keeps the current one.
+    def __apply_sequence_header(self, header, channel):
+        if header.time_div < len(TIME_DIV_TO_SPLIT):
+            if channel == -1:
+                self.time_div = header.time_div
+            else:
+                self.multi_sequence_time_div[channel] = header.time_div
+                self._invalidate_multi_cache(channel)
+        if channel == -1 and 1 <= header.gate <= 9:
+            self.player_note_timer_gate_pertenth = header.gate
 
     def save_sequence_file(self, sequence_number):
-        self.play_note_timer.deinit()
-        sequence_file = open("seq_"+str(sequence_number)+".csv", "w")
-        line = str(self.seq_notes)
-        sequence_file.write(line)
-        sequence_file.close()
-        self.update_timer_frequency()
+        profiling = PROFILER.enabled
+        if profiling:
+            start_us = time.ticks_us()
+        # written by the main loop once the edits pause, see seqstore.py
+        self.sequence_store.mark_dirty(sequence_number, self.seq_notes,
+                                       self.time_div, self.player_note_timer_gate_pertenth)
+        if profiling:
+            PROFILER.record(PROF_SAVE, start_us)
@@ -0,0 +1,158 @@
+import json
+from keymatrix import KEY_PRESSED, KEY_INDEX_MASK
+
+# Key layout of the Minitel matrix, compiled at boot into a flat dispatch
+# table indexed by key index (row*8 + col) so a key event resolves to a note
+# or a KeyboardConfiguration method with a single lookup.
+#
+# A layout file (json) can replace both maps without touching the scan code:
+# {"key_map": [[...8 names...], ...8 rows], "note_map": [[...8 notes...], ...]}
+# A note of 0 means the key is not a note and uses its name instead.
+
+DEFAULT_KEY_MAP = [
+    ["up", "t", "g", ".", "b", "guide", "Fnct", "connexion fin"],
+    ["correction", "e", "d", "Esc", "c", "z", "s", "x"],
+    ["annulation", "r", "f", ",", "v", "a", "q", "w"],
+    ["down", "y", "h", "'", "n", "sommaire", "Ctrl", "espace"],
+    ["shift", ";", "*", "suite", "0", "u", "j", "#"],
+    ["left", "-", "7", "retour", "8", "i", "k", "9"],
+    ["right", ":", "4", "envoi", "5", "o", "l", "6"],
+    ["enter", "?", "1", "répétition", "2", "p", "m", "3"]
+]
+
+DEFAULT_NOTE_MAP = [
+    [0, 65, 67, 60, 69, 0, 0, 0],
+    [0, 59, 61, 54, 63, 56, 58, 60],
+    [0, 62, 64, 57, 66, 53, 55, 57],
+    [0, 68, 70, 63, 72, 0, 52, 0],
+    [54, 66, 0, 0, 0, 71, 73, 0],
+    [0, 69, 0, 0, 0, 74, 76, 0],
+    [0, 72, 0, 0, 0, 77, 79, 0],
+    [0, 75, 0, 0, 0, 80, 82, 0]
+]
+
+# key name -> KeyboardConfiguration method called when the key is pressed
+KEY_COMMANDS = {
+    "right": "incr_octave_offset",
+    "left": "decr_octave_offset",
+    "up": "incr_mode",
+    "down": "decr_mode",
+    "guide": "rec_pressed",
+    "correction": "stop_pressed",
+    "suite": "pauseplay_pressed",
+    "envoi": "load_seq_pressed",
+    "enter": "blank_tile_pressed",
+    "sommaire": "midi_channel_gate_length_pressed",
+    "#": "sharp_pressed",
+    "*": "star_pressed",
+    "annulation": "clear_seq_hold_pressed",
+    "retour": "decr_arp_mode_kbp_transpose",
+    "répétition": "incr_arp_mode_undo_seq",
+    "connexion fin": "change_time_div_pressed",
+}
+
+# (key held, key pressed) -> KeyboardConfiguration method called instead of
+# the one of the key pressed
+KEY_COMBOS = {
+    ("Fnct", "Ctrl"): "stats_pressed",
+    ("Fnct", "annulation"): "stats_reset_pressed",
+}
+
+# key name -> note played as is, without octave offset
+KEY_FIXED_NOTES = {
+    "espace": 69,  # play A4 440Hz
+}
+
+KIND_NONE = 0
+KIND_NOTE = 1        # note shifted by the octave offset
+KIND_FIXED_NOTE = 2  # note played as is
+KIND_DIGIT = 3       # digit_pressed(value)
+KIND_COMMAND = 4     # bound method called on press
+
+KEY_UP = 0
+KEY_DOWN = 1
+KEY_CONSUMED = 2  # pressed as the second key of a combo
+
+
+def load_layout(path):
+    """Return the key map and note map of a layout file, missing maps use the default"""
+    with open(path, "r") as layout_file:
+        layout = json.loads(layout_file.read())
+    return layout.get("key_map", DEFAULT_KEY_MAP), layout.get("note_map", DEFAULT_NOTE_MAP)
+
+
+class KeyDispatcher:
+    def __init__(self, keyboard_config, key_map=DEFAULT_KEY_MAP, note_map=DEFAULT_NOTE_MAP):
+        self.keyboard_config = keyboard_config
+        self.kinds = bytearray(64)
+        self.values = [None]*64
+        # KEY_DOWN while a key is down, KEY_CONSUMED when its press was a
+        # combo, its release is then dropped
+        self.held = bytearray(64)
+        # key pressed index -> (key held index, bound method) of KEY_COMBOS
+        self.combos = [None]*64
+        self.compile(key_map, note_map)
+
+    def compile(self, key_map, note_map):
+        indexes = {}
+        for r in range(0, len(key_map)):
+            for c in range(0, len(key_map[r])):
+                index = r*8 + c
+                key = key_map[r][c]
+                note = note_map[r][c]
+                indexes[key] = index
+                if note != 0:
+                    self.kinds[index] = KIND_NOTE
+                    self.values[index] = note
+                elif key in KEY_FIXED_NOTES:
+                    self.kinds[index] = KIND_FIXED_NOTE
+                    self.values[index] = KEY_FIXED_NOTES[key]
+                elif key in KEY_COMMANDS:
+                    self.kinds[index] = KIND_COMMAND
+                    self.values[index] = getattr(
+                        self.keyboard_config, KEY_COMMANDS[key])
+                elif key.isdigit():
+                    self.kinds[index] = KIND_DIGIT
+                    self.values[index] = int(key)
+                else:
+                    self.kinds[index] = KIND_NONE
+                    self.values[index] = None
+
+        for (held, pressed), method in KEY_COMBOS.items():
+            if held in indexes and pressed in indexes:
+                self.combos[indexes[pressed]] = (
+                    indexes[held], getattr(self.keyboard_config, method))
+
+    def dispatch(self, event):
+        index = event & KEY_INDEX_MASK
+        kind = self.kinds[index]
+        value = self.values[index]
+        pressed = event & KEY_PRESSED != 0
+        if not pressed:
+            consumed = self.held[index] == KEY_CONSUMED
+            self.held[index] = KEY_UP
+            if consumed:
+                return
+        else:
+            combo = self.combos[index]
+            if combo is not None and self.held[combo[0]] != KEY_UP:
+                self.held[index] = KEY_CONSUMED
+                combo[1]()
+                return
+            self.held[index] = KEY_DOWN
+        if kind == KIND_NOTE:
+            value = value + self.keyboard_config.octave_offset*12
+            if pressed:
+                self.keyboard_config.note_on(value)
+            else:
+                self.keyboard_config.note_off(value)
+        elif kind == KIND_FIXED_NOTE:
+            if pressed:
+                self.keyboard_config.note_on(value)
+            else:
+                self.keyboard_config.note_off(value)
+        elif pressed:
+            if kind == KIND_COMMAND:
+                value()
+            elif kind == KIND_DIGIT:
+                self.keyboard_config.digit_pressed(value)
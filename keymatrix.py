@@ -0,0 +1,106 @@
+from machine import Pin
+from array import array
+import time
+
+# Keyboard matrix scanner.
+# The debounced state of the 64 keys is kept as one column bitmask byte per
+# row (a 64 bit int would not fit in a MicroPython small int and would be
+# allocated on every scan). Changes are found by XOR with the new scan and
+# pushed in a fixed size ring buffer of events, an event is a byte with the
+# key index (row*8 + col) and KEY_PRESSED set when the key went down.
+
+KEY_PRESSED = 0x80
+KEY_INDEX_MASK = 0x3f
+
+
+def event_row(event):
+    return (event & KEY_INDEX_MASK) >> 3
+
+
+def event_col(event):
+    return event & 0x07
+
+
+class KeyMatrixScanner:
+    def __init__(self, row_pins, col_pins, debounce_us=5000, queue_size=32):
+        self.rows = [Pin(pin, Pin.IN) for pin in row_pins]
+        self.cols = [Pin(pin, Pin.IN, Pin.PULL_UP) for pin in col_pins]
+        self.row_number = len(self.rows)
+        self.col_number = len(self.cols)
+
+        self.debounce_us = debounce_us
+        self.state = bytearray(self.row_number)
+        # time of the last accepted change of each key
+        self.last_change_us = array('I', [0]*(self.row_number*8))
+
+        # queue_size must be a power of two
+        self.queue_mask = queue_size - 1
+        self.event_keys = bytearray(queue_size)
+        self.event_times = array('I', [0]*queue_size)
+        self.head = 0
+        self.tail = 0
+        self.dropped_events = 0
+        self.last_event_us = 0
+
+    def read_row(self, r):
+        """Drive one row low and return the bitmask of the closed columns"""
+        row = self.rows[r]
+        row.init(Pin.OUT)
+        row.value(0)
+        bits = 0
+        cols = self.cols
+        for c in range(0, self.col_number):
+            if cols[c].value() == 0:
+                bits |= 1 << c
+        # put pin as input to have high z
+        row.init(Pin.IN)
+        return bits
+
+    def scan(self):
+        """Scan the matrix once and queue the debounced key changes"""
+        now = time.ticks_us()
+        for r in range(0, self.row_number):
+            self.update_row(r, self.read_row(r), now)
+
+    def update_row(self, r, bits, now):
+        changed = bits ^ self.state[r]
+        if changed == 0:
+            return
+        for c in range(0, self.col_number):
+            mask = 1 << c
+            if changed & mask:
+                key = r*8 + c
+                # ignore bounces following the last accepted change, a
+                # negative difference means the ticks wrapped since then
+                elapsed = time.ticks_diff(now, self.last_change_us[key])
+                if 0 <= elapsed < self.debounce_us:
+                    continue
+                self.last_change_us[key] = now
+                self.state[r] ^= mask
+                self.push(key | KEY_PRESSED if bits & mask else key, now)
+
+    def push(self, event, timestamp):
+        next_head = (self.head + 1) & self.queue_mask
+        if next_head == self.tail:
+            self.dropped_events += 1
+            return
+        self.event_keys[self.head] = event
+        self.event_times[self.head] = timestamp
+        self.head = next_head
+
+    def any(self):
+        return self.head != self.tail
+
+    def get(self):
+        """Pop the oldest event, its scan time is stored in last_event_us"""
+        event = self.event_keys[self.tail]
+        self.last_event_us = self.event_times[self.tail]
+        self.tail = (self.tail + 1) & self.queue_mask
+        return event
+
+    def stop(self):
+        for row in self.rows:
+            row.init(Pin.IN)
+
+    def is_pressed(self, r, c):
+        return self.state[r] & (1 << c) != 0
@@ -0,0 +1,126 @@
+import machine
+from machine import Pin
+from array import array
+from keymatrix import KeyMatrixScanner
+
+# Keyboard matrix scanned by a RP2040 PIO state machine.
+# The row and column pins are not contiguous, so the program drives the rows
+# through their pin directions: a TX DMA ring feeds it the pindirs mask of
+# each row in turn, the selected row is driven low (the others are high z)
+# and a snapshot of GPIO 0-29 is pushed to a RX DMA ring holding the last
+# snapshot of each row. The matrix is scanned continuously without the CPU,
+# scan() only decodes the 8 snapshots and feeds the changes to the debounce
+# and event queue of KeyMatrixScanner.
+
+PIO_FREQ = 1_000_000  # ~37 us per row
+GPIO_COUNT = 30
+GPIO_MASK = (1 << GPIO_COUNT) - 1
+
+RING_WORDS = 8  # one word per row, DMA rings wrap on a power of two
+RING_SIZE_LOG2 = 5  # 8 words of 4 bytes
+DMA_COUNT = 0xfffffff8  # multiple of the ring size, re-armed when done
+
+PIO0_BASE = 0x50200000
+SM0_PINCTRL = 0x0dc
+SM_STRIDE = 0x18
+PINCTRL_OUT_BASE_MASK = 0x1f
+PINCTRL_OUT_COUNT_SHIFT = 20
+PINCTRL_OUT_COUNT_MASK = 0x3f << PINCTRL_OUT_COUNT_SHIFT
+DREQ_PIO0_TX0 = 0
+DREQ_PIO0_RX0 = 4
+
+
+def _matrix_scan_program():
+    import rp2
+
+    @rp2.asm_pio(in_shiftdir=rp2.PIO.SHIFT_LEFT, out_shiftdir=rp2.PIO.SHIFT_RIGHT)
+    def matrix_scan():
+        pull(block)         # pindirs mask of the next row from the TX ring
+        out(pindirs, 30)    # drive that row low, the other rows are high z
+        nop()[31]           # let the lines settle
+        in_(null, 2)
+        in_(pins, 30)       # snapshot of GPIO 0-29
+        push(block)         # to the RX ring
+    return matrix_scan
+
+
+class PioKeyMatrixScanner(KeyMatrixScanner):
+    def __init__(self, row_pins, col_pins, debounce_us=5000, queue_size=32, sm_id=0, snapshots=None):
+        if len(row_pins) != RING_WORDS:
+            raise ValueError('PIO scanner needs 8 rows.')
+        super().__init__(row_pins, col_pins, debounce_us, queue_size)
+        self.row_masks = [1 << pin for pin in row_pins]
+        self.col_masks = [1 << pin for pin in col_pins]
+        self.sm_id = sm_id
+        self.ring_buffers = []
+        if snapshots is None:
+            self.start()
+        else:
+            # snapshots are written by something else, e.g. a simulation
+            self.snapshots = snapshots
+            self.sm = None
+
+    def aligned_ring(self, values):
+        import uctypes
+        buf = array('I', [0]*(2*RING_WORDS))
+        offset = ((-uctypes.addressof(buf)) & (RING_WORDS*4 - 1)) // 4
+        ring = memoryview(buf)[offset:offset+RING_WORDS]
+        for i in range(0, RING_WORDS):
+            ring[i] = values[i]
+        self.ring_buffers.append(buf)
+        return ring
+
+    def start(self):
+        import rp2
+        for row in self.rows:
+            row.init(Pin.ALT, alt=Pin.ALT_PIO0)
+        self.sm = rp2.StateMachine(self.sm_id, _matrix_scan_program(),
+                                   freq=PIO_FREQ, in_base=Pin(0))
+        # out pins cover every gpio but only the rows are given to the pio,
+        # so out(pindirs) does not disturb the other peripherals
+        pinctrl = PIO0_BASE + SM0_PINCTRL + self.sm_id*SM_STRIDE
+        value = machine.mem32[pinctrl] & (
+            0xffffffff ^ (PINCTRL_OUT_BASE_MASK | PINCTRL_OUT_COUNT_MASK))
+        machine.mem32[pinctrl] = value | (GPIO_COUNT << PINCTRL_OUT_COUNT_SHIFT)
+        self.sm.exec("mov(pins, null)")
+
+        self.row_mask_ring = self.aligned_ring(self.row_masks)
+        self.snapshots = self.aligned_ring([GPIO_MASK]*RING_WORDS)
+        self.dma_tx = rp2.DMA()
+        self.dma_rx = rp2.DMA()
+        self.arm_dma()
+        self.sm.active(1)
+
+    def arm_dma(self):
+        self.dma_rx.config(read=self.sm, write=self.snapshots, count=DMA_COUNT,
+                           ctrl=self.dma_rx.pack_ctrl(size=2, inc_read=False,
+                                                      treq_sel=DREQ_PIO0_RX0+self.sm_id,
+                                                      ring_size=RING_SIZE_LOG2, ring_sel=True),
+                           trigger=True)
+        self.dma_tx.config(read=self.row_mask_ring, write=self.sm, count=DMA_COUNT,
+                           ctrl=self.dma_tx.pack_ctrl(size=2, inc_write=False,
+                                                      treq_sel=DREQ_PIO0_TX0+self.sm_id,
+                                                      ring_size=RING_SIZE_LOG2, ring_sel=False),
+                           trigger=True)
+
+    def stop(self):
+        if self.sm is not None:
+            self.sm.active(0)
+            self.dma_tx.close()
+            self.dma_rx.close()
+        super().stop()
+
+    def scan(self):
+        # both rings stop on the same row once all the transfers are done
+        if self.sm is not None and not self.dma_tx.active() and not self.dma_rx.active():
+            self.arm_dma()
+        super().scan()
+
+    def read_row(self, r):
+        snapshot = self.snapshots[r]
+        col_masks = self.col_masks
+        bits = 0
+        for c in range(0, self.col_number):
+            if snapshot & col_masks[c] == 0:
+                bits |= 1 << c
+        return bits
@@ -5,7 +5,14 @@ import time
 import _thread
 
 from keyboardConfiguration import KeyboardConfiguration, append_error
+from keyboardConfiguration import MIN_BPM, MAX_BPM, POT_MIN_VALUE, POT_MAX_VALUE
 from OLED_SPI import OLED_1inch3
+from keymatrix import KeyMatrixScanner
+from keylayout import KeyDispatcher, load_layout
+from potfilter import PotFilter, PotSampler
+from seqstore import migrate_text_sequences
+from profiler import PROFILER, PROF_KEYS, PROF_LATENCY
+from engine import Engine, ENGINE_ON_CORE1
 
 from machine import freq
 freq(250_000_000, 250_000_000)
@@ -21,6 +28,16 @@ ROW_NUMBER = 8
 MAX_DELAY_BEFORE_SCREENSAVER_S = 300
 last_key_update = time.time()
 
+# refresh period of the profiler stats page
+STATS_REFRESH_MS = 500
+last_stats_refresh_ms = time.ticks_ms()
+
+SCREENSAVER_PERIOD_MS = 160
+last_screensaver_ms = 0
+
+# runs the ticks on core 1 with ENGINE_ON_CORE1, see engine.py
+engine = None
+
 
 # 0 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15
 # F E D C B A 9 8 7 6 5  4  3  2  1  0
@@ -39,155 +56,87 @@ col_list_pin = [15, 20, 21, 22, 7, 6, 5, 0]
 row_list_pin = [14, 13, 18, 19, 4, 3, 2, 1]
 # invertedd col_list_pin=[0,5,6,7,22,21,20,15]
 # inverted row_list_pin=[1,2,3,4,19,18,13,14]
-row_list = [0, 0, 0, 0, 0, 0, 0, 0]
-col_list = [0, 0, 0, 0, 0, 0, 0, 0]
-
-smooth_rate_potentiometer = -1
-smooth_mod_potentiometer = -1
-smooth_pitch_potentiometer = -1
-
-for x in range(0, ROW_NUMBER):
-    row_list[x] = Pin(row_list_pin[x], Pin.OUT)
-    row_list[x].value(1)
-
-
-for x in range(0, COL_NUMBER):
-    col_list[x] = Pin(col_list_pin[x], Pin.IN, Pin.PULL_UP)
-
-key_map = [
-    ["up", "t", "g", ".", "b", "guide", "Fnct", "connexion fin"],
-    ["correction", "e", "d", "Esc", "c", "z", "s", "x"],
-    ["annulation", "r", "f", ",", "v", "a", "q", "w"],
-    ["down", "y", "h", "'", "n", "sommaire", "Ctrl", "espace"],
-    ["shift", ";", "*", "suite", "0", "u", "j", "#"],
-    ["left", "-", "7", "retour", "8", "i", "k", "9"],
-    ["right", ":", "4", "envoi", "5", "o", "l", "6"],
-    ["enter", "?", "1", "répétition", "2", "p", "m", "3"]
-]
-
-note_map = [
-    [0, 65, 67, 60, 69, 0, 0, 0],
-    [0, 59, 61, 54, 63, 56, 58, 60],
-    [0, 62, 64, 57, 66, 53, 55, 57],
-    [0, 68, 70, 63, 72, 0, 52, 0],
-    [54, 66, 0, 0, 0, 71, 73, 0],
-    [0, 69, 0, 0, 0, 74, 76, 0],
-    [0, 72, 0, 0, 0, 77, 79, 0],
-    [0, 75, 0, 0, 0, 80, 82, 0]
-]
-
-key_state = [[0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [
-    0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0]]
-key_state_old = [[0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [
-    0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0]]
+
+# the pots are sampled at a fixed rate by a timer, the filters are updated
+# once per new sampling and read the average of the last 8 readings
+pot_sampler = PotSampler(
+    [rate_potentiometer, pitch_potentiometer, mod_potentiometer], freq=500)
+rate_channel, pitch_channel, mod_channel = pot_sampler.channels
+
+# deadbands are in raw ADC units: ~0.7 BPM, ~100 of pitch bend and ~3 of mod
+rate_filter = PotFilter(rate_channel, 0, 65536, MIN_BPM, MAX_BPM,
+                        shift=2, deadband=218)
+pitch_filter = PotFilter(pitch_channel, POT_MIN_VALUE, POT_MAX_VALUE,
+                         0x1000, 0x2fff, shift=1, deadband=220,
+                         limit_min=0, limit_max=0x3fff)
+mod_filter = PotFilter(mod_channel, POT_MIN_VALUE, POT_MAX_VALUE,
+                       0, 127, shift=1, deadband=425)
+
+# scan the key matrix with a PIO state machine instead of the CPU
+USE_PIO_KEY_SCANNER = False
+
+if USE_PIO_KEY_SCANNER:
+    from keymatrix_pio import PioKeyMatrixScanner
+    key_scanner = PioKeyMatrixScanner(row_list_pin, col_list_pin)
+else:
+    key_scanner = KeyMatrixScanner(row_list_pin, col_list_pin)
+
+# optional alternative key layout, see keylayout.py
+LAYOUT_FILE = "layout.json"
+
+# sequences saved as text by the previous versions, converted once
+if migrate_text_sequences() > 0:
+    print("Sequences converted to the binary format")
 
 keyboard_config = KeyboardConfiguration()
 OLED = OLED_1inch3(keyboard_config)
 keyboard_config.set_display(OLED)
 
+try:
+    key_dispatcher = KeyDispatcher(keyboard_config, *load_layout(LAYOUT_FILE))
+    print("Key layout loaded from", LAYOUT_FILE)
+except OSError:
+    key_dispatcher = KeyDispatcher(keyboard_config)
+
 
-def KeypadRead(cols, rows):
-    global key_state
-    global key_state_old
+def KeypadRead(scanner):
     global last_key_update
     global OLED
 
-    key_state = [[0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [
-        0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 0]]
-
-    for r in range(0, ROW_NUMBER):
-        # put pin as output
-        Pin(row_list_pin[r], Pin.OUT)
-        rows[r].value(0)
-        for c in range(0, COL_NUMBER):
-            if cols[c].value() == 0:
-                key_state[r][c] = 1
-
-            if (key_state[r][c] != key_state_old[r][c]):
-                last_key_update = time.time()
-                if OLED.is_screensaver() == True:
-                    OLED.reset_screensaver_mode()
-                key = key_map[r][c]
-                note = note_map[r][c]
-                if key_state[r][c] == 0:
-                    if (note != 0):
-                        keyboard_config.note_off(
-                            note+keyboard_config.octave_offset*12)
-                    else:
-                        customKeyOff(key)
-                else:
-                    if (note != 0):
-                        keyboard_config.note_on(
-                            note+keyboard_config.octave_offset*12)
-                    else:
-                        customKeyOn(key)
-        # put pin as input to have high z
-        Pin(row_list_pin[r], Pin.IN)
-
-    for x in range(0, COL_NUMBER):
-        for y in range(0, ROW_NUMBER):
-            key_state_old[x][y] = key_state[x][y]
+    profiling = PROFILER.enabled
+    if profiling:
+        start_us = time.ticks_us()
+    scanner.scan()
+    while scanner.any():
+        event = scanner.get()
+        last_key_update = time.time()
+        if OLED.is_screensaver() == True:
+            OLED.reset_screensaver_mode()
+        key_dispatcher.dispatch(event)
+        if profiling:
+            PROFILER.record(PROF_LATENCY, scanner.last_event_us)
+    if profiling:
+        PROFILER.record(PROF_KEYS, start_us)
 
 
 print("--- Ready to get user inputs ---")
 
 
-def customKeyOn(key):
-    global octaveOffset
-    if key == "right":
-        keyboard_config.incr_octave_offset()
-    elif key == "left":
-        keyboard_config.decr_octave_offset()
-    if key == "up":
-        keyboard_config.incr_mode()
-    elif key == "down":
-        keyboard_config.decr_mode()
-    elif key == "guide":
-        keyboard_config.rec_pressed()
-    elif key == "correction":
-        keyboard_config.stop_pressed()
-    elif key == "suite":
-        keyboard_config.pauseplay_pressed()
-    elif key == "envoi":
-        keyboard_config.load_seq_pressed()
-    elif key == "enter":
-        keyboard_config.blank_tile_pressed()
-    elif key == "sommaire":
-        keyboard_config.midi_channel_gate_length_pressed()
-    elif key == "#":
-        keyboard_config.sharp_pressed()
-    elif key == "*":
-        keyboard_config.star_pressed()
-    elif key == "annulation":
-        keyboard_config.clear_seq_hold_pressed()
-    elif key == "retour":
-        keyboard_config.decr_arp_mode_kbp_transpose()
-    elif key == "répétition":
-        keyboard_config.incr_arp_mode_undo_seq()
-    elif key == "connexion fin":
-        keyboard_config.change_time_div_pressed()
-    elif key == "espace":
-        keyboard_config.note_on(69)  # play A4 440Hz
-    elif key.isdigit():
-        keyboard_config.digit_pressed(int(key))
-
-
-def customKeyOff(key):
-    if key == "espace":
-        keyboard_config.note_off(69)
+def refresh_screen():
+    global OLED
+    global last_screensaver_ms
+    if OLED.is_screensaver() == True:
+        if time.ticks_diff(time.ticks_ms(), last_screensaver_ms) >= SCREENSAVER_PERIOD_MS:
+            last_screensaver_ms = time.ticks_ms()
+            OLED.update_screensaver()
+    elif OLED.is_refresh_needed():
+        OLED.display()
 
 
+# core 1, unless it runs the engine
 def refresh_screen_loop():
-    global OLED
-    index = 0
     while True:
-        if OLED.is_screensaver() == True:
-            index += 1
-            if index % 16 == True:
-                OLED.update_screensaver()
-                index = 0
-        elif (OLED.need_refresh_flag == True):
-            OLED.display()
+        refresh_screen()
         time.sleep(0.01)
 
 
@@ -197,42 +146,52 @@ if boot_exit_button.value() == 1:
         time.sleep(0.5)
         keyboard_config.set_led(Pin(17, Pin.OUT))
         keyboard_config.display()
-        _thread.start_new_thread(refresh_screen_loop, ())
+        if ENGINE_ON_CORE1:
+            engine = Engine(keyboard_config)
+            engine.start()
+        else:
+            _thread.start_new_thread(refresh_screen_loop, ())
         OLED.need_screen_refresh()
+        pot_sampler.start()
 
         while True:
             if time.time() - last_key_update > MAX_DELAY_BEFORE_SCREENSAVER_S and OLED.is_screensaver() == False:
                 OLED.set_screensaver_mode()
 
-            key = KeypadRead(col_list, row_list)
-            if smooth_rate_potentiometer == -1:
-                smooth_rate_potentiometer = (
-                    65536-rate_potentiometer.read_u16())
-            else:
-                smooth_rate_potentiometer = smooth_rate_potentiometer * \
-                    0.8 + 0.2*(65536-rate_potentiometer.read_u16())
-
-            if smooth_mod_potentiometer == -1:
-                smooth_mod_potentiometer = (65536-mod_potentiometer.read_u16())
-            else:
-                smooth_mod_potentiometer = smooth_mod_potentiometer * \
-                    0.5 + 0.5*(65536-mod_potentiometer.read_u16())
-
-            if smooth_pitch_potentiometer == -1:
-                smooth_pitch_potentiometer = (
-                    65536-pitch_potentiometer.read_u16())
-            else:
-                smooth_pitch_potentiometer = smooth_pitch_potentiometer * \
-                    0.5 + 0.5*(65536-pitch_potentiometer.read_u16())
-
-            keyboard_config.set_rate_potentiometer(smooth_rate_potentiometer)
-            keyboard_config.set_pitch_potentiometer(smooth_pitch_potentiometer)
-            keyboard_config.set_mod_potentiometer(smooth_mod_potentiometer)
+            KeypadRead(key_scanner)
+            keyboard_config.update_external_sync()
+            if keyboard_config.show_stats and \
+                    time.ticks_diff(time.ticks_ms(), last_stats_refresh_ms) >= STATS_REFRESH_MS:
+                last_stats_refresh_ms = time.ticks_ms()
+                keyboard_config.display()
+            if pot_sampler.fresh:
+                pot_sampler.fresh = False
+                # with an external clock the rate follows the received tempo
+                if rate_filter.update() and not keyboard_config.external_sync:
+                    keyboard_config.set_rate(rate_filter.output)
+                if pitch_filter.update():
+                    keyboard_config.set_pitch_bend(pitch_filter.output)
+                else:
+                    keyboard_config.pitch_bend_idle()
+                if mod_filter.update():
+                    keyboard_config.set_mod(mod_filter.output)
+            keyboard_config.wake_timer()
+            keyboard_config.sequence_store.poll()
+            keyboard_config.publish_display()
+            if engine is not None:
+                # the display is drawn when the main loop has nothing else
+                # to do
+                engine.check()
+                refresh_screen()
     except Exception as e:
         keyboard_config.deinit_timer()
+        keyboard_config.sequence_store.flush()
+        pot_sampler.stop()
+        key_scanner.stop()
         append_error(e)
 else:
     keyboard_config.deinit_timer()
+    key_scanner.stop()
     OLED.display_helixbyte()
     time.sleep(0.5)
     OLED.display_programming_mode()
@@ -0,0 +1,327 @@
+# MIDI output without allocation.
+# The messages are written in place in rings allocated once, so sending a
+# note or a clock from timer_callback never allocates and never triggers the
+# garbage collector. Channels are the ones sent on the wire, from 0 to 15.
+#
+# Every message goes through a transmit ring and only pump() writes to the
+# uart, it is called at the end of each timer_callback. The main loop and
+# the timer callback each have their own rings: the callback interrupts the
+# main loop but never the other way around, so every ring has a single
+# producer and a single consumer and needs no lock. pump() sends the System
+# Real-Time bytes (clock, start, continue, stop) ahead of the queued channel
+# messages, as the MIDI spec allows, and only hands the uart about what the
+# wire can carry until the next tick so a clock never waits behind a chord.
+# The timer rings drop what does not fit, the timer must not wait. A burst
+# of the main loop (all notes off of the 16 channels on stop...) must not
+# lose messages: when a main ring is full, send() calls make_room(ring),
+# which waits for the pump to free a slot.
+#
+# With running status the status byte is only sent when it differs from the
+# previous channel message, and note offs are sent as note ons of velocity 0
+# so that notes on a channel share one status. Real-Time bytes may be sent in
+# between without breaking the running status, as the MIDI spec says, so
+# only the channel messages update it.
+import time
+from profiler import PROFILER, PROF_MIDI
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+CONTROL_CHANGE = 0xb0
+PITCH_BEND = 0xe0
+
+CLOCK = 0xf8
+START = 0xfa
+CONTINUE = 0xfb
+STOP = 0xfc
+
+CC_MOD_WHEEL = 1
+CC_ALL_NOTES_OFF = 123
+
+MIDI_BYTES_PER_S = 3125  # 31250 bauds, 10 bits per byte
+
+CONTEXT_MAIN = 0
+CONTEXT_TIMER = 1
+# the context is the core sending, when the ticks run on core 1 (engine.py)
+CONTEXT_CORE = -1
+SIO_CPUID = 0xd0000000  # number of the core reading it
+
+
+def is_short_message(status):
+    """Program change and channel pressure have a single data byte"""
+    return status & 0xe0 == 0xc0
+
+
+class MessageRing:
+    """Single producer single consumer ring of messages of message_size bytes"""
+
+    def __init__(self, slots_log2, message_size):
+        slots = 1 << slots_log2
+        self.mask = slots - 1
+        self.message_size = message_size
+        self.data = bytearray(slots*message_size)
+        # views of each slot since slicing a memoryview allocates: the whole
+        # message, without its last data byte for the short messages
+        # (program change, channel pressure) and the same without the status
+        # byte for running status
+        data_mv = memoryview(self.data)
+        self.views = []
+        self.short_views = []
+        self.data_views = []
+        self.short_data_views = []
+        for i in range(0, slots):
+            start = i*message_size
+            end = start + message_size
+            self.views.append(data_mv[start:end])
+            if message_size > 1:
+                self.short_views.append(data_mv[start:end-1])
+                self.data_views.append(data_mv[start+1:end])
+                self.short_data_views.append(data_mv[start+1:end-1])
+        self.head = 0  # only written by the producer
+        self.tail = 0  # only written by the consumer
+        self.dropped = 0
+
+    def full(self):
+        return (self.head + 1) & self.mask == self.tail
+
+    def reserve(self):
+        """Offset of the next free message in data, -1 if the ring is full"""
+        if (self.head + 1) & self.mask == self.tail:
+            self.dropped += 1
+            return -1
+        return self.head*self.message_size
+
+    def commit(self):
+        self.head = (self.head + 1) & self.mask
+
+    def any(self):
+        return self.head != self.tail
+
+    def pop_view(self):
+        view = self.views[self.tail]
+        self.tail = (self.tail + 1) & self.mask
+        return view
+
+    def status(self):
+        """First byte of the oldest message"""
+        return self.data[self.tail*self.message_size]
+
+    def pop_channel_view(self, status, running_status):
+        """View of the oldest channel message as it goes on the wire"""
+        if is_short_message(status):
+            if status == running_status:
+                view = self.short_data_views[self.tail]
+            else:
+                view = self.short_views[self.tail]
+        elif status == running_status:
+            view = self.data_views[self.tail]
+        else:
+            view = self.views[self.tail]
+        self.tail = (self.tail + 1) & self.mask
+        return view
+
+
+class MidiWriter:
+    def __init__(self, uart, realtime_slots_log2=3, channel_slots_log2=5, running_status=False):
+        self.uart = uart
+        self.use_running_status = running_status
+        self.running_status = 0  # last status byte sent, 0 for none
+        # rings indexed by context
+        self.realtime_rings = [MessageRing(realtime_slots_log2, 1)
+                               for _ in range(0, 2)]
+        self.channel_rings = [MessageRing(channel_slots_log2, 3)
+                              for _ in range(0, 2)]
+        # set to CONTEXT_TIMER by timer_callback while it runs
+        self.context = CONTEXT_MAIN
+        self.mem32 = None
+        self.tx_budget = 3  # bytes of channel messages written per pump()
+        # make_room(ring) returns once a full main ring has room, or gave up
+        self.make_room = None
+
+    def use_core_contexts(self):
+        """Messages sent from core 0 go in the CONTEXT_MAIN rings, from
+        core 1 in the CONTEXT_TIMER ones"""
+        import machine
+        self.mem32 = machine.mem32
+        self.context = CONTEXT_CORE
+
+    def set_tick_rate(self, ticks_per_s):
+        """Give each pump() the bytes the wire sends during one tick"""
+        self.tx_budget = max(3, MIDI_BYTES_PER_S // ticks_per_s)
+
+    def pump_after(self, elapsed_us):
+        """pump() the bytes the wire sent in elapsed_us since the last one"""
+        if elapsed_us > 100_000:
+            elapsed_us = 100_000
+        self.tx_budget = max(3, elapsed_us*MIDI_BYTES_PER_S // 1_000_000)
+        self.pump()
+
+    def send(self, status, data1, data2):
+        """Queue a channel message, data2 is not sent for the short ones"""
+        context = self.context
+        if context == CONTEXT_CORE:
+            context = self.mem32[SIO_CPUID]
+        ring = self.channel_rings[context]
+        if context == CONTEXT_MAIN and self.make_room is not None and ring.full():
+            self.make_room(ring)
+        offset = ring.reserve()
+        if offset < 0:
+            return
+        data = ring.data
+        if self.use_running_status and status & 0xf0 == NOTE_OFF:
+            status = NOTE_ON | (status & 0x0f)
+            data2 = 0
+        data[offset] = status
+        data[offset + 1] = data1 & 0x7f
+        data[offset + 2] = data2 & 0x7f
+        ring.commit()
+
+    def send_realtime(self, status):
+        context = self.context
+        if context == CONTEXT_CORE:
+            context = self.mem32[SIO_CPUID]
+        ring = self.realtime_rings[context]
+        if context == CONTEXT_MAIN and self.make_room is not None and ring.full():
+            self.make_room(ring)
+        offset = ring.reserve()
+        if offset < 0:
+            return
+        ring.data[offset] = status
+        ring.commit()
+
+    def pump(self):
+        """Write the queued messages to the uart, realtime bytes first.
+        Only one context may pump: the timer callback, or the main loop
+        when the timer is stopped."""
+        profiling = PROFILER.enabled
+        if profiling:
+            start_us = time.ticks_us()
+        self.write_all(self.realtime_rings[CONTEXT_TIMER])
+        self.write_all(self.realtime_rings[CONTEXT_MAIN])
+        budget = self.write_some(
+            self.channel_rings[CONTEXT_TIMER], self.tx_budget)
+        self.write_some(self.channel_rings[CONTEXT_MAIN], budget)
+        if profiling:
+            PROFILER.record(PROF_MIDI, start_us)
+
+    def write_all(self, ring):
+        while ring.any():
+            self.uart.write(ring.pop_view())
+
+    def write_some(self, ring, budget):
+        while budget > 0 and ring.any():
+            status = ring.status()
+            if self.use_running_status:
+                view = ring.pop_channel_view(status, self.running_status)
+                self.running_status = status
+            else:
+                view = ring.pop_channel_view(status, 0)
+            self.uart.write(view)
+            budget -= len(view)
+        return budget
+
+    def pending(self):
+        for ring in self.realtime_rings:
+            if ring.any():
+                return True
+        for ring in self.channel_rings:
+            if ring.any():
+                return True
+        return False
+
+    def main_pending(self):
+        return self.realtime_rings[CONTEXT_MAIN].any() or \
+            self.channel_rings[CONTEXT_MAIN].any()
+
+    def flush(self):
+        """Write everything queued, the timer must be stopped"""
+        while self.pending():
+            self.pump()
+        # the output may stay idle for a while, the next message sends its
+        # status again for receivers that joined in the meantime
+        self.running_status = 0
+
+    def dropped(self):
+        count = 0
+        for ring in self.realtime_rings:
+            count += ring.dropped
+        for ring in self.channel_rings:
+            count += ring.dropped
+        return count
+
+    def note_on(self, channel, note, velocity=127):
+        self.send(NOTE_ON + channel, note, velocity)
+
+    def note_off(self, channel, note):
+        self.send(NOTE_OFF + channel, note, 0)
+
+    def control_change(self, channel, control, value):
+        self.send(CONTROL_CHANGE + channel, control, value)
+
+    def all_notes_off(self, channel):
+        self.send(CONTROL_CHANGE + channel, CC_ALL_NOTES_OFF, 0)
+
+    def pitch_bend(self, channel, value):
+        """value from 0 to 0x3fff, 0x2000 is the center"""
+        if value > 0x3fff:
+            value = 0x3fff
+        elif value < 0:
+            value = 0
+        self.send(PITCH_BEND + channel, value, value >> 7)
+
+    def clock(self):
+        self.send_realtime(CLOCK)
+
+    def start(self):
+        self.send_realtime(START)
+
+    def resume(self):
+        self.send_realtime(CONTINUE)
+
+    def stop(self):
+        self.send_realtime(STOP)
+
+
+class MidiParser:
+    """Parser of the bytes received on the midi input. It follows running
+    status, lets Real-Time bytes come between any two bytes and skips system
+    exclusive and system common messages. The handler is called with
+    handler.midi_realtime(status) and handler.midi_message(status, data1,
+    data2), data2 being 0 for the short messages."""
+
+    def __init__(self, handler, rx_size=32):
+        self.handler = handler
+        self.status = 0  # running status, 0 when there is none
+        self.data1 = -1  # first data byte received, -1 when there is none
+        self.rx_buf = bytearray(rx_size)
+
+    def feed(self, byte):
+        if byte >= 0xf8:
+            self.handler.midi_realtime(byte)
+        elif byte >= 0xf0:
+            # system exclusive and system common cancel running status,
+            # their data bytes are then ignored
+            self.status = 0
+            self.data1 = -1
+        elif byte & 0x80:
+            self.status = byte
+            self.data1 = -1
+        elif self.status != 0:
+            if is_short_message(self.status):
+                self.handler.midi_message(self.status, byte, 0)
+            elif self.data1 < 0:
+                self.data1 = byte
+            else:
+                self.handler.midi_message(self.status, self.data1, byte)
+                self.data1 = -1
+
+    def feed_buffer(self, buf, nbytes):
+        for i in range(0, nbytes):
+            self.feed(buf[i])
+
+    def read(self, uart):
+        """Parse the bytes waiting in the uart"""
+        while uart.any():
+            nbytes = uart.readinto(self.rx_buf)
+            if not nbytes:
+                return
+            self.feed_buffer(self.rx_buf, nbytes)
@@ -0,0 +1,129 @@
+# Integer filtering of the potentiometers.
+# Readings go through a fixed point exponential moving average, then through
+# a deadband around the value of the last accepted change, and are finally
+# scaled to the quantised output (BPM, 14 bits pitch bend, 7 bits CC).
+# update() only reports a change when that quantised output moves, so nothing
+# happens downstream while a pot is idle. Everything is done with small ints.
+#
+# PotSampler reads the ADCs from a periodic timer into a ring buffer per pot,
+# so the sampling rate does not depend on the main loop. Its channels have a
+# read_u16() returning the average of the ring and can be given to PotFilter
+# in place of the ADCs.
+from machine import Timer
+from array import array
+
+
+class PotFilter:
+    def __init__(self, adc, in_min, in_max, out_min, out_max, shift=2, deadband=0,
+                 oversample=1, invert=True, limit_min=None, limit_max=None):
+        self.adc = adc
+        # linear map from [in_min, in_max] to [out_min, out_max], clamped to
+        # [limit_min, limit_max] which default to the output range
+        self.in_min = in_min
+        self.in_range = in_max - in_min
+        self.out_min = out_min
+        self.out_range = out_max - out_min
+        self.limit_min = out_min if limit_min is None else limit_min
+        self.limit_max = out_max if limit_max is None else limit_max
+
+        self.shift = shift  # EMA weight of a new reading is 1/2**shift
+        self.deadband = deadband  # in raw units
+        self.oversample = oversample
+        self.invert = invert
+
+        self.acc = -1  # filtered value << shift, -1 before the first reading
+        self.value = 0  # filtered raw value
+        self.anchor = -1  # filtered raw value at the last accepted change
+        self.output = -1
+
+    def read_raw(self):
+        total = 0
+        for _ in range(0, self.oversample):
+            total += self.adc.read_u16()
+        raw = total // self.oversample
+        if self.invert:
+            raw = 65536 - raw
+        return raw
+
+    def quantise(self, value):
+        output = self.out_min + \
+            (value - self.in_min) * self.out_range // self.in_range
+        if output < self.limit_min:
+            return self.limit_min
+        if output > self.limit_max:
+            return self.limit_max
+        return output
+
+    def update(self):
+        """Sample the ADC, return True when the quantised output changed"""
+        raw = self.read_raw()
+        if self.acc < 0:
+            self.acc = raw << self.shift
+        else:
+            self.acc += raw - (self.acc >> self.shift)
+        self.value = self.acc >> self.shift
+
+        if self.anchor >= 0:
+            delta = self.value - self.anchor
+            if -self.deadband <= delta <= self.deadband:
+                return False
+        self.anchor = self.value
+
+        output = self.quantise(self.value)
+        if output == self.output:
+            return False
+        self.output = output
+        return True
+
+
+class SampledChannel:
+    def __init__(self, sampler, index):
+        self.sampler = sampler
+        self.index = index
+
+    def read_u16(self):
+        return self.sampler.average(self.index)
+
+
+class PotSampler:
+    def __init__(self, adcs, freq=500, ring_size_log2=3):
+        self.adcs = adcs
+        self.freq = freq
+        self.ring_size_log2 = ring_size_log2
+        self.ring_size = 1 << ring_size_log2
+        # ring of the last readings of each adc, one after the other
+        self.samples = array('H', [0]*(len(adcs)*self.ring_size))
+        self.sums = array('I', [0]*len(adcs))
+        self.ring_index = 0
+        # set by the timer on each sampling, cleared by the consumer
+        self.fresh = False
+        self.channels = [SampledChannel(self, i) for i in range(0, len(adcs))]
+        self.timer = Timer(-1)
+
+    def start(self):
+        # fill the rings with a first reading so the averages start right
+        for i in range(0, len(self.adcs)):
+            value = self.adcs[i].read_u16()
+            base = i << self.ring_size_log2
+            for j in range(0, self.ring_size):
+                self.samples[base + j] = value
+            self.sums[i] = value << self.ring_size_log2
+        self.fresh = True
+        self.timer.init(freq=self.freq, mode=Timer.PERIODIC,
+                        callback=self.sample)
+
+    def stop(self):
+        self.timer.deinit()
+
+    def sample(self, timer):
+        index = self.ring_index
+        for i in range(0, len(self.adcs)):
+            value = self.adcs[i].read_u16()
+            slot = (i << self.ring_size_log2) + index
+            self.sums[i] += value - self.samples[slot]
+            self.samples[slot] = value
+        self.ring_index = (index + 1) & (self.ring_size - 1)
+        self.fresh = True
+
+    def average(self, index):
+        return self.sums[index] >> self.ring_size_log2
@@ -0,0 +1,101 @@
+# Time spent in the parts of the firmware that may make it glitch.
+# Each section keeps its count, min, max and total duration in arrays
+# allocated once, so record() can be called from timer_callback without
+# allocating. A section is only recorded from one context at a time: the
+# timer callback interrupts the main loop but never the other way around.
+#
+#   profiling = PROFILER.enabled
+#   if profiling:
+#       start_us = time.ticks_us()
+#   ...
+#   if profiling:
+#       PROFILER.record(PROF_SHOW, start_us)
+#
+# enabled is read once, start_us is set whenever it is recorded. While the
+# profiler is disabled the instrumented code only tests enabled.
+# The profiler is disabled at boot unless PROFILING is set to True. The
+# Fnct + Ctrl keys enable it and show the stats on the OLED and print them
+# on the USB serial, it stays enabled once the page is closed. Fnct +
+# annulation resets the stats, see keylayout.py.
+from array import array
+import time
+
+# profile from the boot instead of from the first Fnct + Ctrl
+PROFILING = False
+
+PROF_TIMER = 0  # timer_callback
+PROF_KEYS = 1  # key scan and dispatch of the main loop
+PROF_DISPLAY = 2  # OLED_1inch3.display(), drawing and show()
+PROF_SHOW = 3  # OLED_1inch3.show(), frame sent on the SPI
+PROF_MIDI = 4  # MidiWriter.pump(), bytes written to the uart
+PROF_LOAD = 5  # load_sequence_file()
+PROF_SAVE = 6  # save_sequence_file()
+PROF_WRITE = 7  # sequence file written to the flash
+PROF_LATENCY = 8  # from the scan of a key change to the end of its dispatch
+PROF_NAMES = ("timer", "keys", "display", "show", "midi", "load", "save", "write",
+              "latency")
+
+NO_MIN = 0x3fffffff
+
+
+class Profiler:
+    def __init__(self, sections=len(PROF_NAMES)):
+        self.enabled = PROFILING
+        self.counts = array('I', bytes(4*sections))
+        self.mins = array('I', bytes(4*sections))
+        self.maxs = array('I', bytes(4*sections))
+        # whole seconds apart, the us stay small ints
+        self.totals_s = array('I', bytes(4*sections))
+        self.totals_us = array('I', bytes(4*sections))
+        self.reset()
+
+    def reset(self):
+        for section in range(0, len(self.counts)):
+            self.counts[section] = 0
+            self.mins[section] = NO_MIN
+            self.maxs[section] = 0
+            self.totals_s[section] = 0
+            self.totals_us[section] = 0
+
+    def record(self, section, start_us):
+        """A section started at start_us ends now"""
+        elapsed = time.ticks_diff(time.ticks_us(), start_us)
+        if elapsed < 0:
+            return
+        self.counts[section] += 1
+        if elapsed < self.mins[section]:
+            self.mins[section] = elapsed
+        if elapsed > self.maxs[section]:
+            self.maxs[section] = elapsed
+        total = self.totals_us[section] + elapsed
+        if total >= 1_000_000:
+            self.totals_s[section] += total // 1_000_000
+            total = total % 1_000_000
+        self.totals_us[section] = total
+
+    def average_us(self, section):
+        count = self.counts[section]
+        if count == 0:
+            return 0
+        return (self.totals_s[section]*1_000_000 + self.totals_us[section]) // count
+
+    def lines(self):
+        """Text of the stats, one line per section: name, count, min,
+        average and max in us"""
+        lines = []
+        for section in range(0, len(self.counts)):
+            count = self.counts[section]
+            lines.append("{:8s}{:>9d}{:>8d}{:>8d}{:>8d}".format(
+                PROF_NAMES[section], count,
+                self.mins[section] if count > 0 else 0,
+                self.average_us(section), self.maxs[section]))
+        return lines
+
+    def dump(self):
+        print("{:8s}{:>9s}{:>8s}{:>8s}{:>8s}".format("us", "count", "min", "avg", "max"))
+        for line in self.lines():
+            print(line)
+
+
+# shared by the modules of the firmware
+PROFILER = Profiler()
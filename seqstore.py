@@ -0,0 +1,367 @@
+# Storage of the sequences.
+#
+# A sequence is saved in seq_N.seq, a packed binary file:
+# - an 8 bytes header: b"SQ", the format version, the size of a step record
+#   in bytes, the number of steps (uint16), the time division and the gate
+#   length in tenths the sequence was recorded with, applied when it is
+#   loaded (to its channel on the multi sequencer), NOT_SAVED if unknown
+# - one 4 bytes record per step: the note (NO_NOTE for a step where no note
+#   starts), its velocity (a reserved byte in version 1, read as
+#   DEFAULT_VELOCITY), and the length of the note in steps (uint16)
+# Numbers are little endian, as the RP2040, so the records are read directly
+# into an array('H') allocated once, without parsing: two words per step,
+# the note in the low byte of the first one, then copied into the columns of
+# a Sequence (sequence.py).
+# The sequences used to be saved as the text of the dict in seq_N.csv,
+# migrate_text_sequences() converts them once at boot.
+#
+# Write behind: recording changes the sequence on every step. Instead of
+# writing the whole file each time, an edit only marks the sequence dirty,
+# and poll(), called from the main loop when it is idle, writes it once no
+# edit came for write_delay_ms: a recording gives a few writes instead of
+# one per step. The timer is never stopped, ticks delayed by a write are
+# caught up on their deadlines.
+# A file is written under a temporary name first and then renamed over the
+# old one, so a reset during a write leaves the previous version in place.
+#
+# The sequences loaded last are kept in a SequenceLibrary, within a budget
+# of bytes, so swapping sequences during a performance does not read the
+# flash again. Marking a sequence dirty drops it from the library.
+from array import array
+import os
+import time
+from sequence import Sequence, DEFAULT_VELOCITY, STEP_BYTES
+from profiler import PROFILER, PROF_WRITE
+
+# key of the number of steps in the sequence dicts of the text files
+LEN_INDEX = -1
+
+SEQUENCE_MAGIC = b"SQ"
+SEQUENCE_VERSION = 2
+HEADER_SIZE = 8
+RECORD_SIZE = 4
+NO_NOTE = 0xff
+# steps of the records allocated once, longer sequences allocate their own
+MAX_PREALLOCATED_STEPS = 256
+
+# time division or gate of the header that was not saved, the settings of
+# the keyboard are kept when the sequence is loaded
+NOT_SAVED = 0xff
+
+# quiet time after the last edit before the sequence is written
+WRITE_DELAY_MS = 2000
+
+# bytes of the sequences kept in the library
+LIBRARY_BUDGET = 8192
+# bytes of a sequence in the library besides its steps
+LIBRARY_ENTRY_BYTES = 128
+
+
+def sequence_file_name(sequence_number):
+    return "seq_"+str(sequence_number)+".seq"
+
+
+def new_records(steps):
+    """Records of a sequence of steps steps, two words per step"""
+    return array('H', bytes(steps*RECORD_SIZE))
+
+
+class SequenceHeader:
+    def __init__(self):
+        self.data = bytearray(HEADER_SIZE)
+        self.version = SEQUENCE_VERSION
+        self.length = 0
+        self.time_div = 0
+        self.gate = 0
+
+    def read(self, sequence_file):
+        data = self.data
+        if sequence_file.readinto(data) != HEADER_SIZE or \
+                data[0] != SEQUENCE_MAGIC[0] or data[1] != SEQUENCE_MAGIC[1]:
+            raise ValueError("not a sequence file")
+        if data[2] < 1 or data[2] > SEQUENCE_VERSION or data[3] != RECORD_SIZE:
+            raise ValueError("unknown sequence file version")
+        self.version = data[2]
+        self.length = data[4] | (data[5] << 8)
+        self.time_div = data[6]
+        self.gate = data[7]
+
+    def write(self, sequence_file, length, time_div, gate):
+        data = self.data
+        data[0] = SEQUENCE_MAGIC[0]
+        data[1] = SEQUENCE_MAGIC[1]
+        data[2] = SEQUENCE_VERSION
+        data[3] = RECORD_SIZE
+        data[4] = length & 0xff
+        data[5] = length >> 8
+        data[6] = time_div
+        data[7] = gate
+        sequence_file.write(data)
+
+
+def read_records(sequence_file, length, records):
+    """Fill records in place with the length steps following the header,
+    records must hold them, see new_records()"""
+    size = length*RECORD_SIZE
+    if len(records)*2 < size:
+        raise ValueError("sequence too long for the records")
+    if size == 0:
+        return
+    if len(records)*2 == size:
+        read = sequence_file.readinto(records)
+    else:
+        read = sequence_file.readinto(memoryview(records)[0:size >> 1])
+    if read != size:
+        raise ValueError("truncated sequence file")
+
+
+def records_to_sequence(records, length, version, sequence):
+    """Fill sequence with the steps of the records"""
+    sequence.clear()
+    sequence.set_length(length)
+    for step in range(0, length):
+        word = records[2*step]
+        note = word & 0xff
+        if note != NO_NOTE:
+            velocity = word >> 8
+            if version < 2:
+                velocity = DEFAULT_VELOCITY
+            sequence.set_note(step, note, records[2*step + 1], velocity)
+
+
+def sequence_to_records(sequence, records):
+    for step in range(0, sequence.length):
+        if sequence.has_note(step):
+            records[2*step] = (sequence.note(step) & 0x7f) | \
+                (sequence.velocity(step) << 8)
+            records[2*step + 1] = sequence.lengths[step]
+        else:
+            records[2*step] = NO_NOTE
+            records[2*step + 1] = 0
+
+
+def write_sequence(file_name, sequence, time_div, gate, records=None):
+    """Write a sequence atomically, records are allocated if None or too
+    short"""
+    length = sequence.length
+    if records is None or len(records) < 2*length:
+        records = new_records(length)
+    sequence_to_records(sequence, records)
+    temp_file_name = file_name + ".tmp"
+    sequence_file = open(temp_file_name, "wb")
+    SequenceHeader().write(sequence_file, length, time_div, gate)
+    if len(records) == 2*length:
+        sequence_file.write(records)
+    else:
+        sequence_file.write(memoryview(records)[0:2*length])
+    sequence_file.close()
+    try:
+        # replaces the old file on littlefs
+        os.rename(temp_file_name, file_name)
+    except OSError:
+        # file systems refusing to rename over an existing file
+        os.remove(file_name)
+        os.rename(temp_file_name, file_name)
+
+
+def parse_text_sequence(text):
+    """Sequence dict of the text of a dict as saved in seq_N.csv:
+    {-1: 4, 0: [60, 1], 2: [62, 2]}, integers only"""
+    numbers = []
+    number = 0
+    sign = 1
+    in_number = False
+    for char in text:
+        if '0' <= char <= '9':
+            number = number*10 + ord(char) - 48
+            in_number = True
+        else:
+            if in_number:
+                numbers.append(sign*number)
+            number = 0
+            sign = -1 if char == '-' else 1
+            in_number = False
+    if in_number:
+        numbers.append(sign*number)
+    # the values are a number for LEN_INDEX, [note, length] for the steps
+    notes = {}
+    i = 0
+    while i < len(numbers):
+        if numbers[i] == LEN_INDEX:
+            notes[LEN_INDEX] = numbers[i + 1]
+            i += 2
+        else:
+            notes[numbers[i]] = [numbers[i + 1], numbers[i + 2]]
+            i += 3
+    if LEN_INDEX not in notes:
+        raise ValueError("no sequence length")
+    return notes
+
+
+def notes_to_sequence(notes):
+    """Sequence of a dict of the text files"""
+    sequence = Sequence()
+    sequence.set_length(notes[LEN_INDEX])
+    for step in notes:
+        if 0 <= step < sequence.length:
+            sequence.set_note(step, notes[step][0], notes[step][1])
+    return sequence
+
+
+def migrate_text_sequences(time_div=NOT_SAVED, gate=NOT_SAVED):
+    """Convert the seq_N.csv files of the previous versions, once. Their
+    time division and gate were not saved"""
+    migrated = 0
+    for file_name in os.listdir():
+        if not (file_name.startswith("seq_") and file_name.endswith(".csv")):
+            continue
+        try:
+            sequence_file = open(file_name, "r")
+            text = sequence_file.read()
+            sequence_file.close()
+            sequence = notes_to_sequence(parse_text_sequence(text))
+            write_sequence(file_name[0:-4] + ".seq", sequence, time_div, gate)
+            os.remove(file_name)
+            migrated += 1
+        except (OSError, ValueError, IndexError) as e:
+            print("couldn't migrate", file_name, e)
+    return migrated
+
+
+class SequenceLibrary:
+    """Copies of sequences by sequence number, with the time division and
+    gate of their header. The least recently used are dropped to stay
+    within budget bytes."""
+
+    def __init__(self, budget=LIBRARY_BUDGET):
+        self.budget = budget
+        self.used = 0
+        self.entries = {}  # sequence number: [sequence, time_div, gate]
+        self.order = []  # sequence numbers, the least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def entry_size(self, sequence):
+        return sequence.capacity()*STEP_BYTES + LIBRARY_ENTRY_BYTES
+
+    def get(self, sequence_number, sequence, header):
+        """Copy a kept sequence into sequence and its header fields into
+        header, False if it is not kept"""
+        entry = self.entries.get(sequence_number)
+        if entry is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+        self.order.remove(sequence_number)
+        self.order.append(sequence_number)
+        sequence.copy_from(entry[0])
+        header.length = entry[0].length
+        header.time_div = entry[1]
+        header.gate = entry[2]
+        return True
+
+    def put(self, sequence_number, sequence, time_div, gate):
+        """Keep a copy of sequence"""
+        self.invalidate(sequence_number)
+        kept = Sequence(sequence.length)
+        size = self.entry_size(kept)
+        if size > self.budget:
+            return
+        while self.used + size > self.budget:
+            self.invalidate(self.order[0])
+        kept.copy_from(sequence)
+        self.entries[sequence_number] = [kept, time_div, gate]
+        self.order.append(sequence_number)
+        self.used += size
+
+    def invalidate(self, sequence_number):
+        entry = self.entries.pop(sequence_number, None)
+        if entry is not None:
+            self.order.remove(sequence_number)
+            self.used -= self.entry_size(entry[0])
+
+    def clear(self):
+        self.entries = {}
+        self.order = []
+        self.used = 0
+
+
+class SequenceStore:
+    def __init__(self, write_delay_ms=WRITE_DELAY_MS, library_budget=LIBRARY_BUDGET):
+        self.write_delay_ms = write_delay_ms
+        # only the sequence being recorded is edited, one dirty at a time
+        self.dirty_number = -1
+        self.dirty_sequence = None
+        self.dirty_time_div = 0
+        self.dirty_gate = 0
+        self.last_edit_ms = 0
+        self.writes = 0  # files written, for the statistics
+        # reused by every load
+        self.header = SequenceHeader()
+        self.records = new_records(MAX_PREALLOCATED_STEPS)
+        self.library = SequenceLibrary(library_budget)
+        self.reads = 0  # files read, for the statistics
+
+    def load(self, sequence_number, sequence):
+        """Fill sequence from the library or from its file, the header is
+        left in self.header. A sequence still waiting to be written is
+        written first."""
+        self.flush()
+        if self.library.get(sequence_number, sequence, self.header):
+            return
+        sequence_file = open(sequence_file_name(sequence_number), "rb")
+        try:
+            self.header.read(sequence_file)
+            if self.header.length <= MAX_PREALLOCATED_STEPS:
+                records = self.records
+            else:
+                records = new_records(self.header.length)
+            read_records(sequence_file, self.header.length, records)
+        finally:
+            sequence_file.close()
+        records_to_sequence(records, self.header.length, self.header.version,
+                            sequence)
+        self.reads += 1
+        self.library.put(sequence_number, sequence,
+                         self.header.time_div, self.header.gate)
+
+    def mark_dirty(self, sequence_number, sequence, time_div, gate):
+        """Write sequence later as sequence sequence_number. It is kept by
+        reference, later edits are written too."""
+        if self.dirty_number != -1 and self.dirty_number != sequence_number:
+            self.flush()
+        self.library.invalidate(sequence_number)
+        self.dirty_number = sequence_number
+        self.dirty_sequence = sequence
+        self.dirty_time_div = time_div
+        self.dirty_gate = gate
+        self.last_edit_ms = time.ticks_ms()
+
+    def is_dirty(self):
+        return self.dirty_number != -1
+
+    def poll(self):
+        """Write the dirty sequence if it was not edited for a while"""
+        if self.dirty_number != -1 and \
+                time.ticks_diff(time.ticks_ms(), self.last_edit_ms) >= self.write_delay_ms:
+            self.flush()
+
+    def flush(self):
+        """Write the dirty sequence now, before reading it back or on exit"""
+        if self.dirty_number == -1:
+            return
+        profiling = PROFILER.enabled
+        if profiling:
+            start_us = time.ticks_us()
+        try:
+            write_sequence(sequence_file_name(self.dirty_number), self.dirty_sequence,
+                           self.dirty_time_div, self.dirty_gate, self.records)
+            self.writes += 1
+            if profiling:
+                PROFILER.record(PROF_WRITE, start_us)
+            self.dirty_number = -1
+            self.dirty_sequence = None
+        except OSError as e:
+            # kept dirty, tried again after another delay
+            print("couldn't save sequence n°", self.dirty_number, e)
+            self.last_edit_ms = time.ticks_ms()
@@ -0,0 +1,178 @@
+# Steps of a sequence and notes being played, stored in arrays.
+# A sequence keeps one column per field (note, velocity, flags, length),
+# indexed by step: the timer reads a step with a few array accesses and
+# nothing is allocated while playing. The columns only grow when recording
+# or loading a longer sequence, from the main loop. The timer may interrupt
+# the main loop at any time, so a step is written before the length that
+# makes it visible and grown columns are filled before being swapped in.
+# __slots__ saves the instance dict under CPython, MicroPython ignores it.
+from array import array
+
+STEP_NOTE = 0x01  # flag of a step where a note starts
+STEP_BYTES = 5  # bytes of the columns per step
+DEFAULT_VELOCITY = 127
+# notes of a sequence played at the same time, more are not played
+MAX_PLAYED_NOTES = 16
+
+
+class Sequence:
+    __slots__ = ('length', 'notes', 'velocities', 'flags', 'lengths')
+
+    def __init__(self, capacity=0):
+        self.length = 0  # number of steps
+        self.notes = bytearray(capacity)
+        self.velocities = bytearray(capacity)
+        self.flags = bytearray(capacity)
+        self.lengths = array('H', bytes(2*capacity))  # note lengths in steps
+
+    def capacity(self):
+        return len(self.flags)
+
+    def reserve(self, steps):
+        """Grow the columns to hold steps steps"""
+        capacity = len(self.flags)
+        if steps <= capacity:
+            return
+        new_capacity = max(steps, 2*capacity, 16)
+        notes = bytearray(new_capacity)
+        velocities = bytearray(new_capacity)
+        flags = bytearray(new_capacity)
+        lengths = array('H', bytes(2*new_capacity))
+        for step in range(0, capacity):
+            notes[step] = self.notes[step]
+            velocities[step] = self.velocities[step]
+            flags[step] = self.flags[step]
+            lengths[step] = self.lengths[step]
+        self.notes = notes
+        self.velocities = velocities
+        self.lengths = lengths
+        self.flags = flags
+
+    def clear(self):
+        length = self.length
+        self.length = 0
+        for step in range(0, length):
+            self.flags[step] = 0
+
+    def set_length(self, length):
+        """Length of a sequence being filled, the new steps are empty"""
+        self.reserve(length)
+        for step in range(self.length, length):
+            self.flags[step] = 0
+        self.length = length
+
+    def copy_from(self, other):
+        self.clear()
+        length = other.length
+        self.reserve(length)
+        for step in range(0, length):
+            self.notes[step] = other.notes[step]
+            self.velocities[step] = other.velocities[step]
+            self.lengths[step] = other.lengths[step]
+            self.flags[step] = other.flags[step]
+        self.length = length
+
+    def has_note(self, step):
+        # False past the end, the length is set after the columns grew
+        return step < self.length and self.flags[step] & STEP_NOTE
+
+    def has_notes(self):
+        for step in range(0, self.length):
+            if self.flags[step] & STEP_NOTE:
+                return True
+        return False
+
+    def note(self, step):
+        return self.notes[step]
+
+    def velocity(self, step):
+        return self.velocities[step]
+
+    def note_length(self, step):
+        """Length of the note of a step, at most the sequence length, in case
+        too many steps were removed after it was recorded"""
+        length = self.lengths[step]
+        if length > self.length:
+            return self.length
+        return length
+
+    def set_note(self, step, note, length, velocity=DEFAULT_VELOCITY):
+        self.reserve(step + 1)
+        self.notes[step] = note
+        self.velocities[step] = velocity
+        self.lengths[step] = length
+        self.flags[step] |= STEP_NOTE
+
+    def remove_note(self, step):
+        self.flags[step] &= ~STEP_NOTE
+
+    def append_step(self):
+        """Add an empty step at the end"""
+        self.reserve(self.length + 1)
+        self.flags[self.length] = 0
+        self.length += 1
+
+    def pop_step(self):
+        """Remove the last step and its note"""
+        if self.length > 0:
+            self.length -= 1
+            self.flags[self.length] = 0
+
+    def __eq__(self, other):
+        if self.length != other.length:
+            return False
+        for step in range(0, self.length):
+            if self.flags[step] != other.flags[step]:
+                return False
+            if self.flags[step] & STEP_NOTE and (
+                    self.notes[step] != other.notes[step] or
+                    self.velocities[step] != other.velocities[step] or
+                    self.lengths[step] != other.lengths[step]):
+                return False
+        return True
+
+
+class PlayedNotes:
+    """Notes being played by a sequence with the steps left before their note
+    off, in arrays allocated once"""
+    __slots__ = ('notes', 'steps_left', 'count', 'expired', 'expired_count')
+
+    def __init__(self, capacity=MAX_PLAYED_NOTES):
+        self.notes = bytearray(capacity)
+        self.steps_left = array('H', bytes(2*capacity))
+        self.count = 0
+        # notes whose note off is due after count_down()
+        self.expired = bytearray(capacity)
+        self.expired_count = 0
+
+    def add(self, note, steps):
+        """False when full, the note must not be played"""
+        count = self.count
+        if count == len(self.notes):
+            return False
+        self.notes[count] = note & 0x7f
+        self.steps_left[count] = steps
+        self.count = count + 1
+        return True
+
+    def count_down(self):
+        """A step passed, the notes ending go to expired"""
+        kept = 0
+        expired = 0
+        i = 0
+        while i < self.count:
+            left = self.steps_left[i] - 1
+            if left <= 0:
+                self.expired[expired] = self.notes[i]
+                expired += 1
+            else:
+                self.notes[kept] = self.notes[i]
+                self.steps_left[kept] = left
+                kept += 1
+            i += 1
+        self.count = kept
+        self.expired_count = expired
+
+    def clear(self):
+        self.count = 0
+        self.expired_count = 0
@@ -0,0 +1,108 @@
+# Snapshot of the KeyboardConfiguration values shown on the OLED.
+# The display is drawn by the thread of core 1 while the main loop of core 0
+# changes the configuration (unless core 1 runs the engine, see engine.py),
+# so the widgets do not read the configuration itself but a UiState copied
+# from it by the main loop.
+#
+# UiStates holds three of them. The main loop, the only writer, copies the
+# configuration into a state that is neither the latest nor the one being
+# drawn, then publishes it with a single store of the generation, which
+# holds a publish counter and the index of the latest state. The display
+# announces the state it draws in drawing and checks the generation did
+# not move meanwhile, so the state it draws is never written while it
+# draws. It draws again whenever the generation is not the one it drew
+# last: a change published while it draws is drawn on the next pass
+# instead of being lost.
+from array import array
+
+MULTI_SEQUENCE_CHANNELS = 16
+UI_STATES = 3
+# generation = counter << 2 | index of the state, the counter wraps while
+# the generation is a small int, it is only compared for equality
+GENERATION_INDEX_MASK = 0x03
+GENERATION_COUNTER_MASK = 0x0fffffff
+
+
+class UiState:
+    __slots__ = ('mode', 'rate', 'play_mode', 'show_stats', 'octave_offset',
+                 'time_div', 'change_time_div', 'load_time_div',
+                 'player_note_timer_gate_pertenth', 'changing_gate_length',
+                 'midi_channel', 'midi_change_channel',
+                 'midi_change_channel_channel', 'arp_mode', 'hold',
+                 'transpose_keyboardplay_mode', 'transpose_key',
+                 'seq_number', 'seq_length', 'loading_seq', 'loading_seq_number',
+                 'multi_sequence_index', 'multi_sequence_time_div',
+                 'multi_sequence_highlighted', 'loading_multi_seq',
+                 'loading_multi_seq_number', 'keyboard_play_index')
+
+    def __init__(self):
+        # sequence numbers up to 99 or -1, and time divisions
+        self.multi_sequence_index = array('b', bytes(MULTI_SEQUENCE_CHANNELS))
+        self.multi_sequence_time_div = array('b', bytes(MULTI_SEQUENCE_CHANNELS))
+
+    def capture(self, config):
+        self.mode = config.mode
+        self.rate = config.rate
+        self.play_mode = config.play_mode
+        self.show_stats = config.show_stats
+        self.octave_offset = config.octave_offset
+        self.time_div = config.time_div
+        self.change_time_div = config.change_time_div
+        self.load_time_div = config.load_time_div
+        self.player_note_timer_gate_pertenth = config.player_note_timer_gate_pertenth
+        self.changing_gate_length = config.changing_gate_length
+        self.midi_channel = config.midi_channel
+        self.midi_change_channel = config.midi_change_channel
+        self.midi_change_channel_channel = config.midi_change_channel_channel
+        self.arp_mode = config.arp_mode
+        self.hold = config.hold
+        self.transpose_keyboardplay_mode = config.transpose_keyboardplay_mode
+        self.transpose_key = config.transpose_key
+        self.seq_number = config.seq_number
+        self.seq_length = config.seq_notes.length
+        self.loading_seq = config.loading_seq
+        self.loading_seq_number = config.loading_seq_number
+        for channel in range(0, MULTI_SEQUENCE_CHANNELS):
+            self.multi_sequence_index[channel] = config.multi_sequence_index[channel]
+            self.multi_sequence_time_div[channel] = config.multi_sequence_time_div[channel]
+        self.multi_sequence_highlighted = config.multi_sequence_highlighted
+        self.loading_multi_seq = config.loading_multi_seq
+        self.loading_multi_seq_number = config.loading_multi_seq_number
+        self.keyboard_play_index = config.keyboard_play_index
+
+
+class UiStates:
+    def __init__(self, config):
+        self.states = tuple([UiState() for _ in range(0, UI_STATES)])
+        for state in self.states:
+            state.capture(config)
+        self.generation = 0
+        # index of the state being drawn, -1 when none
+        self.drawing = -1
+
+    # main loop of core 0 only
+    def publish(self, config):
+        latest = self.generation & GENERATION_INDEX_MASK
+        drawing = self.drawing
+        index = 0
+        while index == latest or index == drawing:
+            index += 1
+        self.states[index].capture(config)
+        counter = ((self.generation >> 2) + 1) & GENERATION_COUNTER_MASK
+        # a single store, the state is complete before it is seen
+        self.generation = counter << 2 | index
+
+    # display only
+    def acquire(self):
+        """Generation of the state to draw, kept until the next acquire()"""
+        while True:
+            generation = self.generation
+            self.drawing = generation & GENERATION_INDEX_MASK
+            # a publish before drawing was set may have picked that state,
+            # it moved the generation
+            if self.generation == generation:
+                return generation
+
+    def state(self, generation):
+        """State of a generation returned by acquire()"""
+        return self.states[generation & GENERATION_INDEX_MASK]
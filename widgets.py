@@ -0,0 +1,437 @@
+from keyboardConfiguration import Mode, modeToStr, timeDivToStr, midi_to_key
+
+# Retained widgets of the OLED screen.
+# Each widget owns a rectangle that contains every pixel it draws and returns
+# from state() the KeyboardConfiguration values it depends on. A Layout only
+# redraws the widgets whose state changed, along with the widgets overlapping
+# them, in the same order as a full redraw.
+# The config given to the widgets is the UiState published by the main loop
+# (uistate.py), a copy of the KeyboardConfiguration values shown.
+
+
+class Widget:
+    def __init__(self, x, y, w, h):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.last_state = None
+
+    def intersects(self, other):
+        return (self.x < other.x + other.w and other.x < self.x + self.w and
+                self.y < other.y + other.h and other.y < self.y + self.h)
+
+    def state(self, config):
+        return None
+
+    def draw(self, oled, config):
+        pass
+
+
+class Layout:
+    def __init__(self, widgets):
+        self.widgets = widgets
+        # index of the widgets overlapping each widget
+        self.overlaps = []
+        for i, widget in enumerate(widgets):
+            self.overlaps.append([j for j, other in enumerate(widgets)
+                                  if j != i and widget.intersects(other)])
+        self.dirty = [False]*len(widgets)
+
+    def render(self, oled, config, full=False):
+        """Redraw the widgets that changed, return True if anything was drawn"""
+        widgets = self.widgets
+        if full:
+            oled.fill(oled.black)
+            for widget in widgets:
+                widget.last_state = widget.state(config)
+                widget.draw(oled, config)
+            return True
+
+        dirty = self.dirty
+        to_visit = []
+        for i, widget in enumerate(widgets):
+            state = widget.state(config)
+            dirty[i] = state != widget.last_state
+            if dirty[i]:
+                widget.last_state = state
+                to_visit.append(i)
+        if not to_visit:
+            return False
+
+        while to_visit:
+            for j in self.overlaps[to_visit.pop()]:
+                if not dirty[j]:
+                    dirty[j] = True
+                    to_visit.append(j)
+
+        for i, widget in enumerate(widgets):
+            if dirty[i]:
+                oled.fill_rect(widget.x, widget.y,
+                               widget.w, widget.h, oled.black)
+        for i, widget in enumerate(widgets):
+            if dirty[i]:
+                widget.draw(oled, config)
+        return True
+
+
+class TitleWidget(Widget):
+    def __init__(self, mode):
+        if mode == Mode.MULTISEQUENCER:
+            super().__init__(17, 4, 43, 10)
+        else:
+            super().__init__(17, 1, 44, 17)
+        self.mode = mode
+
+    def draw(self, oled, config):
+        if self.mode == Mode.MULTISEQUENCER:
+            oled.font_writer_arial10.text("Multi-seq", 17, 4)
+        else:
+            oled.font_writer_font10.text(modeToStr(self.mode), 17, 1)
+
+
+class LineWidget(Widget):
+    def __init__(self, x1, y1, x2, y2):
+        super().__init__(min(x1, x2), min(y1, y2),
+                         abs(x2-x1)+1, abs(y2-y1)+1)
+        self.points = (x1, y1, x2, y2)
+
+    def draw(self, oled, config):
+        x1, y1, x2, y2 = self.points
+        oled.line(x1, y1, x2, y2, oled.white)
+
+
+class BpmWidget(Widget):
+    def __init__(self):
+        super().__init__(86, 3, 42, 10)
+
+    def state(self, config):
+        return config.rate
+
+    def draw(self, oled, config):
+        bpm_txt = str(config.rate)+"bpm"
+        oled.font_writer_arial10.text(bpm_txt, (128-(7*len(bpm_txt))), 3, cache=False)
+
+
+class PlayModeWidget(Widget):
+    def __init__(self):
+        super().__init__(0, 0, 15, 15)
+
+    def state(self, config):
+        return config.play_mode
+
+    def draw(self, oled, config):
+        oled.rect(0, 0, 15, 15, oled.white)
+        oled.blit(oled.fbufs_play_mode[config.play_mode], 3, 3)
+
+
+class GateWidget(Widget):
+    def __init__(self):
+        super().__init__(61, 0, 23, 15)
+
+    def state(self, config):
+        return (config.player_note_timer_gate_pertenth,
+                config.changing_gate_length)
+
+    def draw(self, oled, config):
+        # gate lenght picto
+        start_line = 62
+        gate_up = 3
+        gate_low = 13
+        gate_lenght = config.player_note_timer_gate_pertenth
+        gate_off = 10 - gate_lenght
+
+        if config.changing_gate_length:
+            oled.fill_rect(start_line-1, 0, 23, 15, oled.white)
+            color = oled.black
+        else:
+            color = oled.white
+        oled.line(start_line, gate_low, start_line + 2, gate_low, color)
+        oled.line(start_line+2, gate_low, start_line+2, gate_up, color)
+        oled.line(start_line+2, gate_up, start_line +
+                  2*gate_lenght, gate_up, color)
+        oled.line(start_line+2*gate_lenght, gate_up,
+                  start_line+2*gate_lenght, gate_low, color)
+        oled.line(start_line+2*gate_lenght, 13, start_line +
+                  2*gate_lenght+2*(gate_off), 13, color)
+
+
+class FooterWidget(Widget):
+    """Bottom block with the first key and the time division"""
+
+    def __init__(self):
+        super().__init__(0, 50, 128, 14)
+
+    def time_div(self, config):
+        if config.mode == Mode.MULTISEQUENCER:
+            return config.multi_sequence_time_div[config.multi_sequence_highlighted]
+        return config.time_div
+
+    def state(self, config):
+        return (config.octave_offset, config.change_time_div,
+                config.load_time_div, self.time_div(config))
+
+    def draw(self, oled, config):
+        oled.fill_rect(0, 50, 128, 64, oled.white)
+        key_str = "Key:C"+str(config.octave_offset+4)
+        oled.font_writer_arial10.text(key_str, 2, 53, True)
+        time_div_x = 39
+        time_div_y = 51
+
+        if config.change_time_div == True:
+            oled.fill_rect(time_div_x, time_div_y, 76, 12, oled.black)
+            time_div_str = "TimeDiv : " + timeDivToStr(config.load_time_div)
+            oled.font_writer_arial10.text(
+                time_div_str, time_div_x+2, time_div_y+2)
+        else:
+            time_div_str = "TimeDiv : "+timeDivToStr(self.time_div(config))
+            oled.font_writer_arial10.text(
+                time_div_str, time_div_x+2, time_div_y+2, True)
+
+
+class BasicKeyWidget(Widget):
+    def __init__(self):
+        super().__init__(5, 22, 60, 14)
+
+    def state(self, config):
+        return config.octave_offset
+
+    def draw(self, oled, config):
+        key_str = "Key : C"+str(config.octave_offset+4)
+        oled.font_writer_font6.text(key_str, 5, 22)
+
+
+class BasicTimeDivWidget(Widget):
+    def __init__(self):
+        super().__init__(3, 42, 101, 16)
+
+    def state(self, config):
+        return (config.change_time_div, config.load_time_div, config.time_div)
+
+    def draw(self, oled, config):
+        time_div_x = 3
+        time_div_y = 42
+        if config.change_time_div == True:
+            oled.fill_rect(time_div_x, time_div_y, 101, 16, oled.white)
+            time_div_str = "TimeDiv : " + timeDivToStr(config.load_time_div)
+            oled.font_writer_font6.text(
+                time_div_str, time_div_x+2, time_div_y+2, True)
+        else:
+            time_div_str = "TimeDiv : " + timeDivToStr(config.time_div)
+            oled.font_writer_font6.text(
+                time_div_str, time_div_x+2, time_div_y+2, False)
+
+
+class ChannelWidget(Widget):
+    def __init__(self):
+        super().__init__(96, 16, 31, 12)
+
+    def state(self, config):
+        return (config.midi_change_channel, config.midi_change_channel_channel,
+                config.midi_channel)
+
+    def draw(self, oled, config):
+        midi_ch_x = 96
+        midi_ch_y = 16
+        if config.midi_change_channel == True:
+            midi_channel_txt = 'Ch {:02d}'.format(
+                config.midi_change_channel_channel).replace("0", "_")
+            oled.font_writer_arial10.text(
+                midi_channel_txt, midi_ch_x+2, midi_ch_y+2)
+            oled.rect(midi_ch_x, midi_ch_y, 31, 12, oled.white)
+        else:
+            oled.fill_rect(midi_ch_x, midi_ch_y, 31, 12, oled.white)
+            midi_channel_txt = 'Ch {:02d}'.format(config.midi_channel)
+            oled.font_writer_arial10.text(
+                midi_channel_txt, midi_ch_x+2, midi_ch_y+2, True)
+
+
+class TransposeModeWidget(Widget):
+    def __init__(self):
+        super().__init__(86, 17, 41, 22)
+
+    def state(self, config):
+        return config.transpose_keyboardplay_mode
+
+    def draw(self, oled, config):
+        # true = transpose, false = keyboardplay
+        if config.transpose_keyboardplay_mode == True:
+            oled.fill_rect(86, 17, 40, 10, oled.white)
+            oled.font_writer_arial10.text("transpo.", 87, 17, True)
+            oled.font_writer_arial10.text("kb play", 87, 29)
+        else:
+            oled.fill_rect(86, 29, 40, 10, oled.white)
+            oled.font_writer_arial10.text("transpo.", 87, 17)
+            oled.font_writer_arial10.text("kb play", 87, 29, True)
+
+
+class TransposeKeyWidget(Widget):
+    def __init__(self):
+        super().__init__(87, 41, 41, 10)
+
+    def state(self, config):
+        return config.transpose_key
+
+    def draw(self, oled, config):
+        oled.font_writer_arial10.text(
+            "key:"+midi_to_key(config.transpose_key), 87, 41)
+
+
+class SeqNumberWidget(Widget):
+    def __init__(self):
+        super().__init__(3, 17, 66, 16)
+
+    def state(self, config):
+        return (config.loading_seq, config.loading_seq_number, config.seq_number)
+
+    def draw(self, oled, config):
+        seq_n_x = 3
+        seq_n_y = 17
+        if config.loading_seq:
+            seq_number_str = 'Seq n  {:02d}'.format(
+                config.loading_seq_number).replace("0", "_")
+            oled.fill_rect(seq_n_x, seq_n_y, 66, 16, oled.white)
+            oled.font_writer_font6.text(
+                seq_number_str, seq_n_x+2, seq_n_y+2, True)
+            oled.font_writer_arial10.text("o", seq_n_x+38, seq_n_y, True)
+        else:
+            seq_number_str = 'Seq n  {:02d}'.format(config.seq_number)
+            oled.font_writer_font6.text(seq_number_str, seq_n_x+2, seq_n_y+2)
+            oled.font_writer_arial10.text("o", seq_n_x+38, seq_n_y)
+
+
+class SeqLenWidget(Widget):
+    def __init__(self):
+        super().__init__(5, 35, 61, 14)
+
+    def state(self, config):
+        return config.seq_length
+
+    def draw(self, oled, config):
+        oled.font_writer_font6.text(
+            "{:03d} steps".format(config.seq_length), 5, 35, cache=False)
+
+
+class ArpModeWidget(Widget):
+    """One tile of the arpegiator mode icon strip"""
+
+    def __init__(self, arp_mode):
+        super().__init__(arp_mode*16, 34, 16, 16)
+        self.arp_mode = arp_mode
+
+    def state(self, config):
+        return config.arp_mode == self.arp_mode
+
+    def draw(self, oled, config):
+        i = self.arp_mode
+        if config.arp_mode == i:
+            oled.fill_rect(0+i*16, 34, 16, 16, oled.white)
+            oled.blit(oled.fbufs_inv_arp_modes[i], 0+i*16, 34)
+        else:
+            oled.blit(oled.fbufs_arp_modes[i], 0+i*16, 34)
+            oled.rect(0+i*16, 34, 16, 16, oled.white)
+
+
+class HoldWidget(Widget):
+    def __init__(self):
+        super().__init__(114, 51, 12, 12)
+
+    def state(self, config):
+        return config.hold
+
+    def draw(self, oled, config):
+        if config.hold:
+            oled.rect(114, 51, 12, 12, oled.black)
+            oled.text("H", 116, 53, oled.black)
+        else:
+            oled.fill_rect(114, 51, 12, 12, oled.black)
+            oled.text("H", 116, 53, oled.white)
+
+
+class MultiSeqCellWidget(Widget):
+    """One of the 16 multi sequencer tiles"""
+
+    def __init__(self, index):
+        self.index = index
+        self.cell_x = index % 8
+        self.cell_y = index // 8
+        super().__init__(self.cell_x*16, 17+16*self.cell_y, 16, 16)
+
+    def state(self, config):
+        index = self.index
+        highlighted = index == config.multi_sequence_highlighted
+        loading_number = None
+        if highlighted and config.loading_multi_seq == True:
+            loading_number = config.loading_multi_seq_number
+        return (highlighted, loading_number, config.multi_sequence_index[index],
+                index == config.keyboard_play_index)
+
+    def draw(self, oled, config):
+        index = self.index
+        x = self.cell_x
+        y = self.cell_y
+        if index == config.multi_sequence_highlighted:
+            oled.fill_rect(0+x*16, 17+16*y, 16, 16, oled.white)
+            oled.rect(0+x*16, 17+16*y, 16, 16, oled.black)
+            if config.loading_multi_seq == True:
+                if config.loading_multi_seq_number == -1:
+                    index_str = "__"
+                elif config.loading_multi_seq_number == 0:
+                    index_str = "_0"
+                else:
+                    index_str = '{:02d}'.format(
+                        config.loading_multi_seq_number).replace("0", "_")
+                oled.font_writer_arial8.text(index_str, 4+x*16, 23+16*y, True)
+            else:
+                if config.multi_sequence_index[index] == -1:
+                    index_str = '{:02d}'.format(index+1)
+                    oled.font_writer_arial8.text(
+                        index_str, 2+x*16, 19+16*y, True)
+                else:
+                    index_str = '{:02d}'.format(
+                        config.multi_sequence_index[index])
+                    oled.font_writer_arial10.text(
+                        index_str, 2+x*16, 21+16*y, True)
+        else:
+            oled.rect(0+x*16, 17+16*y, 16, 16, oled.white)
+
+            if config.multi_sequence_index[index] == -1:
+                index_str = '{:02d}'.format(index+1)
+                oled.font_writer_arial8.text(index_str, 2+x*16, 19+16*y)
+            else:
+                index_str = '{:02d}'.format(config.multi_sequence_index[index])
+                oled.font_writer_arial10.text(index_str, 2+x*16, 21+16*y)
+
+        if index == config.keyboard_play_index:
+            if index == config.multi_sequence_highlighted:
+                oled.font_writer_arial6.text("K", 11+x*16, 27+16*y, True)
+            else:
+                oled.font_writer_arial6.text("K", 11+x*16, 27+16*y, False)
+
+
+def _header(mode):
+    return [TitleWidget(mode), BpmWidget(), PlayModeWidget(),
+            LineWidget(0, 15, 127, 15)]
+
+
+def create_layouts():
+    """Return the layout of each mode, indexed by Mode"""
+    basic = _header(Mode.BASIC) + [BasicKeyWidget(), BasicTimeDivWidget(),
+                                   ChannelWidget()]
+    arpegiator = _header(Mode.ARPEGIATOR) + [GateWidget(), FooterWidget()] + \
+        [ArpModeWidget(i) for i in range(0, 8)] + [HoldWidget()]
+    sequencer = _header(Mode.SEQUENCER) + [LineWidget(84, 15, 84, 50),
+                                           LineWidget(84, 40, 127, 40),
+                                           TransposeModeWidget(),
+                                           TransposeKeyWidget(),
+                                           GateWidget(), FooterWidget(),
+                                           SeqNumberWidget(), SeqLenWidget()]
+    multi_sequencer = _header(Mode.MULTISEQUENCER) + [GateWidget(), FooterWidget()] + \
+        [MultiSeqCellWidget(i) for i in range(0, 16)]
+
+    layouts = [None]*4
+    layouts[Mode.BASIC] = Layout(basic)
+    layouts[Mode.ARPEGIATOR] = Layout(arpegiator)
+    layouts[Mode.SEQUENCER] = Layout(sequencer)
+    layouts[Mode.MULTISEQUENCER] = Layout(multi_sequencer)
+    return layouts
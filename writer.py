@@ -1,11 +1,49 @@
 import framebuf
 
 
+class GlyphCache():
+    """Bounded LRU cache of ready to blit FrameBuffers"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.clock += 1
+        entry[1] = self.clock
+        return entry[0]
+
+    def put(self, key, value):
+        entries = self.entries
+        if len(entries) >= self.max_entries:
+            # least recently used
+            oldest_key = None
+            oldest = 0
+            for entry_key in entries:
+                used = entries[entry_key][1]
+                if oldest_key is None or used < oldest:
+                    oldest_key = entry_key
+                    oldest = used
+            del entries[oldest_key]
+        self.clock += 1
+        entries[key] = [value, self.clock]
+
+
 class Writer():
     text_row = 0        # attributes common to all Writer instances
     text_col = 0
     row_clip = False    # Clip or scroll when screen full
     col_clip = False    # Clip or new line when row is full
+    glyph_cache_size = 48   # glyphs kept per Writer and per invert state
+    string_cache_size = 24  # whole strings kept per Writer and per invert state
 
     @classmethod
     def set_textpos(cls, col, row):
@@ -17,9 +55,17 @@ class Writer():
         cls.row_clip = row_clip
         cls.col_clip = col_clip
 
-    def __init__(self, device, font, verbose=True):
+    def __init__(self, device, font, verbose=True, cache_strings=True):
         self.device = device
         self.font = font
+        # caches are indexed by invert, keyed by char or string so that a
+        # cache hit does not allocate
+        self.glyph_cache = (GlyphCache(Writer.glyph_cache_size),
+                            GlyphCache(Writer.glyph_cache_size))
+        self.string_cache = None
+        if cache_strings:
+            self.string_cache = (GlyphCache(Writer.string_cache_size),
+                                 GlyphCache(Writer.string_cache_size))
         # Allow to work with any font mapping
         if font.hmap():
             self.map = framebuf.MONO_HMSB if font.reverse() \
@@ -32,9 +78,11 @@ class Writer():
         self.screenwidth = device.width  # In pixels
         self.screenheight = device.height
 
-    def text(self, txt, x, y, invert=False):
+    # cache=False for a value that keeps changing (bpm, counters...), it
+    # would only push the labels out of the string cache
+    def text(self, txt, x, y, invert=False, cache=True):
         self.set_textpos(x, y)
-        self.printstring(txt, invert)
+        self.printstring(txt, invert, cache)
 
     def _newline(self):
         height = self.font.height()
@@ -46,17 +94,70 @@ class Writer():
                 self.device.scroll(0, margin)
                 Writer.text_row += margin
 
-    def printstring(self, string, invert=False):
+    def printstring(self, string, invert=False, cache=True):
+        if cache and self.string_cache is not None and string and '\n' not in string:
+            cache = self.string_cache[1 if invert else 0]
+            entry = cache.get(string)
+            if entry is None:
+                width = self.stringlen(string)
+                if width > 0 and self._fits(width):
+                    entry = (self._render_string(string, width, invert), width)
+                    cache.put(string, entry)
+            if entry is not None and self._fits(entry[1]):
+                self.device.blit(entry[0], Writer.text_col, Writer.text_row)
+                Writer.text_col += entry[1]
+                return
         for char in string:
             self._printchar(char, invert)
 
+    def _fits(self, width):
+        return (Writer.text_col + width <= self.screenwidth and
+                Writer.text_row + self.font.height() <= self.screenheight)
+
+    def _render_string(self, string, width, invert):
+        height = self.font.height()
+        buf = bytearray(((width - 1)//8 + 1) * height)
+        fbs = framebuf.FrameBuffer(buf, width, height, self.map)
+        x = 0
+        for char in string:
+            fbc, _, char_width = self._glyph(char, invert)
+            fbs.blit(fbc, x, 0)
+            x += char_width
+        return fbs
+
+    def _glyph(self, char, invert):
+        cache = self.glyph_cache[1 if invert else 0]
+        entry = cache.get(char)
+        if entry is None:
+            glyph, char_height, char_width = self.font.get_ch(char)
+            buf = bytearray(glyph)
+            if invert:
+                for i, v in enumerate(buf):
+                    buf[i] = 0xFF & ~ v
+            fbc = framebuf.FrameBuffer(buf, char_width, char_height, self.map)
+            entry = (fbc, char_height, char_width)
+            cache.put(char, entry)
+        return entry
+
+    def cache_stats(self):
+        """Return glyph hits, glyph misses, string hits and string misses"""
+        stats = [0, 0, 0, 0]
+        for cache in self.glyph_cache:
+            stats[0] += cache.hits
+            stats[1] += cache.misses
+        if self.string_cache is not None:
+            for cache in self.string_cache:
+                stats[2] += cache.hits
+                stats[3] += cache.misses
+        return stats
+
     # Method using blitting. Efficient rendering for monochrome displays.
     # Tested on SSD1306. Invert is for black-on-white rendering.
     def _printchar(self, char, invert=False):
         if char == '\n':
             self._newline()
             return
-        glyph, char_height, char_width = self.font.get_ch(char)
+        fbc, char_height, char_width = self._glyph(char, invert)
         if Writer.text_row + char_height > self.screenheight:
             if Writer.row_clip:
                 return
@@ -66,11 +167,6 @@ class Writer():
                 return
             else:
                 self._newline()
-        buf = bytearray(glyph)
-        if invert:
-            for i, v in enumerate(buf):
-                buf[i] = 0xFF & ~ v
-        fbc = framebuf.FrameBuffer(buf, char_width, char_height, self.map)
         self.device.blit(fbc, Writer.text_col, Writer.text_row)
         Writer.text_col += char_width
 